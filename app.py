@@ -3,15 +3,20 @@ import threading
 import time
 import socket
 import logging
+import ipaddress
 from datetime import datetime, timedelta
-from flask import Flask, render_template_string, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import bcrypt
-from pythonping import ping as py_ping
+from jinja2 import ChoiceLoader, DictLoader
+from core.job_mgr import JobManager
+from core.login_guard import LoginGuard
+from network.probe_engine import ProbeEngine
+from web_ui.assets import Assets
 
 # --- CONFIGURATION ---
-app = Flask(__name__)
+app = Flask(__name__, static_folder='web_ui/static', static_url_path='/static')
 app.config['SECRET_KEY'] = 'jarvis-top-secret-key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rtm_single.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -24,7 +29,6 @@ login_manager.login_view = 'login'
 # Professional Dark Theme (No external file needed)
 Professional_CSS = """
 <style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600&display=swap');
 :root {
     --bg-dark: #0f172a;
     --bg-card: #1e293b;
@@ -34,7 +38,7 @@ Professional_CSS = """
     --success: #10b981;
     --danger: #ef4444;
 }
-* { margin:0; padding:0; box-sizing:border-box; font-family: 'Inter', sans-serif; }
+* { margin:0; padding:0; box-sizing:border-box; font-family: 'Inter', 'Segoe UI', system-ui, sans-serif; }
 body { background: var(--bg-dark); color: var(--text-main); height: 100vh; display: flex; overflow: hidden; }
 
 /* Sidebar */
@@ -74,7 +78,7 @@ td { padding: 15px; border-bottom: 1px solid #334155; vertical-align: middle; }
 .login-wrap { height: 100vh; display: flex; align-items: center; justify-content: center; background: radial-gradient(circle, #1e293b 0%, #0f172a 100%); }
 .login-box { width: 400px; padding: 40px; background: rgba(30, 41, 59, 0.8); border-radius: 16px; border: 1px solid #334155; backdrop-filter: blur(10px); }
 </style>
-<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
+<link rel="stylesheet" href="{{ asset('fontawesome.css') }}">
 """
 
 
@@ -158,8 +162,24 @@ TPL_DASHBOARD = """
 {% block content %}
 <div class="header">
     <div class="page-title">Network Overview</div>
-    <a href="/scan_now" class="btn">Force Scan <i class="fas fa-sync"></i></a>
+    <div>
+        <span id="scanStatus" style="color:var(--text-muted); margin-right:10px;"></span>
+        <a href="/scan_now?scope=down" class="btn btn-danger">Rescan DOWN</a>
+        <a href="/scan_now" class="btn">Force Scan <i class="fas fa-sync"></i></a>
+    </div>
 </div>
+{% if scan_job %}
+<script>
+    // Poll the background scan and refresh once it finishes
+    (function poll() {
+        fetch('/api/scan/{{ scan_job }}').then(r => r.json()).then(j => {
+            document.getElementById('scanStatus').innerText = 'Scan ' + j.status + ' ' + j.done + '/' + j.total;
+            if (j.status === 'done' || j.status === 'failed') { setTimeout(() => location.href = '/dashboard', 800); }
+            else setTimeout(poll, 1000);
+        });
+    })();
+</script>
+{% endif %}
 
 <div class="grid">
     <div class="card">
@@ -240,12 +260,22 @@ def login():
     if request.method == 'POST':
         u = request.form['username']
         p = request.form['password']
+        ip = request.remote_addr or '?'
+        allowed, retry_after = LoginGuard.allow(ip, u)
+        if not allowed:
+            flash(f"Too many attempts, retry in {retry_after}s")
+            return render_template('login'), 429, {'Retry-After': str(retry_after)}
         user = User.query.filter_by(username=u).first()
-        if user and user.check_password(p):
+        ok = LoginGuard.check_password(user, p) if user else False
+        if ok is None:
+            flash("Server busy, please retry")
+            return render_template('login'), 503, {'Retry-After': '5'}
+        LoginGuard.record(ip, u, ok)
+        if ok:
             login_user(user)
             return redirect(url_for('dashboard'))
         flash("Access Denied: Invalid Credentials")
-    return render_template_string(TPL_LOGIN)
+    return render_template('login')
 
 
 @app.route('/logout')
@@ -261,7 +291,8 @@ def dashboard():
     up = Device.query.filter_by(status='UP').count()
     down = Device.query.filter_by(status='DOWN').count()
     # We pass the strings into a render function that supports inheritance via dict
-    return render_template_string(TPL_DASHBOARD, total=len(devices), up=up, down=down, devices=devices)
+    return render_template('dashboard', total=len(devices), up=up, down=down, devices=devices,
+                                  scan_job=request.args.get('scan_job'))
 
 
 @app.route('/devices', methods=['GET', 'POST'])
@@ -276,7 +307,7 @@ def devices():
             flash("Device Added Successfully")
         else:
             flash("Error: IP Already Exists")
-    return render_template_string(TPL_DEVICES)
+    return render_template('devices')
 
 
 @app.route('/delete/<int:id>')
@@ -292,45 +323,85 @@ def delete_device(id):
 @app.route('/scan_now')
 @login_required
 def scan_now():
-    # Manual Trigger
-    ping_job()
-    return redirect(url_for('dashboard'))
-
+    # Manual Trigger -> background job (concurrent probes, duplicate clicks share one job)
+    # ?scope=all|down|subnet  (&subnet=10.0.0.0/24)
+    scope = request.args.get('scope', 'all')
+    value = None
+    if scope == 'subnet':
+        try:
+            value = str(ipaddress.ip_network(request.args.get('subnet', ''), strict=False))
+        except ValueError:
+            flash("Invalid subnet")
+            return redirect(url_for('dashboard'))
+    elif scope not in ('all', 'down'):
+        scope = 'all'
 
-# --- TEMPLATE INHERITANCE HACK ---
-# This allows using {% extends "base" %} with strings
-@app.context_processor
-def inject_base():
-    return dict(base=TPL_BASE)
+    job, created = JobManager.submit('scan', (scope, value), lambda job: ping_job(scope, value, job))
+    flash("Scan started" if created else "Scan already running")
+    return redirect(url_for('dashboard', scan_job=job.id))
 
 
-def get_template_source(template_name):
-    if template_name == 'base': return TPL_BASE
-    return None
+@app.route('/api/scan/<job_id>')
+@login_required
+def scan_status(job_id):
+    job = JobManager.get(job_id)
+    if not job: return jsonify({'error': 'not found'}), 404
+    return jsonify(job.to_dict())
 
 
-app.jinja_loader.get_source = lambda env, template: (get_template_source(template), None, lambda: True)
+# --- EMBEDDED TEMPLATES ---
+# Served by name through a DictLoader, so Jinja compiles each one once and caches it
+# (render_template_string recompiled the whole page on every request); {% extends "base" %} works as-is
+app.jinja_loader = ChoiceLoader([DictLoader({'base': TPL_BASE, 'login': TPL_LOGIN, 'dashboard': TPL_DASHBOARD,
+                                             'devices': TPL_DEVICES}), app.jinja_loader])
+Assets(app.static_folder).init_app(app)
 
 
 # --- BACKGROUND PINGER ---
-def ping_job():
+engine = ProbeEngine()
+
+
+def ping_job(scope='all', value=None, job=None):
     with app.app_context():
         devices = Device.query.all()
+        if scope == 'down':
+            devices = [d for d in devices if d.status == 'DOWN']
+        elif scope == 'subnet':
+            net = ipaddress.ip_network(value)
+            devices = [d for d in devices if _in_subnet(d.ip, net)]
         print(f"--- Scanning {len(devices)} Devices ---")
-        for d in devices:
-            try:
-                # Ping with 1 second timeout
-                resp = py_ping(d.ip, count=1, timeout=1)
-                new_status = "UP" if resp.success() else "DOWN"
-            except:
-                new_status = "DOWN"
 
+        done = [0]
+
+        def _progress(r):
+            done[0] += 1
+            if job: job.progress(done=done[0])
+
+        if job: job.progress(done=0, total=len(devices))
+        # Ping with 1 second timeout, all devices concurrently
+        results = engine.sweep([(d.id, d.ip) for d in devices], 1, on_result=_progress)
+
+        by_id = {d.id: d for d in devices}
+        changed = False
+        for r in results:
+            d = by_id[r['id']]
+            new_status = "UP" if r['ok'] else "DOWN"
             if d.status != new_status:
                 print(f"ALERT: {d.name} is now {new_status}")
                 # Here you can add Beep sound logic later
                 d.status = new_status
                 d.last_seen = datetime.utcnow()
-                db.session.commit()
+                changed = True
+        if changed:
+            db.session.commit()
+
+
+def _in_subnet(ip, net):
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return addr.version == net.version and addr in net
 
 
 def background_worker():
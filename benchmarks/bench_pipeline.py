@@ -0,0 +1,216 @@
+"""
+Polling pipeline benchmark.
+
+Drives the real PingWorker state machine, SQLAlchemy write path and
+Flask-SocketIO emit path against a simulated fleet and prints one JSON
+document per run, so results can be diffed between versions:
+
+    python -m benchmarks.bench_pipeline --devices 10000 --scenario outage --out new.json
+    python -m benchmarks.bench_pipeline --devices 10000 --scenario outage --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from flask import Flask
+from flask_socketio import SocketIO
+from sqlalchemy import event
+
+from benchmarks.fleet_sim import FleetSimulator
+from core.database import db, Device, Setting
+from core.event_bus import EventBus
+from core.live_hub import LiveHub
+from network.pinger import PingWorker
+from network.probe_engine import ProbeEngine
+
+
+class EmitCounter:
+    """Wraps SocketIO.emit to count frames and payload bytes (the real emit still runs; acks are instant)."""
+
+    def __init__(self, socketio):
+        self.frames = 0
+        self.bytes = 0
+        self.by_event = {}
+        self._emit = socketio.emit
+        socketio.emit = self.emit
+
+    def emit(self, event_name, data=None, **kw):
+        self.frames += 1
+        self.bytes += len(json.dumps(data, default=str))
+        self.by_event[event_name] = self.by_event.get(event_name, 0) + 1
+        ack = kw.pop('callback', None)
+        result = self._emit(event_name, data, **kw)
+        if ack: ack()
+        return result
+
+
+class CommitTimer:
+    """Times every session commit (flush + COMMIT) via SQLAlchemy session events."""
+
+    def __init__(self):
+        self.samples = []
+        self._t0 = None
+        event.listen(db.session, 'before_commit', self._before)
+        event.listen(db.session, 'after_commit', self._after)
+
+    def _before(self, session):
+        self._t0 = time.perf_counter()
+
+    def _after(self, session):
+        if self._t0 is not None:
+            self.samples.append((time.perf_counter() - self._t0) * 1000)
+            self._t0 = None
+
+
+def _pct(values, p):
+    if not values: return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 3)
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def build_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'bench'
+    db.init_app(app)
+    return app
+
+
+def seed_devices(count):
+    ips = [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(1, count + 1)]
+    db.session.bulk_insert_mappings(Device, [
+        {'ip': ip, 'name': f"sim-{n}", 'device_type': 'SWITCH', 'state': 'UP',
+         'is_paused': False, 'is_stopped': False}
+        for n, ip in enumerate(ips)
+    ])
+    db.session.commit()
+    return ips
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="rtm_bench_")
+    app = build_app(os.path.join(tmp, "bench.sqlite3"))
+    socketio = SocketIO(app, async_mode="threading")
+    emits = EmitCounter(socketio)
+    LiveHub.init_app(socketio)
+    clients = [f"bench-{i}" for i in range(args.clients)]
+    for sid in clients:
+        LiveHub.connect(sid)
+        LiveHub.subscribe(sid, [args.view])
+
+    tracemalloc.start()
+    with app.app_context():
+        db.create_all()
+        ips = seed_devices(args.devices)
+        Setting.set("probe_train_count", args.train)
+        sim = FleetSimulator(ips, scenario=args.scenario, seed=args.seed, time_scale=args.time_scale)
+        worker = PingWorker(app, socketio, engine=ProbeEngine(concurrency=args.concurrency, probe=sim.probe))
+        commits = CommitTimer()
+        worker._start_consumers()
+
+        cycles = []
+        for _ in range(args.cycles):
+            sim.next_cycle()
+            probes_before = sim.probes
+            t0 = time.perf_counter()
+            worker._cycle()
+            dt = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            EventBus.drain(timeout=60)  # Consumers catch up before the next cycle (measured separately)
+            LiveHub.drain(timeout=60)
+            cycles.append({'duration_s': round(dt, 4), 'bus_drain_s': round(time.perf_counter() - t0, 4),
+                           'probes': sim.probes - probes_before})
+            db.session.expire_all()
+        EventBus.stop()
+        for sid in clients: LiveHub.disconnect(sid)
+        worker.engine.close()
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations = [c['duration_s'] for c in cycles]
+    total_probes = sum(c['probes'] for c in cycles)
+    return {
+        'benchmark': 'pipeline',
+        'version': _git_rev(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'devices': args.devices, 'cycles': args.cycles, 'scenario': args.scenario,
+                   'concurrency': args.concurrency, 'train': args.train, 'time_scale': args.time_scale, 'seed': args.seed,
+                   'clients': args.clients, 'view': args.view},
+        'cycle_duration_s': {'mean': round(statistics.mean(durations), 4), 'p50': _pct(durations, 50),
+                             'p95': _pct(durations, 95), 'max': round(max(durations), 4)},
+        'probes_per_sec': round(total_probes / sum(durations), 1) if sum(durations) else 0,
+        'commit_latency_ms': {'count': len(commits.samples), 'p50': _pct(commits.samples, 50),
+                              'p95': _pct(commits.samples, 95), 'p99': _pct(commits.samples, 99)},
+        'emitted': {'frames': emits.frames, 'bytes': emits.bytes, 'by_event': emits.by_event},
+        'memory': {'py_peak_mb': round(peak / 1024 / 1024, 2)},
+        'cycles': cycles,
+    }
+
+
+# Lower is better for all of these
+COMPARE_KEYS = [('cycle_duration_s', 'p50'), ('cycle_duration_s', 'p95'), ('commit_latency_ms', 'p95'),
+                ('emitted', 'frames'), ('memory', 'py_peak_mb')]
+
+
+def compare(old, new, tolerance):
+    """Prints relative changes and returns True when any metric regressed beyond `tolerance`."""
+    regressed = False
+    rows = [('probes_per_sec', None, old.get('probes_per_sec', 0), new.get('probes_per_sec', 0), True)]
+    rows += [(a, b, old.get(a, {}).get(b, 0), new.get(a, {}).get(b, 0), False) for a, b in COMPARE_KEYS]
+    for a, b, o, n, higher_better in rows:
+        change = (n - o) / o if o else 0.0
+        bad = change < -tolerance if higher_better else change > tolerance
+        regressed |= bad
+        name = f"{a}.{b}" if b else a
+        print(f"{'REGRESSION' if bad else 'ok':>10}  {name:<24} {o:>12} -> {n:<12} ({change:+.1%})", file=sys.stderr)
+    return regressed
+
+
+def main():
+    p = argparse.ArgumentParser(description="RTM polling pipeline benchmark (simulated fleet)")
+    p.add_argument('--devices', type=int, default=1000)
+    p.add_argument('--cycles', type=int, default=5)
+    p.add_argument('--scenario', choices=FleetSimulator.SCENARIOS, default='steady')
+    p.add_argument('--concurrency', type=int, default=ProbeEngine.DEFAULT_CONCURRENCY)
+    p.add_argument('--train', type=int, default=1, help="Echoes per device per poll (probe train mode)")
+    p.add_argument('--time-scale', type=float, default=0.0,
+                   help="Sleep simulated RTT x scale per probe (0 = measure pipeline overhead only)")
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--clients', type=int, default=1, help="Simulated browser tabs (instant acks)")
+    p.add_argument('--view', default='all', help="Live view each client subscribes to, e.g. all, site:1, group:router")
+    p.add_argument('--out', help="Write JSON result to this file (default: stdout)")
+    p.add_argument('--compare', help="Previous JSON result to compare against")
+    p.add_argument('--tolerance', type=float, default=0.10)
+    args = p.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f: f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f: old = json.load(f)
+        sys.exit(1 if compare(old, result, args.tolerance) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import random
+import threading
+import time
+
+
+class FleetSimulator:
+    """
+    Fake probe backend for a synthetic fleet (no real network).
+    Plugs into ProbeEngine(probe=sim.probe) so the real engine, DB layer
+    and emit path are exercised end to end.
+
+    Scenarios:
+      steady   - every device up, log-normal latency
+      lossy    - `loss` fraction of probes fail at random
+      flapping - `flap_ratio` of devices toggle state every `flap_every` cycles
+      outage   - `outage_ratio` of devices go down for cycles [outage_start, outage_end)
+    """
+    SCENARIOS = ('steady', 'lossy', 'flapping', 'outage')
+
+    def __init__(self, devices, scenario='steady', seed=42, base_rtt_ms=2.0, loss=0.05,
+                 flap_ratio=0.05, flap_every=2, outage_ratio=0.3, outage_start=2, outage_end=4,
+                 time_scale=0.0):
+        if scenario not in self.SCENARIOS:
+            raise ValueError(f"Unknown scenario '{scenario}' (choose from {', '.join(self.SCENARIOS)})")
+        self.scenario = scenario
+        self.loss = loss
+        self.flap_every = max(1, flap_every)
+        self.outage_start, self.outage_end = outage_start, outage_end
+        self.time_scale = time_scale  # >0: really sleep rtt * time_scale to mimic waiting on the wire
+        self.cycle = 0
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+        # Per-device profile: (median rtt, flaps?, in outage group?)
+        self.profile = {}
+        for ip in devices:
+            self.profile[ip] = (
+                self._rng.lognormvariate(0, 0.8) * base_rtt_ms,
+                self._rng.random() < flap_ratio,
+                self._rng.random() < outage_ratio,
+            )
+
+    def next_cycle(self):
+        self.cycle += 1
+
+    def probe(self, ip, timeout):
+        """Same contract as network.probe_engine.icmp_probe: (ok, rtt_ms)."""
+        with self._lock:
+            self.probes += 1
+            jitter = self._rng.random()
+            lost = self._rng.random() < self.loss
+        median, flaps, outage = self.profile.get(ip, (1.0, False, False))
+
+        ok = True
+        if self.scenario == 'lossy':
+            ok = not lost
+        elif self.scenario == 'flapping' and flaps:
+            ok = (self.cycle // self.flap_every) % 2 == 0
+        elif self.scenario == 'outage' and outage:
+            ok = not (self.outage_start <= self.cycle < self.outage_end)
+
+        rtt = round(median * (0.8 + 0.4 * jitter), 1)
+        if self.time_scale:
+            time.sleep((rtt / 1000.0 if ok else timeout) * self.time_scale)
+        return ok, rtt if ok else 0
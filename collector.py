@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+import requests
+from network import collector_proto as proto
+from network.probe_engine import ProbeEngine
+
+
+class ResultBuffer:
+    """
+    Local store-and-forward queue (SQLite file per collector).
+    Results survive WAN outages and collector restarts until the server acks them.
+    """
+    MAX_ROWS = 500000  # Oldest results are dropped beyond this
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)")
+        self.conn.commit()
+
+    def push(self, results):
+        self.conn.executemany("INSERT INTO pending (data) VALUES (?)",
+                              [(json.dumps(r, separators=(',', ':')),) for r in results])
+        self.conn.execute("DELETE FROM pending WHERE seq <= (SELECT MAX(seq) FROM pending) - ?", (self.MAX_ROWS,))
+        self.conn.commit()
+
+    def peek(self, limit):
+        rows = self.conn.execute("SELECT seq, data FROM pending ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        if not rows: return None, []
+        return rows[-1][0], [json.loads(d) for _, d in rows]
+
+    def ack(self, upto_seq):
+        self.conn.execute("DELETE FROM pending WHERE seq <= ?", (upto_seq,))
+        self.conn.commit()
+
+    def size(self):
+        return self.conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+class Collector:
+    """Headless polling agent: probes its assigned devices and ships results to the central server."""
+    BATCH_SIZE = 5000
+    HTTP_TIMEOUT = 15
+
+    def __init__(self, server, name, secret, buffer_path, interval=2):
+        self.url = server.rstrip('/') + '/api/collector/sync'
+        self.name = name
+        self.secret = secret
+        self.interval = interval
+        self.buffer = ResultBuffer(buffer_path)
+        self.engine = ProbeEngine()
+        self.targets, self.timeout, self.opts = [], 30, {}
+        self.confirm = set()  # Device ids the server wants re-probed now (push events)
+        self.http = requests.Session()
+
+    def sync(self):
+        """Upload buffered results (batch by batch) and refresh the assignment. Returns False when offline."""
+        while True:
+            upto, batch = self.buffer.peek(self.BATCH_SIZE)
+            batch_id = uuid.uuid4().hex
+            body, sig = proto.pack(self.secret, {'batch_id': batch_id, 'results': batch})
+            try:
+                r = self.http.post(self.url, data=body, timeout=self.HTTP_TIMEOUT, headers={
+                    proto.HDR_NAME: self.name, proto.HDR_SIG: sig, 'Content-Type': 'application/octet-stream'})
+            except requests.RequestException as e:
+                print(f"[{self.name}] OFFLINE ({e.__class__.__name__}) - {self.buffer.size()} results buffered")
+                return False
+            if r.status_code != 200:
+                print(f"[{self.name}] Server rejected sync: {r.status_code} {r.text[:200]}")
+                return False
+            try:
+                reply = proto.unpack(self.secret, r.content, r.headers.get(proto.HDR_SIG))
+            except ValueError as e:
+                print(f"[{self.name}] Bad server reply: {e}")
+                return False
+
+            if upto is not None and reply.get('acked') == batch_id:
+                self.buffer.ack(upto)
+            self.targets = [tuple(t) for t in reply.get('targets', [])]
+            self.timeout = reply.get('timeout', self.timeout)
+            self.opts = reply.get('opts') or {}
+            self.confirm.update(reply.get('confirm') or [])
+            if upto is None or len(batch) < self.BATCH_SIZE:
+                return True
+
+    def run(self):
+        print(f">>> RTM Collector '{self.name}' started -> {self.url}")
+        self.sync()
+        while True:
+            if self.confirm:
+                self.probe([t for t in self.targets if t[0] in self.confirm], confirm=True)
+                self.confirm.clear()
+                self.sync()
+            self.probe(self.targets)
+            self.sync()
+            time.sleep(self.interval)
+
+    def probe(self, targets, confirm=False):
+        if not targets: return
+        now = time.time()
+        if confirm:  # sweep() would prune the RTT estimates of every device not in this subset
+            results = asyncio.run(self.engine.sweep_async(targets, self.timeout, **self.opts))
+        else:
+            results = self.engine.sweep(targets, self.timeout, **self.opts)
+        self.engine.rtt.annotate(results)  # The server checkpoints these for its warm restarts
+        for r in results:
+            r['ts'] = now
+            if confirm: r['confirm'] = True
+        self.buffer.push(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="RTM remote collector agent")
+    parser.add_argument('--server', default=os.environ.get('RTM_SERVER', 'http://127.0.0.1:5050'))
+    parser.add_argument('--name', default=os.environ.get('RTM_COLLECTOR_NAME'), required='RTM_COLLECTOR_NAME' not in os.environ)
+    parser.add_argument('--secret', default=os.environ.get('RTM_COLLECTOR_SECRET'), required='RTM_COLLECTOR_SECRET' not in os.environ)
+    parser.add_argument('--buffer', help="Buffer file (default: collector_<name>.sqlite3, one per collector)")
+    parser.add_argument('--interval', type=float, default=2)
+    args = parser.parse_args()
+
+    buffer_path = args.buffer or f"collector_{args.name}.sqlite3"
+    try:
+        Collector(args.server, args.name, args.secret, buffer_path, args.interval).run()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -1,6 +1,9 @@
 import threading
 import time
-import winsound  # Windows only
+try:
+    import winsound  # Windows only
+except ImportError:
+    winsound = None  # Linux/headless hosts: alarms are silent
 
 
 class AudioManager:
@@ -13,7 +16,7 @@ class AudioManager:
 
     @staticmethod
     def play_alarm(duration_sec=5):
-        if AudioManager._is_playing:
+        if AudioManager._is_playing or winsound is None:
             return  # Don't overlap sounds
 
         def _beep_loop():
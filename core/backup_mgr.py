@@ -8,6 +8,8 @@ class BackupManager:
 
     @staticmethod
     def create_backup(reason="manual"):
+        if Config.DATABASE_URL:
+            return False, "Server database in use: back it up with the server's own tools (pg_dump)"
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"backup_{reason}_{timestamp}.zip"
         filepath = os.path.join(Config.BACKUP_DIR, filename)
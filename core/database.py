@@ -1,7 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import io
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
 import bcrypt
+from core import metrics
 
 db = SQLAlchemy()
 
@@ -12,11 +18,24 @@ class Setting(db.Model):
     key = db.Column(db.String(64), unique=True, nullable=False)
     value = db.Column(db.Text, nullable=False)
 
+    # Read-through cache: the engine reads settings every cycle/transition
+    CACHE_TTL = 5
+    _cache = {}  # key -> (expires_at, value or None)
+    _cache_lock = threading.Lock()
+
     @staticmethod
     def get(key, default=None):
+        hit = Setting._cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            metrics.cache_hit("settings")
+            return hit[1] if hit[1] is not None else default
+        metrics.cache_miss("settings")
         try:
             s = Setting.query.filter_by(key=key).first()
-            return s.value if s else default
+            value = s.value if s else None
+            with Setting._cache_lock:
+                Setting._cache[key] = (time.monotonic() + Setting.CACHE_TTL, value)
+            return value if value is not None else default
         except:
             return default
 
@@ -30,6 +49,8 @@ class Setting(db.Model):
             else:
                 s.value = str(value)
             db.session.commit()
+            with Setting._cache_lock:
+                Setting._cache.pop(key, None)
         except:
             db.session.rollback()
 
@@ -47,6 +68,48 @@ class User(db.Model, UserMixin):
 
     active = db.Column(db.Boolean, default=True)
 
+    # Identity cache for the Flask-Login user loader (one lookup per request otherwise)
+    CACHE_TTL = 60
+    CACHE_MAX = 256
+    _cache = OrderedDict()  # id -> (expires_at, Identity or None)
+    _cache_lock = threading.Lock()
+    _gen = {}  # id -> invalidation count; a load that straddles invalidate() must not store its stale row
+    _epoch = 0  # bumped by invalidate() for everyone
+
+    @staticmethod
+    def load_identity(uid):
+        uid = int(uid)
+        with User._cache_lock:
+            hit = User._cache.get(uid)
+            if hit and hit[0] > time.monotonic():
+                User._cache.move_to_end(uid)
+            else:
+                hit = None
+            gen = (User._epoch, User._gen.get(uid, 0))
+        if hit:
+            metrics.cache_hit("users")
+            return hit[1]
+        metrics.cache_miss("users")
+        user = User.query.get(uid)
+        ident = Identity(user) if user else None
+        with User._cache_lock:
+            if gen == (User._epoch, User._gen.get(uid, 0)):
+                User._cache[uid] = (time.monotonic() + User.CACHE_TTL, ident)
+                User._cache.move_to_end(uid)
+                while len(User._cache) > User.CACHE_MAX:
+                    User._cache.popitem(last=False)
+        return ident
+
+    @staticmethod
+    def invalidate(uid=None):
+        with User._cache_lock:
+            if uid is None:
+                User._cache.clear()
+                User._epoch += 1
+            else:
+                User._cache.pop(int(uid), None)
+                User._gen[int(uid)] = User._gen.get(int(uid), 0) + 1
+
     def set_password(self, pw):
         self.password_hash = bcrypt.hashpw(pw.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
@@ -57,6 +120,18 @@ class User(db.Model, UserMixin):
             return False
 
 
+class Identity(UserMixin):
+    """Detached, read-only snapshot of a User: safe to share across requests and threads."""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self.expires_at = user.expires_at
+        self.license_hash = user.license_hash
+        self.active = user.active
+
+
 # --- DEVICES (FIXED CRASH) ---
 class Device(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,4 +146,156 @@ class Device(db.Model):
     is_stopped = db.Column(db.Boolean, default=False)  # Fixed Crash
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    children = db.relationship('Device', backref=db.backref('uplink', remote_side=[id]))
\ No newline at end of file
+    children = db.relationship('Device', backref=db.backref('uplink', remote_side=[id]))
+    checks = db.relationship('ServiceCheck', backref='device', cascade='all, delete-orphan')
+
+# --- REMOTE COLLECTORS ---
+class Collector(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    secret = db.Column(db.String(128), nullable=False)  # HMAC key shared with the collector
+    subnets = db.Column(db.Text, default="")  # Comma separated CIDRs owned by this collector
+    last_seen = db.Column(db.DateTime)
+
+    def networks(self):
+        nets = []
+        for s in (self.subnets or "").split(','):
+            try:
+                if s.strip(): nets.append(ipaddress.ip_network(s.strip(), strict=False))
+            except ValueError:
+                pass
+        return nets
+
+
+# --- SERVICE CHECKS (TCP / HTTP / DNS) ---
+class ServiceCheck(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(8), nullable=False)  # tcp / http / https / dns
+    port = db.Column(db.Integer)
+    target = db.Column(db.String(255))  # HTTP path or DNS name to resolve
+    expect = db.Column(db.Integer)  # Expected HTTP status (None = any < 400)
+    timeout_ms = db.Column(db.Integer, default=3000)
+    enabled = db.Column(db.Boolean, default=True)
+
+    KINDS = ('tcp', 'http', 'https', 'dns')
+
+    @staticmethod
+    def parse_spec(spec):
+        """
+        Compact form used by the UI:
+        tcp:22 | http:80/health=200 | https:443/ | dns:example.com
+        """
+        kind, _, rest = (spec or "").strip().partition(':')
+        kind = kind.lower()
+        if kind not in ServiceCheck.KINDS or not rest:
+            raise ValueError("Use tcp:PORT, http:PORT/PATH[=STATUS], https:PORT/PATH or dns:NAME")
+        if kind == 'tcp':
+            return ServiceCheck(kind=kind, port=int(rest))
+        if kind == 'dns':
+            return ServiceCheck(kind=kind, target=rest)
+        rest, _, expect = rest.partition('=')
+        port, slash, path = rest.partition('/')
+        return ServiceCheck(kind=kind, port=int(port), target=slash + path or '/', expect=int(expect) if expect else None)
+
+    def to_probe(self):
+        return {'id': self.id, 'kind': self.kind, 'port': self.port, 'target': self.target,
+                'expect': self.expect, 'timeout_ms': self.timeout_ms}
+
+    def to_dict(self):
+        return dict(self.to_probe(), device_id=self.device_id, enabled=self.enabled)
+
+    @staticmethod
+    def by_device():
+        """{device_id: [probe dicts]} for all enabled checks (one query per cycle)."""
+        out = {}
+        for c in ServiceCheck.query.filter_by(enabled=True).all():
+            out.setdefault(c.device_id, []).append(c.to_probe())
+        return out
+
+
+# --- HISTORY (SLA REPORTS) ---
+class StateTransition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, nullable=False)  # No FK: history outlives deleted devices until retention
+    ts = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    from_state = db.Column(db.String(16))
+    to_state = db.Column(db.String(16), nullable=False)
+
+    __table_args__ = (db.Index('ix_transition_device_ts', 'device_id', 'ts'),)
+
+
+class LatencyRollup(db.Model):
+    """One row per device per hour; `hist` holds counts for LATENCY_BUCKETS_MS (+ overflow)."""
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)
+    samples = db.Column(db.Integer, default=0)
+    ok = db.Column(db.Integer, default=0)
+    rtt_sum = db.Column(db.Float, default=0.0)
+    rtt_min = db.Column(db.Float)
+    rtt_max = db.Column(db.Float)
+    hist = db.Column(db.String(255), default="")
+
+    LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    __table_args__ = (db.UniqueConstraint('device_id', 'hour', name='uq_rollup_device_hour'),
+                      db.Index('ix_rollup_hour', 'hour'))
+
+
+# --- DEVICE CONFIG BACKUPS ---
+class ConfigVersion(db.Model):
+    """One row per *changed* config; the text lives content-addressed under data/configs (see ConfigStore)."""
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, nullable=False)
+    ts = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sha = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, default=0)
+    lines = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.Index('ix_config_device_ts', 'device_id', 'ts'),)
+
+    def to_dict(self):
+        return {'id': self.id, 'device_id': self.device_id, 'ts': self.ts.strftime('%Y-%m-%d %H:%M:%S'),
+                'sha': self.sha, 'size': self.size, 'lines': self.lines}
+
+
+# --- BULK WRITES ---
+COPY_MIN_ROWS = 1000  # Below this a multi-row INSERT is as fast as COPY and simpler
+
+
+def _copy_text(value):
+    """One field in PostgreSQL COPY text format."""
+    if value is None: return "\\N"
+    if isinstance(value, bool): return "t" if value else "f"
+    if isinstance(value, datetime): return value.isoformat(sep=" ")
+    if isinstance(value, (bytes, bytearray)): return "\\\\x" + bytes(value).hex()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def bulk_insert(table, rows, conn=None):
+    """
+    Inserts a list of column dicts into `table` (Table or model) inside the current transaction.
+    PostgreSQL with psycopg2/psycopg gets COPY for large batches; everything else an
+    executemany INSERT (multi-row VALUES where the dialect supports it). The caller commits.
+    """
+    if not rows: return 0
+    table = getattr(table, '__table__', table)
+    conn = conn if conn is not None else db.session.connection()
+    if conn.dialect.name == "postgresql" and len(rows) >= COPY_MIN_ROWS:
+        cols = list(rows[0].keys())
+        buf = "".join("\t".join(_copy_text(r.get(c)) for c in cols) + "\n" for r in rows)
+        sql = f'COPY {conn.dialect.identifier_preparer.format_table(table)} ' \
+              f'({", ".join(conn.dialect.identifier_preparer.quote(c) for c in cols)}) FROM STDIN'
+        cur = conn.connection.cursor()
+        try:
+            if hasattr(cur, 'copy_expert'):  # psycopg2
+                cur.copy_expert(sql, io.StringIO(buf))
+            else:  # psycopg 3
+                with cur.copy(sql) as cp:
+                    cp.write(buf)
+        finally:
+            cur.close()
+    else:
+        conn.execute(table.insert(), rows)
+    return len(rows)
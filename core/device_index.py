@@ -0,0 +1,216 @@
+import bisect
+import ipaddress
+import socket
+import threading
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from core.database import db, Device
+
+_HIGH = "\U0010ffff"  # Sorts after every real character: upper bound of a prefix range
+
+
+class DeviceLookup:
+    """
+    In-memory search index over devices (type-ahead, exact IP, CIDR membership).
+    Keys live in sorted arrays searched with bisect: a prefix or a subnet is one
+    contiguous slice, so every query is O(log n + k) at C speed. Kept current by
+    the ORM hooks below, like TopologyManager; built lazily on first use.
+    """
+    _lock = threading.RLock()
+    _built = False
+    _rows = {}  # dev_id -> (name, ip, device_type, state)
+    _names = []  # sorted (lower name, dev_id)
+    _ip_text = []  # sorted (ip string, dev_id): "10.20." type-ahead
+    _ip_num = {4: [], 6: []}  # version -> sorted (int address, dev_id)
+    _by_ip = {}  # ip string -> dev_id
+
+    # --- MAINTENANCE ---
+    @classmethod
+    def _ensure(cls):
+        if cls._built: return
+        with cls._lock:
+            if cls._built: return
+            rows = db.session.query(Device.id, Device.name, Device.ip, Device.device_type, Device.state).all()
+            cls._rows, cls._by_ip = {}, {}
+            cls._names, cls._ip_text, cls._ip_num = [], [], {4: [], 6: []}
+            for dev_id, name, ip, dtype, state in rows:
+                cls._rows[dev_id] = (name, ip, dtype, state)
+                cls._by_ip[ip] = dev_id
+                cls._names.append(((name or "").lower(), dev_id))
+                cls._ip_text.append((ip, dev_id))
+                addr = cls._addr(ip)
+                if addr: cls._ip_num[addr[0]].append((addr[1], dev_id))
+            cls._names.sort()
+            cls._ip_text.sort()
+            for keys in cls._ip_num.values(): keys.sort()
+            cls._built = True
+
+    @classmethod
+    def invalidate(cls):
+        """Full rebuild on next use (bulk SQL that bypasses the ORM hooks)."""
+        with cls._lock:
+            cls._built = False
+
+    @staticmethod
+    def _addr(ip):
+        """(version, int) of an address string, None for hostnames. inet_pton is ~20x faster than ipaddress."""
+        for family, version in ((socket.AF_INET, 4), (socket.AF_INET6, 6)):
+            try:
+                return version, int.from_bytes(socket.inet_pton(family, ip), 'big')
+            except (OSError, TypeError, ValueError):
+                continue
+        return None
+
+    @staticmethod
+    def _discard(keys, key):
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key: del keys[i]
+
+    @classmethod
+    def add(cls, dev_id, name, ip, device_type=None, state=None):
+        with cls._lock:
+            if not cls._built: return  # The lazy build will pick it up
+            if dev_id in cls._rows: cls._remove(dev_id)
+            cls._rows[dev_id] = (name, ip, device_type, state)
+            cls._by_ip[ip] = dev_id
+            bisect.insort(cls._names, ((name or "").lower(), dev_id))
+            bisect.insort(cls._ip_text, (ip, dev_id))
+            addr = cls._addr(ip)
+            if addr: bisect.insort(cls._ip_num[addr[0]], (addr[1], dev_id))
+
+    @classmethod
+    def remove(cls, dev_id):
+        with cls._lock:
+            if cls._built: cls._remove(dev_id)
+
+    @classmethod
+    def _remove(cls, dev_id):
+        row = cls._rows.pop(dev_id, None)
+        if row is None: return
+        name, ip = row[0], row[1]
+        if cls._by_ip.get(ip) == dev_id: del cls._by_ip[ip]
+        cls._discard(cls._names, ((name or "").lower(), dev_id))
+        cls._discard(cls._ip_text, (ip, dev_id))
+        addr = cls._addr(ip)
+        if addr: cls._discard(cls._ip_num[addr[0]], (addr[1], dev_id))
+
+    @classmethod
+    def set_state(cls, dev_id, state):
+        with cls._lock:
+            row = cls._rows.get(dev_id)
+            if row: cls._rows[dev_id] = row[:3] + (state,)
+
+    # --- QUERIES ---
+    @classmethod
+    def by_ip(cls, ip):
+        cls._ensure()
+        return cls._by_ip.get(ip)
+
+    @classmethod
+    def counts(cls):
+        """{'total', 'UP', 'DOWN', ...} from the indexed states."""
+        cls._ensure()
+        out = {'total': len(cls._rows)}
+        for row in list(cls._rows.values()):
+            out[row[3]] = out.get(row[3], 0) + 1
+        return out
+
+    @classmethod
+    def _slice(cls, keys, lo, hi, limit, seen, out, state):
+        i = bisect.bisect_left(keys, lo)
+        while i < len(keys) and keys[i] < hi and len(out) < limit:
+            dev_id = keys[i][1]
+            if dev_id not in seen and (state is None or cls._rows[dev_id][3] == state):
+                seen.add(dev_id)
+                out.append(dev_id)
+            i += 1
+
+    @classmethod
+    def prefix(cls, text, limit=20, state=None):
+        """Devices whose name or IP starts with `text` (case-insensitive names), name matches first."""
+        cls._ensure()
+        seen, out = set(), []
+        with cls._lock:
+            p = text.lower()
+            cls._slice(cls._names, (p,), (p + _HIGH,), limit, seen, out, state)
+            cls._slice(cls._ip_text, (text,), (text + _HIGH,), limit, seen, out, state)
+        return out
+
+    @classmethod
+    def within(cls, cidr, limit=1000, state=None):
+        """Devices whose address lies inside `cidr` ('10.20.0.0/16'), in address order."""
+        net = ipaddress.ip_network(cidr, strict=False)
+        cls._ensure()
+        seen, out = set(), []
+        with cls._lock:
+            keys = cls._ip_num[net.version]
+            cls._slice(keys, (int(net.network_address), -1), (int(net.broadcast_address) + 1, -1), limit, seen, out,
+                       state)
+        return out
+
+    @classmethod
+    def nearest(cls, ip):
+        """
+        Longest-prefix match: the indexed device(s) sharing the most leading bits with `ip`,
+        and that prefix length. In sorted order the best match is always a direct neighbour.
+        """
+        addr = ipaddress.ip_address(ip)
+        cls._ensure()
+        with cls._lock:
+            keys = cls._ip_num[addr.version]
+            if not keys: return [], 0
+            bits = addr.max_prefixlen
+            q = int(addr)
+            i = bisect.bisect_left(keys, (q, -1))
+            best = max(bits - (q ^ keys[j][0]).bit_length() for j in (i - 1, i) if 0 <= j < len(keys))
+            lo = q >> (bits - best) << (bits - best)
+            hi = lo + (1 << (bits - best))
+            seen, out = set(), []
+            cls._slice(keys, (lo, -1), (hi, -1), 50, seen, out, None)
+            return out, best
+
+    @classmethod
+    def describe(cls, ids):
+        cls._ensure()
+        rows = cls._rows
+        return [{'id': i, 'name': rows[i][0], 'ip': rows[i][1], 'device_type': rows[i][2], 'state': rows[i][3]}
+                for i in ids if i in rows]
+
+
+# --- ORM HOOKS ---
+# Flush-time changes are queued on the session and only reach the index once the
+# transaction commits; a rollback drops them (no phantom rows or stale counts).
+def _queue(target, op):
+    session = object_session(target)
+    if session is None: return
+    session.info.setdefault('device_lookup', []).append(op)
+
+
+@event.listens_for(Device, 'after_insert')
+def _on_device_added(mapper, connection, target):
+    _queue(target, (DeviceLookup.add, target.id, target.name, target.ip, target.device_type, target.state))
+
+
+@event.listens_for(Device, 'after_delete')
+def _on_device_removed(mapper, connection, target):
+    _queue(target, (DeviceLookup.remove, target.id))
+
+
+@event.listens_for(Device, 'after_update')
+def _on_device_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[f].history.has_changes() for f in ('ip', 'name', 'device_type')):
+        _queue(target, (DeviceLookup.add, target.id, target.name, target.ip, target.device_type, target.state))
+    elif attrs.state.history.has_changes():
+        _queue(target, (DeviceLookup.set_state, target.id, target.state))
+
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    for fn, *args in session.info.pop('device_lookup', ()):
+        fn(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('device_lookup', None)
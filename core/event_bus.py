@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+from core import metrics
+
+BLOCK = "block"  # Publisher waits for room (nothing may be lost: DB writes, history)
+DROP_OLDEST = "drop_oldest"  # Oldest pending event is discarded (alarms: only the recent ones matter)
+COALESCE = "coalesce"  # A pending event with the same key is replaced in place (UI: latest state per device)
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+
+class Subscriber(threading.Thread):
+    """One consumer: a bounded queue drained in batches by its own thread."""
+
+    def __init__(self, topic, name, handler, maxsize, policy, key, batch, app):
+        super().__init__(daemon=True, name=f"bus-{name}")
+        if policy not in POLICIES: raise ValueError(f"unknown overflow policy {policy!r}")
+        if policy == COALESCE and key is None: raise ValueError("coalesce needs a key function")
+        self.topic = topic
+        self.consumer = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.batch = batch
+        self.app = app
+        self.handled = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._q = deque()  # [published_at, payload] slots
+        self._index = {}  # coalesce key -> pending slot
+        self._cond = threading.Condition()
+        self._busy = False
+        self._stopped = False
+
+    def put_many(self, payloads):
+        now = time.monotonic()
+        with self._cond:
+            for p in payloads:
+                if self.policy == COALESCE:
+                    k = self.key(p)
+                    slot = self._index.get(k)
+                    if slot is not None:
+                        slot[1] = p  # Keeps its queue position and original timestamp (lag = oldest unseen)
+                        self.coalesced += 1
+                        continue
+                if len(self._q) >= self.maxsize:
+                    if self.policy == BLOCK:
+                        t0 = time.monotonic()
+                        while len(self._q) >= self.maxsize and not self._stopped:
+                            self._cond.wait()
+                        metrics.BUS_BLOCKED.observe(time.monotonic() - t0, self.consumer)
+                    else:
+                        old = self._q.popleft()
+                        if self.policy == COALESCE: del self._index[self.key(old[1])]
+                        self.dropped += 1
+                        metrics.BUS_DROPPED.inc(1, self.consumer)
+                slot = [now, p]
+                self._q.append(slot)
+                if self.policy == COALESCE: self._index[k] = slot
+            self._cond.notify_all()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._q and not self._stopped:
+                    self._cond.wait()
+                if not self._q: return
+                batch = [self._q.popleft() for _ in range(min(self.batch, len(self._q)))]
+                if self.policy == COALESCE:
+                    for slot in batch: del self._index[self.key(slot[1])]
+                self._busy = True
+                depth = len(self._q)
+                self._cond.notify_all()  # Wake blocked publishers
+            metrics.BUS_LAG.observe(time.monotonic() - batch[0][0], self.consumer)
+            metrics.BUS_DEPTH.set(depth, self.consumer)
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        self.handler([p for _, p in batch])
+                else:
+                    self.handler([p for _, p in batch])
+            except Exception as e:
+                metrics.MONITOR_ERRORS.inc(1, f"bus:{self.consumer}")
+                print(f"[bus] {self.consumer}: {e.__class__.__name__}: {e}")
+            with self._cond:
+                self.handled += len(batch)
+                self._busy = False
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._q or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"topic": self.topic, "consumer": self.consumer, "policy": self.policy, "depth": len(self._q),
+                "maxsize": self.maxsize, "handled": self.handled, "dropped": self.dropped,
+                "coalesced": self.coalesced}
+
+
+class EventBus:
+    """
+    In-process publish/subscribe between the ping engine and its consumers.
+    publish() only enqueues; each subscriber runs its handler on its own thread
+    with a batch of events, so a slow consumer delays itself, not the probing
+    (except under the BLOCK policy, where that backpressure is the point).
+    """
+    _lock = threading.Lock()
+    _subs = {}  # topic -> [Subscriber]
+
+    @classmethod
+    def subscribe(cls, topic, name, handler, maxsize=10000, policy=DROP_OLDEST, key=None, batch=500, app=None):
+        """handler(list_of_payloads); runs inside app.app_context() when `app` is given."""
+        sub = Subscriber(topic, name, handler, maxsize, policy, key, batch, app)
+        with cls._lock:
+            cls._subs[topic] = cls._subs.get(topic, []) + [sub]
+        sub.start()
+        return sub
+
+    @classmethod
+    def publish(cls, topic, payload):
+        cls.publish_many(topic, (payload,))
+
+    @classmethod
+    def publish_many(cls, topic, payloads):
+        payloads = list(payloads)
+        if not payloads: return
+        for sub in cls._subs.get(topic, ()):
+            sub.put_many(payloads)
+
+    @classmethod
+    def drain(cls, timeout=5.0):
+        """Waits until every queue is empty and no handler is running (shutdown)."""
+        deadline = time.monotonic() + timeout
+        subs = [s for group in list(cls._subs.values()) for s in group]
+        return all(s.wait_idle(max(0.0, deadline - time.monotonic())) for s in subs)
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            subs = [s for group in cls._subs.values() for s in group]
+            cls._subs = {}
+        for s in subs: s.stop()
+
+    @classmethod
+    def stats(cls):
+        return [s.stats() for group in list(cls._subs.values()) for s in group]
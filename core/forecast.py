@@ -0,0 +1,248 @@
+"""
+Trend forecasting over the hourly latency rollups.
+Per device and metric (mean RTT, probe loss %) the sufficient statistics of a
+weighted least-squares line are kept in NumPy arrays, with exponential
+forgetting so the trend follows the last weeks. Each run folds in the rollup
+hours closed since the previous run and re-reads the last REINGEST_HOURS,
+applying only the difference to what was already added (late merges, buffered
+collector uploads), so the cost is proportional to recent buckets, not to
+history; the arrays are checkpointed to data/.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from config import Config
+from core.database import db, Device, LatencyRollup, Setting
+from core.device_index import DeviceLookup
+from core.job_mgr import JobManager
+from core.live_hub import LiveHub
+
+STATE_FILE = os.path.join(Config.DATA_DIR, "forecast_state.npz")
+METRICS = ('latency_ms', 'loss_pct')
+HALF_LIFE_HOURS = 168  # A week-old hour counts half
+BACKFILL_HOURS = 8 * HALF_LIFE_HOURS  # First run: older buckets would weigh < 0.4%
+REINGEST_HOURS = 72  # Closed hours still watched for late samples (collector buffers survive WAN outages)
+MIN_WEIGHT = 48.0  # Effective hourly points before a trend is trusted
+MIN_R2 = 0.2  # Fit quality below which a crossing is not predicted (noise, not trend)
+TOP = 100
+
+# Sufficient statistics per device and metric (t = hours relative to the last ingested hour)
+W, WT, WTT, WY, WTY, WYY = range(6)
+
+
+class Forecaster:
+    """Incremental per-device trend fits; one instance of state per process, shared by the job and the API."""
+    _lock = threading.Lock()
+    _loaded = False
+    _ids = np.zeros(0, dtype=np.int64)
+    _s = np.zeros((0, len(METRICS), 6))
+    _hour = None  # Last ingested rollup hour (naive UTC)
+    _updated = None  # Epoch of the last run
+    _seen = {}  # hour -> (sorted device ids, [samples, ok, rtt_sum] rows) already added, for the re-ingest window
+
+    # --- STATE ---
+    @classmethod
+    def _load(cls):
+        if cls._loaded: return
+        cls._loaded = True
+        try:
+            with np.load(STATE_FILE) as f:
+                if f['s'].shape[1:] != cls._s.shape[1:]: return  # Other layout: rebuild from history
+                ids, s, hour, updated = f['ids'], f['s'], float(f['hour']), float(f['updated'])
+                seen_hour, seen_ids, seen_vals = f['seen_hour'], f['seen_ids'], f['seen_vals']
+        except (OSError, KeyError, ValueError):
+            return
+        cls._ids, cls._s, cls._updated = ids, s, updated
+        cls._hour = datetime.utcfromtimestamp(hour) if hour >= 0 else None
+        for h in np.unique(seen_hour):
+            rows = seen_hour == h
+            cls._seen[datetime.utcfromtimestamp(float(h))] = (seen_ids[rows], seen_vals[rows])
+
+    @classmethod
+    def _save(cls):
+        tmp = STATE_FILE + ".tmp.npz"
+        epoch = lambda h: (h - datetime(1970, 1, 1)).total_seconds()
+        hours = sorted(cls._seen)
+        seen_hour = np.concatenate([np.full(len(cls._seen[h][0]), epoch(h)) for h in hours]) if hours else np.zeros(0)
+        seen_ids = np.concatenate([cls._seen[h][0] for h in hours]) if hours else np.zeros(0, dtype=np.int64)
+        seen_vals = np.concatenate([cls._seen[h][1] for h in hours]) if hours else np.zeros((0, 3))
+        np.savez(tmp, ids=cls._ids, s=cls._s, hour=epoch(cls._hour) if cls._hour else -1.0,
+                 updated=cls._updated or 0.0, seen_hour=seen_hour, seen_ids=seen_ids, seen_vals=seen_vals)
+        os.replace(tmp, STATE_FILE)
+
+    @classmethod
+    def _advance(cls, hours):
+        """Moves t=0 forward by `hours`: forget (decay) and re-centre the t moments."""
+        s = cls._s
+        s *= 0.5 ** (hours / HALF_LIFE_HOURS)
+        w, wt, wy = s[..., W].copy(), s[..., WT].copy(), s[..., WY]
+        s[..., WTT] += -2 * hours * wt + hours * hours * w
+        s[..., WT] -= hours * w
+        s[..., WTY] -= hours * wy
+
+    @classmethod
+    def _slots(cls, dev_ids):
+        order = np.argsort(cls._ids)
+        sorted_ids = cls._ids[order]
+        pos = np.searchsorted(sorted_ids, dev_ids)
+        found = (pos < len(sorted_ids)) & (sorted_ids[np.minimum(pos, len(sorted_ids) - 1)] == dev_ids) \
+            if len(sorted_ids) else np.zeros(len(dev_ids), dtype=bool)
+        if not found.all():
+            new = np.unique(dev_ids[~found])
+            cls._ids = np.concatenate([cls._ids, new])
+            cls._s = np.concatenate([cls._s, np.zeros((len(new), len(METRICS), 6))])
+            return cls._slots(dev_ids)
+        return order[pos]
+
+    @classmethod
+    def _add(cls, idx, vals, t, w):
+        """Adds hourly points ([samples, ok, rtt_sum] rows) at time t with weight w (negative w removes them)."""
+        samples, ok, rtt_sum = vals[:, 0], vals[:, 1], vals[:, 2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series = ((ok > 0, rtt_sum / ok), (samples > 0, 100.0 * (samples - ok) / samples))
+        for m, (valid, y) in enumerate(series):
+            i, y = idx[valid], y[valid]
+            for k, v in ((W, 1.0), (WT, t), (WTT, t * t), (WY, y), (WTY, t * y), (WYY, y * y)):
+                np.add.at(cls._s[:, m, k], i, w * v)
+
+    @classmethod
+    def _ingest(cls, hour, rows):
+        """
+        One closed hour: (device_id, samples, ok, rtt_sum) rows. A new hour is added at t=0;
+        an hour already folded in only contributes what changed since (late samples).
+        """
+        arr = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        order = np.argsort(arr[:, 0], kind='stable')
+        ids, vals = arr[order, 0].astype(np.int64), arr[order, 1:]
+        if cls._hour is None or hour > cls._hour:
+            if cls._hour is not None:
+                cls._advance((hour - cls._hour).total_seconds() / 3600.0)
+            cls._hour = hour
+            cls._add(cls._slots(ids), vals, 0.0, 1.0)
+        else:
+            t = -(cls._hour - hour).total_seconds() / 3600.0
+            w = 0.5 ** (-t / HALF_LIFE_HOURS)  # What _advance has made of a point added back then
+            old_ids, old_vals = cls._seen.get(hour, (np.zeros(0, dtype=np.int64), np.zeros((0, 3))))
+            pos = np.minimum(np.searchsorted(old_ids, ids), max(len(old_ids) - 1, 0))
+            known = (old_ids[pos] == ids) if len(old_ids) else np.zeros(len(ids), dtype=bool)
+            changed = ~known
+            changed[known] = (old_vals[pos[known]] != vals[known]).any(axis=1)
+            if changed.any():
+                was = known & changed
+                if was.any(): cls._add(cls._slots(ids[was]), old_vals[pos[was]], t, -w)
+                cls._add(cls._slots(ids[changed]), vals[changed], t, w)
+        cls._seen[hour] = (ids, vals)
+
+    @classmethod
+    def _prune(cls, keep_ids):
+        keep = np.isin(cls._ids, np.fromiter(keep_ids, dtype=np.int64))
+        cls._ids, cls._s = cls._ids[keep], cls._s[keep]
+
+    # --- JOB ---
+    @classmethod
+    def update(cls, progress=None):
+        """Folds in the hours closed since the last run, re-reads the window (needs an app context). -> hours read"""
+        with cls._lock:
+            cls._load()
+            current = datetime.utcnow().replace(minute=0, second=0, microsecond=0)  # Still open: not final
+            window = current - timedelta(hours=REINGEST_HOURS)
+            since = cls._hour or (current - timedelta(hours=BACKFILL_HOURS + 1))
+            for h in [h for h in cls._seen if h < window]:
+                del cls._seen[h]
+            hours = [h for (h,) in db.session.query(LatencyRollup.hour).distinct()
+                     .filter(LatencyRollup.hour > min(since, window), LatencyRollup.hour < current)
+                     .order_by(LatencyRollup.hour)]
+            for n, hour in enumerate(hours, 1):
+                rows = db.session.query(LatencyRollup.device_id, LatencyRollup.samples, LatencyRollup.ok,
+                                        LatencyRollup.rtt_sum).filter(LatencyRollup.hour == hour).all()
+                cls._ingest(hour, [(d, s or 0, o or 0, r or 0.0) for d, s, o, r in rows])
+                if hour < window: cls._seen.pop(hour, None)  # Backfill: too old to change again
+                if progress: progress(n, len(hours))
+            cls._prune(i for (i,) in db.session.query(Device.id))
+            cls._updated = time.time()
+            cls._save()
+            return len(hours)
+
+    # --- PREDICTION ---
+    @classmethod
+    def _fit(cls):
+        """Level at the last hour, slope per hour, R^2 and weight; arrays (devices, metrics)."""
+        s = cls._s
+        w, wt, wtt, wy, wty, wyy = (s[..., k] for k in range(6))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sxx = w * wtt - wt * wt
+            sxy = w * wty - wt * wy
+            syy = w * wyy - wy * wy
+            slope = np.where(sxx > 1e-9, sxy / sxx, 0.0)
+            level = np.where(w > 0, (wy - slope * wt) / w, np.nan)
+            r2 = np.where((sxx > 1e-9) & (syy > 1e-9), sxy * sxy / (sxx * syy), 0.0)
+        return level, slope, r2, w
+
+    @classmethod
+    def at_risk(cls, thresholds, horizon_hours, top=TOP):
+        """
+        Devices predicted to cross `thresholds` ({metric: value}) within the horizon,
+        soonest first (already past the threshold = 0 h).
+        """
+        with cls._lock:
+            cls._load()
+            if not len(cls._ids): return []
+            level, slope, r2, w = cls._fit()
+            ids = cls._ids
+        out = []
+        for m, metric in enumerate(METRICS):
+            limit = thresholds.get(metric)
+            if not limit: continue
+            lv, sl, q, wm = level[:, m], slope[:, m], r2[:, m], w[:, m]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                eta = np.where(lv >= limit, 0.0,
+                               np.where((sl > 0) & (q >= MIN_R2), (limit - lv) / sl, np.inf))
+            hit = np.flatnonzero((wm >= MIN_WEIGHT) & (eta <= horizon_hours))
+            for i in hit:
+                out.append({'id': int(ids[i]), 'metric': metric, 'level': round(float(lv[i]), 2),
+                            'slope_per_day': round(float(sl[i]) * 24, 3), 'threshold': limit,
+                            'eta_hours': round(float(eta[i]), 1), 'r2': round(float(r2[i, m]), 2)})
+        out.sort(key=lambda r: (r['eta_hours'], -r['r2']))
+        return out[:top]
+
+    @classmethod
+    def status(cls):
+        with cls._lock:
+            cls._load()
+            return {'hour': cls._hour.isoformat() if cls._hour else None, 'updated': cls._updated,
+                    'devices': int(len(cls._ids))}
+
+
+def thresholds():
+    """(thresholds, horizon hours) from settings."""
+    try:
+        limits = {'latency_ms': float(Setting.get("forecast_latency_ms", "150")),
+                  'loss_pct': float(Setting.get("forecast_loss_pct", "5"))}
+        horizon = float(Setting.get("forecast_horizon_days", "14")) * 24
+    except ValueError:
+        limits, horizon = {'latency_ms': 150.0, 'loss_pct': 5.0}, 14 * 24.0
+    return limits, horizon
+
+
+def make_forecast_job(app):
+    """Job body for JobManager: incremental update, then the ranked list goes to the 'forecast' live view."""
+
+    def _forecast(job):
+        with app.app_context():
+            Forecaster.update(progress=lambda done, total: job.progress(done=done, total=total))
+            limits, horizon = thresholds()
+            risk = Forecaster.at_risk(limits, horizon)
+            info = {d['id']: d for d in DeviceLookup.describe([r['id'] for r in risk])}
+            db.session.remove()
+        for r in risk:
+            r.update(name=info.get(r['id'], {}).get('name'), ip=info.get(r['id'], {}).get('ip'))
+        job.results = risk
+        LiveHub.publish('forecast', 'at_risk', {'results': risk, **Forecaster.status()}, key='at_risk')
+
+    return _forecast
+
+
+def submit(app):
+    return JobManager.submit('forecast', (), make_forecast_job(app))
@@ -0,0 +1,96 @@
+import bisect
+import threading
+from datetime import datetime
+from core.database import db, bulk_insert, StateTransition, LatencyRollup
+from core.maintenance import MaintenanceManager
+
+MaintenanceManager.register_policy('state_transition', 'ts', 'retention_transitions_days', 400)
+MaintenanceManager.register_policy('latency_rollup', 'hour', 'retention_rollups_days', 400)
+
+
+def _forecast(app):
+    from core import forecast  # numpy: loaded on the first run, not at startup
+    forecast.submit(app)
+
+
+MaintenanceManager.register_hourly(_forecast)
+
+
+class HistoryRecorder:
+    """
+    Feeds the SLA report tables from the ping engine.
+    Transitions ride on the device state writer's commit; latency samples are
+    folded in memory into hourly per-device rollups and bulk-inserted once the hour closes.
+    """
+    _lock = threading.Lock()
+    _hour = None  # Newest hour seen (open)
+    _acc = {}  # hour -> {dev_id -> [samples, ok, rtt_sum, rtt_min, rtt_max, hist list]}
+
+    @staticmethod
+    def transitions(rows):
+        """Bulk-inserts (dev_id, from_state, to_state, ts) rows in the current transaction; the caller commits."""
+        bulk_insert(StateTransition, [{'device_id': dev_id, 'from_state': f, 'to_state': t, 'ts': ts or datetime.utcnow()}
+                                      for dev_id, f, t, ts in rows])
+
+    @staticmethod
+    def sample(dev_id, ok, rtt_ms, now=None):
+        """One probe result, bucketed by the time it was taken (buffered collector uploads may be hours old)."""
+        now = now or datetime.utcnow()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        buckets = LatencyRollup.LATENCY_BUCKETS_MS
+        closed = []
+        with HistoryRecorder._lock:
+            if HistoryRecorder._hour is None or hour > HistoryRecorder._hour:
+                HistoryRecorder._hour = hour
+                closed = [(h, HistoryRecorder._acc.pop(h)) for h in sorted(HistoryRecorder._acc) if h < hour]
+            acc = HistoryRecorder._acc.setdefault(hour, {})
+            a = acc.get(dev_id)
+            if a is None:
+                a = acc[dev_id] = [0, 0, 0.0, None, None, [0] * (len(buckets) + 1)]
+            a[0] += 1
+            if ok:
+                a[1] += 1
+                a[2] += rtt_ms
+                a[3] = rtt_ms if a[3] is None else min(a[3], rtt_ms)
+                a[4] = rtt_ms if a[4] is None else max(a[4], rtt_ms)
+                a[5][bisect.bisect_left(buckets, rtt_ms)] += 1
+        for h, acc in closed:
+            HistoryRecorder._write(h, acc)
+
+    @staticmethod
+    def write_late():
+        """Merges samples that arrived for already closed hours into their rows (end of each history batch)."""
+        with HistoryRecorder._lock:
+            late = [(h, HistoryRecorder._acc.pop(h)) for h in sorted(HistoryRecorder._acc) if h < HistoryRecorder._hour]
+        for h, acc in late:
+            HistoryRecorder._write(h, acc)
+
+    @staticmethod
+    def flush():
+        """Writes every open hour as-is (shutdown / tests); later samples start a fresh row set."""
+        with HistoryRecorder._lock:
+            pending, HistoryRecorder._acc, HistoryRecorder._hour = HistoryRecorder._acc, {}, None
+        for h in sorted(pending):
+            if pending[h]: HistoryRecorder._write(h, pending[h])
+
+    @staticmethod
+    def _write(hour, acc):
+        rows = [{'device_id': dev_id, 'hour': hour, 'samples': a[0], 'ok': a[1], 'rtt_sum': a[2],
+                 'rtt_min': a[3], 'rtt_max': a[4], 'hist': ','.join(map(str, a[5]))} for dev_id, a in acc.items()]
+        try:
+            existing = {r.device_id: r for r in LatencyRollup.query.filter_by(hour=hour).all()}
+            for row in [r for r in rows if r['device_id'] in existing]:  # Hour partly written by flush()
+                old = existing[row['device_id']]
+                old.samples += row['samples']
+                old.ok += row['ok']
+                old.rtt_sum += row['rtt_sum']
+                if row['rtt_min'] is not None:
+                    old.rtt_min = row['rtt_min'] if old.rtt_min is None else min(old.rtt_min, row['rtt_min'])
+                    old.rtt_max = row['rtt_max'] if old.rtt_max is None else max(old.rtt_max, row['rtt_max'])
+                counts = [int(c) for c in (old.hist or "").split(',') if c] or [0] * (len(LatencyRollup.LATENCY_BUCKETS_MS) + 1)
+                old.hist = ','.join(str(x + int(y)) for x, y in zip(counts, row['hist'].split(',')))
+            bulk_insert(LatencyRollup, [r for r in rows if r['device_id'] not in existing])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[history] rollup write failed for {hour:%Y-%m-%d %H}:00: {e.__class__.__name__}")
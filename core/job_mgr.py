@@ -0,0 +1,114 @@
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """One background job. Results are capped; progress is pushed through JobManager's emitter."""
+    MAX_RESULTS = 20000
+
+    def __init__(self, job_id, kind, key):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.done = 0
+        self.total = 0
+        self.results = []
+        self.error = None
+        self.artifact = None  # Downloadable output file name (reports)
+        self.created = time.time()
+        self.finished = None
+        self._sent = 0  # Results already streamed to clients
+        self._last_emit = 0.0
+
+    def progress(self, done=None, total=None, result=None):
+        if total is not None: self.total = total
+        if done is not None: self.done = done
+        if result is not None and len(self.results) < self.MAX_RESULTS:
+            self.results.append(result)
+        JobManager._publish(self)
+
+    def to_dict(self, with_results=False):
+        d = {"id": self.id, "kind": self.kind, "status": self.status, "done": self.done, "total": self.total,
+             "error": self.error, "created": self.created, "finished": self.finished, "artifact": self.artifact}
+        if with_results: d["results"] = self.results
+        return d
+
+
+class JobManager:
+    """
+    Bounded background job runner.
+    Submitting a job whose key matches a queued/running job returns that job
+    instead of starting a second one (double-clicks don't double the work).
+    """
+    MAX_WORKERS = 2
+    KEEP_FINISHED = 50
+    EMIT_INTERVAL = 0.5  # Progress frames per job are throttled to this
+
+    _lock = threading.Lock()
+    _ids = itertools.count(1)
+    _jobs = OrderedDict()
+    _active = {}  # key -> Job
+    _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+    _emit = None  # fn(event, payload), e.g. a LiveHub publish to the job:<id> view
+
+    @staticmethod
+    def set_emitter(fn):
+        JobManager._emit = fn
+
+    @staticmethod
+    def submit(kind, key, fn):
+        """fn(job) runs on the pool. Returns (job, created)."""
+        key = (kind,) + tuple(key)
+        with JobManager._lock:
+            running = JobManager._active.get(key)
+            if running:
+                return running, False
+            job = Job(f"{kind}-{next(JobManager._ids)}", kind, key)
+            JobManager._jobs[job.id] = job
+            JobManager._active[key] = job
+            while len(JobManager._jobs) > JobManager.KEEP_FINISHED:
+                oldest = next(iter(JobManager._jobs.values()))
+                if oldest.status in ("queued", "running"): break
+                JobManager._jobs.popitem(last=False)
+        JobManager._pool.submit(JobManager._run, job, fn)
+        return job, True
+
+    @staticmethod
+    def get(job_id):
+        return JobManager._jobs.get(job_id)
+
+    @staticmethod
+    def _run(job, fn):
+        job.status = "running"
+        JobManager._publish(job, force=True)
+        try:
+            fn(job)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            with JobManager._lock:
+                JobManager._active.pop(job.key, None)
+            JobManager._publish(job, force=True)
+
+    @staticmethod
+    def _publish(job, force=False):
+        emit = JobManager._emit
+        if emit is None: return
+        now = time.monotonic()
+        if not force and now - job._last_emit < JobManager.EMIT_INTERVAL: return
+        job._last_emit = now
+        fresh = job.results[job._sent:]
+        job._sent = len(job.results)
+        try:
+            emit('job_progress', dict(job.to_dict(), results=fresh))
+        except Exception:
+            pass
@@ -0,0 +1,289 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from flask import request
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from core import metrics
+from core.database import db, Device
+
+VIEWS = ('all', 'system', 'log', 'alerts', 'anomalies', 'forecast')  # Fleet-wide views
+SCOPED = ('device', 'subtree', 'site', 'group', 'job')  # '<kind>:<device id>' ('group:<device_type>', 'job:<job id>')
+_seq = itertools.count()
+
+
+class Outbox:
+    """
+    Frames waiting for one client. Keyed entries (device states) are replaced in
+    place, so a client that falls behind receives the latest state once instead
+    of every intermediate one; unkeyed entries (log lines) drop oldest when full.
+    """
+
+    def __init__(self, sid, maxsize):
+        self.sid = sid
+        self.maxsize = maxsize
+        self.rooms = set()
+        self.pending = OrderedDict()  # key -> [event, payload]
+        self.in_flight = 0.0  # monotonic send time of the unacknowledged frame (0 = none)
+
+    def put(self, key, event_name, payload):
+        if key is not None:
+            slot = self.pending.get(key)
+            if slot is not None:
+                slot[1] = payload
+                metrics.LIVE_DROPPED.inc(1, "superseded")
+                return
+        else:
+            key = next(_seq)
+        if len(self.pending) >= self.maxsize:
+            self.pending.popitem(last=False)
+            metrics.LIVE_DROPPED.inc(1, "overflow")
+        self.pending[key] = [event_name, payload]
+
+    def take(self, n):
+        return [self.pending.popitem(last=False)[1] for _ in range(min(n, len(self.pending)))]
+
+
+class LiveHub:
+    """
+    Socket.IO fan-out by subscription. Clients join views ('all', 'system', 'log',
+    'alerts', 'anomalies', 'forecast', 'device:<id>', 'subtree:<id>', 'site:<root id>',
+    'group:<type>', 'job:<job id>') and only receive updates for those. Each client has a bounded
+    Outbox drained by one sender thread as a batched 'live' frame; the next frame
+    waits for the client's ack (or ACK_TIMEOUT), so a slow tab gets fewer,
+    coalesced frames instead of an ever-growing server-side queue.
+    """
+    FLUSH_INTERVAL = 0.1
+    BATCH = 500
+    MAX_PENDING = 5000
+    MAX_VIEWS = 2000  # Per client
+    ACK_TIMEOUT = 10
+    _cond = threading.Condition()
+    _socketio = None
+    _clients = {}  # sid -> Outbox
+    _rooms = {}  # view -> set(sid)
+    _ready = set()  # sids with pending frames
+    _tree = None  # dev_id -> views a device update belongs to; rebuilt lazily, dropped by the ORM hooks
+    _thread = None
+
+    @classmethod
+    def init_app(cls, socketio):
+        cls._socketio = socketio
+
+        @socketio.on('connect')
+        def _connect(auth=None):
+            if not current_user.is_authenticated:
+                return False  # Live views carry device and job data: logged-in sessions only
+            cls.connect(request.sid)
+
+        @socketio.on('disconnect')
+        def _disconnect(*args):
+            cls.disconnect(request.sid)
+
+        @socketio.on('subscribe')
+        def _subscribe(data):
+            return {'views': cls.subscribe(request.sid, (data or {}).get('views', []))}
+
+        @socketio.on('unsubscribe')
+        def _unsubscribe(data):
+            return {'views': cls.unsubscribe(request.sid, (data or {}).get('views', []))}
+
+        if cls._thread is None:
+            cls._thread = threading.Thread(target=cls._run, daemon=True, name="rtm-live")
+            cls._thread.start()
+
+    # --- CLIENTS ---
+    @classmethod
+    def connect(cls, sid):
+        with cls._cond:
+            cls._clients[sid] = Outbox(sid, cls.MAX_PENDING)
+
+    @classmethod
+    def disconnect(cls, sid):
+        with cls._cond:
+            box = cls._clients.pop(sid, None)
+            cls._ready.discard(sid)
+            if box: cls._leave(sid, box.rooms)
+
+    @classmethod
+    def is_connected(cls, sid):
+        return sid in cls._clients
+
+    @staticmethod
+    def _valid(view):
+        if view in VIEWS: return True
+        kind, _, arg = str(view).partition(':')
+        if kind in ('group', 'job'): return bool(arg)
+        return kind in SCOPED and arg.isdigit()
+
+    @classmethod
+    def subscribe(cls, sid, views):
+        """Joins the valid views; returns everything the client now watches."""
+        with cls._cond:
+            box = cls._clients.get(sid)
+            if box is None: return []
+            for view in views:
+                if len(box.rooms) >= cls.MAX_VIEWS: break
+                if not cls._valid(view): continue
+                box.rooms.add(view)
+                cls._rooms.setdefault(view, set()).add(sid)
+            return sorted(box.rooms)
+
+    @classmethod
+    def unsubscribe(cls, sid, views):
+        with cls._cond:
+            box = cls._clients.get(sid)
+            if box is None: return []
+            views = box.rooms.intersection(views)
+            box.rooms -= views
+            cls._leave(sid, views)
+            return sorted(box.rooms)
+
+    @classmethod
+    def _leave(cls, sid, views):
+        for view in views:
+            members = cls._rooms.get(view)
+            if members is None: continue
+            members.discard(sid)
+            if not members: del cls._rooms[view]
+
+    @classmethod
+    def watching(cls, view):
+        """True when at least one client subscribed to `view` (producers skip work nobody looks at)."""
+        return bool(cls._rooms.get(view))
+
+    # --- PUBLISHING ---
+    @classmethod
+    def _build_tree(cls):
+        """Views per device: itself, its group, every uplink ancestor's subtree and its site (the root)."""
+        rows = db.session.query(Device.id, Device.uplink_device_id, Device.device_type).all()
+        parent = {dev_id: up for dev_id, up, _ in rows}
+        chain = {}  # dev_id -> (dev_id, uplink, ..., root)
+        for dev_id in parent:
+            path, cur = [], dev_id
+            while cur in parent and cur not in chain and cur not in path:
+                path.append(cur)
+                cur = parent[cur]
+            tail = chain.get(cur, ())
+            for d in reversed(path):
+                tail = (d,) + tail
+                chain[d] = tail
+        tree = {}
+        for dev_id, _, dtype in rows:
+            views = ['all', f'device:{dev_id}', f'site:{chain[dev_id][-1]}']
+            views += [f'subtree:{a}' for a in chain[dev_id]]
+            if dtype: views.append(f'group:{dtype}')
+            tree[dev_id] = tuple(views)
+        cls._tree = tree
+        return tree
+
+    @classmethod
+    def invalidate(cls):
+        cls._tree = None
+
+    @classmethod
+    def publish_devices(cls, updates):
+        """device_update payloads (dicts with 'id') to every client watching a view that contains the device."""
+        if not cls._clients: return
+        tree = cls._tree if cls._tree is not None else cls._build_tree()
+        with cls._cond:
+            rooms, clients = cls._rooms, cls._clients
+            for u in updates:
+                targets = set()
+                for view in tree.get(u['id'], ('all', f"device:{u['id']}")):
+                    members = rooms.get(view)
+                    if members: targets.update(members)
+                for sid in targets:
+                    clients[sid].put(('device_update', u['id']), 'device_update', u)
+                cls._ready.update(targets)
+            cls._cond.notify()
+
+    @classmethod
+    def publish(cls, view, event_name, payload, key=None):
+        """One event to the clients watching `view`; `key` makes newer payloads replace unsent older ones."""
+        with cls._cond:
+            members = cls._rooms.get(view)
+            if not members: return
+            for sid in members:
+                cls._clients[sid].put(key, event_name, payload)
+            cls._ready.update(members)
+            cls._cond.notify()
+
+    @classmethod
+    def send(cls, sid, event_name, payload, key=None):
+        """One event to one client (terminal sessions)."""
+        with cls._cond:
+            box = cls._clients.get(sid)
+            if box is None: return
+            box.put(key, event_name, payload)
+            cls._ready.add(sid)
+            cls._cond.notify()
+
+    # --- SENDER ---
+    @classmethod
+    def _run(cls):
+        while True:
+            with cls._cond:
+                while not cls._ready:
+                    cls._cond.wait()
+            time.sleep(cls.FLUSH_INTERVAL)  # Let updates of the same moment coalesce into one frame
+            try:
+                cls._flush()
+            except Exception as e:
+                metrics.MONITOR_ERRORS.inc(1, "live")
+                print(f"[live] {e.__class__.__name__}: {e}")
+
+    @classmethod
+    def _flush(cls):
+        now = time.monotonic()
+        frames = []
+        with cls._cond:
+            for sid in list(cls._ready):
+                box = cls._clients.get(sid)
+                if box is None or not box.pending:
+                    cls._ready.discard(sid)
+                    continue
+                if box.in_flight and now - box.in_flight < cls.ACK_TIMEOUT:
+                    continue  # Still busy with the previous frame: keep coalescing
+                frames.append((sid, box.take(cls.BATCH)))
+                box.in_flight = now
+                if not box.pending: cls._ready.discard(sid)
+        for sid, batch in frames:
+            cls._socketio.emit('live', batch, to=sid, callback=lambda *_, sid=sid, sent=now: cls._acked(sid, sent))
+
+    @classmethod
+    def _acked(cls, sid, sent):
+        metrics.LIVE_ACK.observe(time.monotonic() - sent)
+        with cls._cond:
+            box = cls._clients.get(sid)
+            if box is None or box.in_flight != sent: return
+            box.in_flight = 0.0
+            if box.pending:
+                cls._ready.add(sid)
+                cls._cond.notify()
+
+    @classmethod
+    def drain(cls, timeout=5.0):
+        """Waits until every outbox is empty and acknowledged (benchmarks, shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if not any(box.pending or now - box.in_flight < cls.ACK_TIMEOUT for box in list(cls._clients.values())):
+                return True
+            time.sleep(cls.FLUSH_INTERVAL / 2)
+        return False
+
+
+# --- ORM HOOKS ---
+@event.listens_for(Device, 'after_insert')
+@event.listens_for(Device, 'after_delete')
+def _on_device_added_or_removed(mapper, connection, target):
+    LiveHub.invalidate()
+
+
+@event.listens_for(Device, 'after_update')
+def _on_device_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if attrs.uplink_device_id.history.has_changes() or attrs.device_type.history.has_changes():
+        LiveHub.invalidate()
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from core import metrics
+
+
+class _Buckets:
+    """
+    Token buckets keyed by IP or username, held as compact lists:
+    [tokens, last_refill, failures, blocked_until].
+    Entries that are back to full with no penalty carry no information and are evicted;
+    the LRU cap bounds memory when someone sprays random usernames.
+    """
+    MAX_KEYS = 20000
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.rate = refill_per_sec
+        self._d = OrderedDict()
+
+    def _entry(self, key, now):
+        e = self._d.get(key)
+        if e is None:
+            e = self._d[key] = [float(self.capacity), now, 0, 0.0]
+            if len(self._d) > self.MAX_KEYS:
+                self.prune(now)
+                while len(self._d) > self.MAX_KEYS:
+                    self._d.popitem(last=False)
+        else:
+            e[0] = min(self.capacity, e[0] + (now - e[1]) * self.rate)
+            e[1] = now
+            self._d.move_to_end(key)
+        return e
+
+    def take(self, key, now):
+        """Consumes one token. Returns seconds to wait (0 = allowed)."""
+        e = self._entry(key, now)
+        if e[3] > now:
+            return e[3] - now
+        if e[0] < 1:
+            return (1 - e[0]) / self.rate
+        e[0] -= 1
+        return 0.0
+
+    def fail(self, key, now, base, cap):
+        """Progressive delay: base, 2x base, 4x base ... up to cap."""
+        e = self._entry(key, now)
+        e[2] += 1
+        e[3] = now + min(cap, base * 2 ** (e[2] - 1))
+
+    def reset(self, key):
+        self._d.pop(key, None)
+
+    def prune(self, now):
+        for key in [k for k, e in self._d.items()
+                    if e[3] <= now and e[0] + (now - e[1]) * self.rate >= self.capacity and
+                    now - e[1] > LoginGuard.FAIL_MEMORY_SEC]:
+            del self._d[key]
+
+
+class LoginGuard:
+    """
+    Throttles login attempts before any bcrypt work is done.
+    Per-IP and per-username token buckets + growing lockouts after failures;
+    hash checks run on a small fixed pool with a bounded backlog so a login flood
+    can never take more than HASH_WORKERS cores away from the ping engine.
+    """
+    IP_BURST, IP_RATE = 10, 10 / 60.0  # 10 attempts, then 10/min
+    USER_BURST, USER_RATE = 5, 5 / 300.0  # 5 attempts, then 1/min per account
+    FAIL_BASE_SEC = 1.0
+    FAIL_MAX_SEC = 300.0
+    FAIL_MEMORY_SEC = 900  # Failure history is forgotten after 15 min of quiet
+    HASH_WORKERS = max(1, (os.cpu_count() or 2) // 4)
+    HASH_BACKLOG = HASH_WORKERS * 4
+    HASH_WAIT_SEC = 10
+
+    _lock = threading.Lock()
+    _ips = _Buckets(IP_BURST, IP_RATE)
+    _users = _Buckets(USER_BURST, USER_RATE)
+    _pool = None
+    _slots = threading.BoundedSemaphore(HASH_BACKLOG)
+    _last_prune = 0.0
+    _dummy_hash = None
+
+    @classmethod
+    def allow(cls, ip, username):
+        """Returns (allowed, retry_after_seconds). Consumes a token from both buckets."""
+        now = time.monotonic()
+        user_key = (username or "").strip().lower()
+        with cls._lock:
+            if now - cls._last_prune > 60:
+                cls._ips.prune(now)
+                cls._users.prune(now)
+                cls._last_prune = now
+            wait = cls._ips.take(ip, now)
+            if not wait and user_key:
+                wait = cls._users.take(user_key, now)
+        if wait:
+            metrics.LOGIN_ATTEMPTS.inc(1, "throttled")
+            return False, int(wait) + 1
+        return True, 0
+
+    @classmethod
+    def _no_such_user(cls, password):
+        # Same bcrypt cost as a real check, so response time doesn't reveal which usernames exist
+        if cls._dummy_hash is None:
+            cls._dummy_hash = bcrypt.hashpw(b"rtm-dummy", bcrypt.gensalt())
+        bcrypt.checkpw((password or "").encode('utf-8'), cls._dummy_hash)
+        return False
+
+    @classmethod
+    def check_password(cls, user, password):
+        """
+        Runs user.check_password on the bounded hash pool (a dummy hash when user is None).
+        Returns True/False, or None when the pool is saturated (caller should answer 'busy').
+        """
+        if not cls._slots.acquire(blocking=False):
+            metrics.LOGIN_ATTEMPTS.inc(1, "busy")
+            return None
+        try:
+            with cls._lock:
+                if cls._pool is None:
+                    cls._pool = ThreadPoolExecutor(max_workers=cls.HASH_WORKERS, thread_name_prefix="rtm-auth")
+            check = user.check_password if user is not None else cls._no_such_user
+            return bool(cls._pool.submit(check, password).result(timeout=cls.HASH_WAIT_SEC))
+        except Exception:
+            return None
+        finally:
+            cls._slots.release()
+
+    @classmethod
+    def record(cls, ip, username, success):
+        now = time.monotonic()
+        user_key = (username or "").strip().lower()
+        with cls._lock:
+            if success:
+                cls._users.reset(user_key)  # IP bucket keeps draining: one valid account must not unlock a flood
+            else:
+                cls._ips.fail(ip, now, cls.FAIL_BASE_SEC, cls.FAIL_MAX_SEC)
+                if user_key: cls._users.fail(user_key, now, cls.FAIL_BASE_SEC, cls.FAIL_MAX_SEC)
+        metrics.LOGIN_ATTEMPTS.inc(1, "success" if success else "failure")
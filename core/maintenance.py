@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config import Config
+from core.database import db, Setting
+from core import metrics
+
+
+class MaintenanceManager:
+    """
+    Background retention + SQLite housekeeping.
+    Deletes run in small batches with a pause in between so the ping engine
+    never waits long on the write lock; VACUUM/ANALYZE work runs in the daily
+    quiet window (maintenance_hour setting).
+    """
+    BATCH_ROWS = 500
+    BATCH_PAUSE_SEC = 0.2
+    RETENTION_EVERY_SEC = 3600
+    CHECK_EVERY_SEC = 300
+    VACUUM_PAGES = 2000  # Pages released per incremental_vacuum step
+
+    # table -> (timestamp column, setting key, default days); registered by the modules owning the tables
+    _policies = {}
+    _nightly = []  # fn(app) hooks run once per quiet window (e.g. device config backups)
+    _hourly = []  # fn(app) hooks run with every retention pass (e.g. trend forecasts)
+    _lock = threading.Lock()
+    _last = {"retention": None, "housekeeping": None, "deleted": {}, "error": None}
+
+    @classmethod
+    def register_policy(cls, table, column, setting_key, default_days):
+        cls._policies[table] = (column, setting_key, default_days)
+
+    @classmethod
+    def register_nightly(cls, fn):
+        cls._nightly.append(fn)
+
+    @classmethod
+    def register_hourly(cls, fn):
+        cls._hourly.append(fn)
+
+    @classmethod
+    def _is_sqlite(cls):
+        return db.engine.dialect.name == "sqlite"
+
+    # --- RETENTION ---
+    @classmethod
+    def _purge_table(cls, table, column, cutoff):
+        """Batched delete of rows older than `cutoff`. Each batch is its own short transaction."""
+        total = 0
+        while True:
+            if cls._is_sqlite():
+                sql = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} < :cut LIMIT :n)"
+            else:
+                sql = f"DELETE FROM {table} WHERE ctid IN (SELECT ctid FROM {table} WHERE {column} < :cut LIMIT :n)"
+            n = db.session.execute(text(sql), {"cut": cutoff, "n": cls.BATCH_ROWS}).rowcount
+            db.session.commit()
+            total += n
+            if n < cls.BATCH_ROWS:
+                return total
+            time.sleep(cls.BATCH_PAUSE_SEC)
+
+    @classmethod
+    def _purge_backups(cls):
+        try:
+            keep_days = int(Setting.get("retention_backups_days", "30"))
+            keep_min = int(Setting.get("retention_backups_keep", "5"))
+        except ValueError:
+            keep_days, keep_min = 30, 5
+        try:
+            files = sorted((os.path.join(Config.BACKUP_DIR, f) for f in os.listdir(Config.BACKUP_DIR)
+                            if f.startswith("backup_") and f.endswith(".zip")), key=os.path.getmtime, reverse=True)
+        except OSError:
+            return 0
+        cutoff = time.time() - keep_days * 86400
+        removed = 0
+        for path in files[keep_min:]:  # Always keep the newest few, whatever their age
+            if keep_days > 0 and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    @classmethod
+    def apply_retention(cls):
+        deleted = {"backups": cls._purge_backups()}
+        for table, (column, key, default_days) in list(cls._policies.items()):
+            try:
+                days = int(Setting.get(key, str(default_days)))
+            except ValueError:
+                days = default_days
+            if days <= 0: continue  # 0 = keep forever
+            deleted[table] = cls._purge_table(table, column, datetime.utcnow() - timedelta(days=days))
+        return deleted
+
+    # --- SQLITE HOUSEKEEPING ---
+    @classmethod
+    def _pragma(cls, name):
+        return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+    @classmethod
+    def housekeeping(cls, quiet_window=False):
+        """
+        Incremental vacuum + ANALYZE. The one-off switch to INCREMENTAL mode needs a
+        full VACUUM (rewrites the whole file, blocks writers), so it waits for the quiet window.
+        """
+        if not cls._is_sqlite():
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+            return
+        if cls._pragma("auto_vacuum") != 2 and quiet_window:
+            db.session.commit()
+            with db.engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+                conn.execute(text("VACUUM"))
+        while cls._pragma("auto_vacuum") == 2 and cls._pragma("freelist_count"):
+            db.session.execute(text(f"PRAGMA incremental_vacuum({cls.VACUUM_PAGES})")).fetchall()
+            db.session.commit()
+            time.sleep(cls.BATCH_PAUSE_SEC)
+        db.session.execute(text("PRAGMA optimize")).fetchall()  # Runs ANALYZE only where stats are stale
+        db.session.commit()
+
+    @classmethod
+    def stats(cls):
+        out = {"dialect": db.engine.dialect.name, "last_retention": cls._last["retention"],
+               "last_housekeeping": cls._last["housekeeping"], "deleted": cls._last["deleted"],
+               "error": cls._last["error"]}
+        if cls._is_sqlite():
+            pages, free, page_size = cls._pragma("page_count"), cls._pragma("freelist_count"), cls._pragma("page_size")
+            out.update(size_mb=round(pages * page_size / 1048576, 2), free_mb=round(free * page_size / 1048576, 2),
+                       fragmentation_pct=round(100.0 * free / pages, 1) if pages else 0.0,
+                       auto_vacuum=("none", "full", "incremental")[cls._pragma("auto_vacuum") or 0])
+        return out
+
+    # --- SCHEDULER ---
+    @classmethod
+    def run_once(cls, app, housekeeping=False, quiet_window=False):
+        """
+        One maintenance pass (also used by the settings page 'Run now' button, which
+        is never in the quiet window: no full VACUUM outside it).
+        """
+        if not cls._lock.acquire(blocking=False):
+            return False  # Already running
+        try:
+            with app.app_context():
+                try:
+                    cls._last["deleted"] = cls.apply_retention()
+                    cls._last["retention"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    if housekeeping:
+                        cls.housekeeping(quiet_window)
+                        cls._last["housekeeping"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    cls._last["error"] = None
+                except Exception as e:
+                    db.session.rollback()
+                    cls._last["error"] = f"{e.__class__.__name__}: {e}"
+                    metrics.MONITOR_ERRORS.inc(1, "maintenance")
+                    print(f"[maintenance] {cls._last['error']}")
+            return True
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def run_forever(cls, app):
+        last_day, next_retention = None, 0.0
+        while True:
+            now = datetime.now()
+            with app.app_context():
+                try:
+                    hour = int(Setting.get("maintenance_hour", "3"))
+                except ValueError:
+                    hour = 3
+            in_window = now.hour == hour and last_day != now.date()
+            if in_window or time.monotonic() >= next_retention:
+                cls.run_once(app, housekeeping=in_window, quiet_window=in_window)
+                next_retention = time.monotonic() + cls.RETENTION_EVERY_SEC
+                hooks = [('hourly', fn) for fn in cls._hourly]
+                if in_window:
+                    last_day = now.date()
+                    hooks += [('nightly', fn) for fn in cls._nightly]
+                for kind, fn in hooks:
+                    try:
+                        fn(app)
+                    except Exception as e:
+                        metrics.MONITOR_ERRORS.inc(1, "maintenance")
+                        print(f"[maintenance] {kind} {getattr(fn, '__name__', fn)}: {e}")
+            time.sleep(cls.CHECK_EVERY_SEC)
@@ -0,0 +1,285 @@
+"""
+Tiny in-process metrics registry rendered in Prometheus text format.
+Hot-path cost is one lock + one add (counters) or one bisect (histograms).
+"""
+import bisect
+import hmac
+import threading
+import time
+from flask import Response, request, g
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fmt_labels(names, values, extra=None):
+        pairs = list(zip(names, values))
+        if extra: pairs.append(extra)
+        if not pairs: return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.TYPE}"]
+        out.extend(self._samples())
+        return out
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self._values = {}
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name, doc, labels=(), fn=None):
+        super().__init__(name, doc, labels)
+        self._values = {}
+        self._fn = fn  # Callable evaluated at scrape time (queue depths etc.)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self):
+        if self._fn is not None:
+            try:
+                return [f"{self.name} {self._fn()}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 3)
+            s[i] += 1  # Index len(buckets) = +Inf overflow
+            s[-2] += value
+            s[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = []
+        for labels, s in items:
+            acc = 0
+            for b, n in zip(self.buckets + ("+Inf",), s[:len(self.buckets) + 1]):
+                acc += n
+                out.append(f"{self.name}_bucket{self._fmt_labels(self.labelnames, labels, ('le', b))} {acc}")
+            lbl = self._fmt_labels(self.labelnames, labels)
+            out.append(f"{self.name}_sum{lbl} {round(s[-2], 6)}")
+            out.append(f"{self.name}_count{lbl} {s[-1]}")
+        return out
+
+
+class _Timer:
+    __slots__ = ('h', 'labels', 't0')
+
+    def __init__(self, h, labels):
+        self.h, self.labels = h, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, cls, name, *args, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, *args, **kw)
+            return m
+
+    def counter(self, name, doc, labels=()):
+        return self._get_or_add(Counter, name, doc, labels)
+
+    def gauge(self, name, doc, labels=(), fn=None):
+        return self._get_or_add(Gauge, name, doc, labels, fn=fn)
+
+    def histogram(self, name, doc, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._get_or_add(Histogram, name, doc, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- ENGINE ---
+PROBE_LATENCY = REGISTRY.histogram("rtm_probe_rtt_seconds", "Round trip time of successful probes")
+PROBE_RESULTS = REGISTRY.counter("rtm_probe_results_total", "Probe results by outcome", ("outcome",))
+CYCLE_DURATION = REGISTRY.histogram("rtm_cycle_duration_seconds", "Wall time of one ping engine cycle",
+                                    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+PROBE_TIMEOUT = REGISTRY.histogram("rtm_probe_timeout_seconds", "Timeout applied per probe (adaptive or fixed)")
+SCHEDULER_LAG = REGISTRY.histogram("rtm_scheduler_lag_seconds", "How late a cycle started versus its schedule")
+STATE_CHANGES = REGISTRY.counter("rtm_state_changes_total", "Device state transitions", ("state",))
+MONITOR_ERRORS = REGISTRY.counter("rtm_monitor_errors_total", "Exceptions swallowed by background loops", ("loop",))
+
+ANOMALY_PASS = REGISTRY.histogram("rtm_anomaly_pass_seconds", "One vectorised latency baseline/anomaly pass",
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+ANOMALIES = REGISTRY.counter("rtm_latency_anomaly_events_total", "Latency anomalies raised and cleared", ("kind",))
+
+PUSH_MESSAGES = REGISTRY.counter("rtm_push_messages_total", "Syslog/trap datagrams by outcome", ("source", "result"))
+
+# --- EVENT BUS ---
+BUS_LAG = REGISTRY.histogram("rtm_bus_lag_seconds", "Age of the oldest event in a batch when its consumer picks it up",
+                             ("consumer",))
+BUS_DEPTH = REGISTRY.gauge("rtm_bus_queue_depth", "Events waiting per consumer", ("consumer",))
+BUS_DROPPED = REGISTRY.counter("rtm_bus_dropped_total", "Events discarded by drop_oldest/coalesce overflow", ("consumer",))
+BUS_BLOCKED = REGISTRY.histogram("rtm_bus_publish_blocked_seconds", "Time publishers waited on a full blocking queue",
+                                 ("consumer",))
+
+# --- DATABASE ---
+DB_COMMIT = REGISTRY.histogram("rtm_db_commit_seconds", "Session commit (flush + COMMIT) time")
+
+# --- CACHES ---
+CACHE_REQUESTS = REGISTRY.counter("rtm_cache_requests_total", "Cache lookups", ("cache", "result"))
+
+# --- AUTH ---
+LOGIN_ATTEMPTS = REGISTRY.counter("rtm_login_attempts_total", "Login attempts by outcome", ("result",))
+
+# --- SOCKET.IO / HTTP ---
+SOCKET_EMITS = REGISTRY.counter("rtm_socketio_emits_total", "Socket.IO frames emitted", ("event",))
+HTTP_LATENCY = REGISTRY.histogram("rtm_http_request_seconds", "HTTP request latency", ("endpoint", "method"))
+LIVE_DROPPED = REGISTRY.counter("rtm_live_dropped_total", "Client-bound updates never sent (superseded or overflow)",
+                                ("reason",))
+LIVE_ACK = REGISTRY.histogram("rtm_live_ack_seconds", "Time until a client acknowledged a live frame")
+
+
+# --- STARTUP ---
+STARTUP = REGISTRY.gauge("rtm_startup_seconds", "Seconds from launch to each startup milestone", ("phase",))
+_launched = time.perf_counter()
+
+
+def startup_began(t0):
+    """Entry points pass the perf_counter() taken before their own imports."""
+    global _launched
+    _launched = t0
+
+
+def startup_mark(phase):
+    """Records a milestone once (first call wins) and logs it."""
+    if (phase,) in STARTUP._values: return
+    elapsed = time.perf_counter() - _launched
+    STARTUP.set(round(elapsed, 4), phase)
+    print(f">>> Startup: {phase} after {elapsed * 1000:.0f} ms")
+
+
+def cache_hit(cache):
+    CACHE_REQUESTS.inc(1, cache, "hit")
+
+
+def cache_miss(cache):
+    CACHE_REQUESTS.inc(1, cache, "miss")
+
+
+# --- INSTALLERS ---
+def instrument_db(db):
+    from sqlalchemy import event
+    local = threading.local()
+
+    def _before(session):
+        local.t0 = time.perf_counter()
+
+    def _after(session):
+        t0 = getattr(local, 't0', None)
+        if t0 is not None:
+            DB_COMMIT.observe(time.perf_counter() - t0)
+            local.t0 = None
+
+    event.listen(db.session, 'before_commit', _before)
+    event.listen(db.session, 'after_commit', _after)
+
+
+def instrument_socketio(socketio):
+    emit = socketio.emit
+
+    def counted_emit(event_name, *args, **kw):
+        SOCKET_EMITS.inc(1, event_name)
+        return emit(event_name, *args, **kw)
+
+    socketio.emit = counted_emit
+
+
+def install(app):
+    """Per-route latency hooks + the /metrics endpoint."""
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.teardown_request
+    def _metrics_stop(exc=None):
+        t0 = g.pop('_metrics_t0', None)
+        if t0 is not None:
+            HTTP_LATENCY.observe(time.perf_counter() - t0, request.endpoint or "unmatched", request.method)
+
+    @app.route('/metrics')
+    def metrics():
+        """Logged-in users, or scrapers sending 'Authorization: Bearer <metrics_token setting>'."""
+        from flask_login import current_user
+        from core.database import Setting  # core.database imports this module
+        if not current_user.is_authenticated:
+            token = Setting.get("metrics_token", "")
+            sent = request.headers.get('Authorization', '')
+            if not token or not hmac.compare_digest(sent.encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+                return Response("Unauthorized\n", status=401, mimetype='text/plain',
+                                headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,236 @@
+import csv
+import html
+import io
+import os
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func
+from config import Config
+from core.database import db, Device, StateTransition, LatencyRollup
+
+REPORT_DIR = os.path.join(Config.DATA_DIR, "reports")
+KEEP_REPORTS_SEC = 7 * 86400
+CHUNK = 500  # Devices per query/compute batch: bounds memory whatever the fleet size
+GROUPS = ('device', 'site')
+FORMATS = ('csv', 'html')
+PERCENTILES = (50, 95, 99)
+
+# Availability: DEGRADED still answers, so it counts as up time
+_UP, _DOWN, _UNKNOWN = 0, 1, 2
+_CODE = {'UP': _UP, 'DEGRADED': _UP, 'DOWN': _DOWN}
+
+COLUMNS = ['name', 'ip', 'site', 'devices', 'uptime_pct', 'downtime_min', 'outages', 'mttr_min',
+           'probes', 'probe_ok_pct', 'rtt_avg_ms', 'rtt_max_ms'] + [f'rtt_p{p}_ms' for p in PERCENTILES]
+
+
+def parse_period(month, months=1):
+    """'YYYY-MM' + number of months -> (start, end) naive UTC datetimes."""
+    start = datetime.strptime(month, "%Y-%m")
+    months = max(1, min(24, int(months)))
+    y, m = divmod(start.month - 1 + months, 12)
+    return start, start.replace(year=start.year + y, month=m + 1)
+
+
+def _sites(devices):
+    """Site = root of the uplink tree a device hangs from (itself when it has no uplink)."""
+    by_id = {d.id: d for d in devices}
+    root = {}
+    for d in devices:
+        path, cur = [], d
+        while cur is not None and cur.id not in root and cur.id not in path:
+            path.append(cur.id)
+            cur = by_id.get(cur.uplink_device_id)
+        top = root[cur.id] if cur is not None and cur.id in root else path[-1]
+        for dev_id in path: root[dev_id] = top
+    return {dev_id: by_id[r].name for dev_id, r in root.items()}
+
+
+def _percentiles(hist, edges, rtt_max):
+    """Upper bucket edge reaching each percentile (overflow bucket -> observed max)."""
+    total = hist.sum(axis=1)
+    cum = hist.cumsum(axis=1)
+    out = []
+    for p in PERCENTILES:
+        idx = (cum < (total * p / 100.0)[:, None]).sum(axis=1)
+        val = np.where(idx < len(edges), edges[np.minimum(idx, len(edges) - 1)], rtt_max)
+        out.append(np.where(total > 0, val, np.nan))
+    return out
+
+
+def _edge_states(ids, column, agg, cond):
+    """{device_id: column} of the first/last transition on one side of `start`."""
+    edge = (db.session.query(StateTransition.device_id, agg(StateTransition.ts).label('ts'))
+            .filter(StateTransition.device_id.in_(ids), cond)
+            .group_by(StateTransition.device_id).subquery())
+    return dict(db.session.query(StateTransition.device_id, column)
+                .join(edge, (StateTransition.device_id == edge.c.device_id) & (StateTransition.ts == edge.c.ts)).all())
+
+
+def _chunk_stats(ids, current, start, end):
+    """Vectorised availability + latency figures for one batch of device ids (arrays indexed like `ids`)."""
+    n = len(ids)
+    pos = {dev_id: i for i, dev_id in enumerate(ids)}
+    t0, t1 = start.timestamp(), end.timestamp()
+
+    # State in force at period start: last transition before it, else the 'from' side of the
+    # first one after it, else (never changed since history began) the current state
+    prior = _edge_states(ids, StateTransition.to_state, func.max, StateTransition.ts < start)
+    after = _edge_states(ids, StateTransition.from_state, func.min, StateTransition.ts >= start)
+
+    dev = list(range(n))
+    ts = [t0] * n
+    st = [_CODE.get(prior.get(d) or after.get(d) or current[i], _UNKNOWN) for i, d in enumerate(ids)]
+    for dev_id, t, s in (db.session.query(StateTransition.device_id, StateTransition.ts, StateTransition.to_state)
+                         .filter(StateTransition.device_id.in_(ids), StateTransition.ts >= start,
+                                 StateTransition.ts < end)):
+        dev.append(pos[dev_id])
+        ts.append(t.timestamp())
+        st.append(_CODE.get(s, _UNKNOWN))
+
+    dev, ts, st = np.array(dev), np.array(ts), np.array(st)
+    order = np.lexsort((ts, dev))
+    dev, ts, st = dev[order], ts[order], st[order]
+    last_of_dev = np.append(dev[1:] != dev[:-1], True)
+    first_of_dev = np.insert(dev[1:] != dev[:-1], 0, True)
+    dur = np.where(last_of_dev, t1, np.append(ts[1:], t1)) - ts
+
+    up_s = np.bincount(dev, weights=dur * (st == _UP), minlength=n)
+    down_s = np.bincount(dev, weights=dur * (st == _DOWN), minlength=n)
+    prev = np.insert(st[:-1], 0, _UNKNOWN)
+    outages = np.bincount(dev, weights=(st == _DOWN) & (prev != _DOWN) & ~first_of_dev, minlength=n)
+    # Repair time: DOWN spans that ended inside the period (consecutive DOWN rows merge into one outage)
+    nxt = np.append(st[1:], _UNKNOWN)
+    closed = (st == _DOWN) & ~last_of_dev & (nxt != _DOWN)
+    opens = (st == _DOWN) & ((prev != _DOWN) | first_of_dev)
+    span_start = ts[np.maximum.accumulate(np.where(opens, np.arange(len(st)), 0))]
+    repair = np.bincount(dev, weights=np.where(closed, ts + dur - span_start, 0), minlength=n)
+    repairs = np.bincount(dev, weights=closed, minlength=n)
+
+    buckets = len(LatencyRollup.LATENCY_BUCKETS_MS) + 1
+    probes, ok, rtt_sum = np.zeros(n), np.zeros(n), np.zeros(n)
+    rtt_max = np.full(n, np.nan)
+    hist = np.zeros((n, buckets))
+    rows = (db.session.query(LatencyRollup.device_id, LatencyRollup.samples, LatencyRollup.ok, LatencyRollup.rtt_sum,
+                             LatencyRollup.rtt_max, LatencyRollup.hist)
+            .filter(LatencyRollup.device_id.in_(ids), LatencyRollup.hour >= start, LatencyRollup.hour < end).all())
+    if rows:
+        idx = np.array([pos[r[0]] for r in rows])
+        np.add.at(probes, idx, [r[1] or 0 for r in rows])
+        np.add.at(ok, idx, [r[2] or 0 for r in rows])
+        np.add.at(rtt_sum, idx, [r[3] or 0.0 for r in rows])
+        np.fmax.at(rtt_max, idx, [r[4] if r[4] is not None else np.nan for r in rows])
+        empty = ','.join(['0'] * buckets)
+        h = np.array(','.join(r[5] or empty for r in rows).split(','), dtype=np.int64).reshape(len(rows), buckets)
+        np.add.at(hist, idx, h)
+
+    return {'up_s': up_s, 'down_s': down_s, 'outages': outages, 'repair_s': repair, 'repairs': repairs,
+            'probes': probes, 'ok': ok, 'rtt_sum': rtt_sum, 'rtt_max': rtt_max, 'hist': hist}
+
+
+def _rows(stats, names, ips, sites, counts):
+    edges = np.array(LatencyRollup.LATENCY_BUCKETS_MS, dtype=float)
+    known = stats['up_s'] + stats['down_s']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        uptime = np.where(known > 0, 100.0 * stats['up_s'] / known, np.nan)
+        mttr = np.where(stats['repairs'] > 0, stats['repair_s'] / stats['repairs'] / 60.0, np.nan)
+        ok_pct = np.where(stats['probes'] > 0, 100.0 * stats['ok'] / stats['probes'], np.nan)
+        rtt_avg = np.where(stats['ok'] > 0, stats['rtt_sum'] / stats['ok'], np.nan)
+    pcts = _percentiles(stats['hist'], edges, stats['rtt_max'])
+
+    def _num(v, digits=2):
+        return "" if np.isnan(v) else round(float(v), digits)
+
+    for i in range(len(names)):
+        yield [names[i], ips[i], sites[i], counts[i], _num(uptime[i], 3), _num(stats['down_s'][i] / 60.0),
+               int(stats['outages'][i]), _num(mttr[i]), int(stats['probes'][i]), _num(ok_pct[i]),
+               _num(rtt_avg[i]), _num(stats['rtt_max'][i])] + [_num(p[i]) for p in pcts]
+
+
+def iter_report(start, end, group='device', progress=None):
+    """Yields report rows (lists matching COLUMNS), CHUNK devices at a time."""
+    end = max(start, min(end, datetime.utcnow()))  # Current month: don't count the future
+    devices = (db.session.query(Device.id, Device.name, Device.ip, Device.uplink_device_id, Device.state)
+               .order_by(Device.id).all())
+    site_of = _sites(devices)
+    site_names = sorted(set(site_of.values()))
+    site_idx = {s: i for i, s in enumerate(site_names)}
+    totals = None
+
+    for off in range(0, len(devices), CHUNK):
+        chunk = devices[off:off + CHUNK]
+        stats = _chunk_stats([d.id for d in chunk], [d.state for d in chunk], start, end)
+        if group == 'device':
+            yield from _rows(stats, [d.name for d in chunk], [d.ip for d in chunk],
+                             [site_of[d.id] for d in chunk], [1] * len(chunk))
+        else:
+            idx = np.array([site_idx[site_of[d.id]] for d in chunk])
+            if totals is None:
+                totals = {k: (np.zeros((len(site_names),) + v.shape[1:]) if k != 'rtt_max'
+                              else np.full(len(site_names), np.nan)) for k, v in stats.items()}
+                totals['devices'] = np.zeros(len(site_names))
+            for k, v in stats.items():
+                (np.fmax if k == 'rtt_max' else np.add).at(totals[k], idx, v)
+            np.add.at(totals['devices'], idx, 1)
+        if progress: progress(min(off + CHUNK, len(devices)), len(devices))
+
+    if group == 'site' and totals is not None:
+        counts = [int(c) for c in totals.pop('devices')]
+        yield from _rows(totals, site_names, [""] * len(site_names), site_names, counts)
+
+
+def iter_csv(rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(COLUMNS)
+    for row in rows:
+        w.writerow(row)
+        if buf.tell() > 65536:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def iter_html(rows, title):
+    yield (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+           "<style>body{font-family:sans-serif;font-size:13px}table{border-collapse:collapse}"
+           "td,th{border:1px solid #ccc;padding:3px 6px;text-align:right}td:first-child{text-align:left}</style>"
+           f"</head><body><h2>{html.escape(title)}</h2><table><tr>")
+    yield "".join(f"<th>{c}</th>" for c in COLUMNS) + "</tr>\n"
+    for row in rows:
+        yield "<tr>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in row) + "</tr>\n"
+    yield "</table></body></html>\n"
+
+
+def _purge_old():
+    cutoff = time.time() - KEEP_REPORTS_SEC
+    for f in os.listdir(REPORT_DIR):
+        path = os.path.join(REPORT_DIR, f)
+        try:
+            if os.path.getmtime(path) < cutoff: os.remove(path)
+        except OSError:
+            pass
+
+
+def make_report_job(app, month, months, group, fmt):
+    """Job body for JobManager: streams the report to data/reports/<job id>.<fmt>."""
+    start, end = parse_period(month, months)
+
+    def _report(job):
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        _purge_old()
+        filename = f"sla_{group}_{month}_{months}m_{job.id}.{fmt}"
+        path = os.path.join(REPORT_DIR, filename)
+        title = f"Availability report by {group}: {start:%Y-%m-%d} - {end:%Y-%m-%d} (UTC)"
+        with app.app_context():
+            rows = iter_report(start, end, group, progress=lambda done, total: job.progress(done=done, total=total))
+            chunks = iter_csv(rows) if fmt == 'csv' else iter_html(rows, title)
+            with open(path + ".part", "w", encoding="utf-8", newline="") as f:
+                for text_chunk in chunks:
+                    f.write(text_chunk)
+            db.session.remove()
+        os.replace(path + ".part", path)
+        job.artifact = filename
+
+    return _report
@@ -1,12 +1,25 @@
+import base64
 import subprocess
 import hashlib
+import os
 import platform
+import threading
+import time
 import uuid
 from datetime import datetime
+from config import Config
+from core import metrics
 
 
 class SecurityManager:
     LICENSE_SECRET = "RTM_SUPER_SECRET_SALT_V99"
+    SEALED_PREFIX = "enc1:"
+
+    # Hardware ID can't change while running; license verdicts are re-checked every minute
+    LICENSE_CACHE_TTL = 60
+    _hw_id = None
+    _license_cache = {}  # (user_id, expires_at, license_hash) -> (expires_at, result)
+    _lock = threading.Lock()
 
     @staticmethod
     def get_system_id():
@@ -14,6 +27,12 @@ class SecurityManager:
         Robust Hardware ID Generation.
         Tries WMIC -> CPUID -> MAC Address (UUID)
         """
+        if SecurityManager._hw_id is None:
+            SecurityManager._hw_id = SecurityManager._read_system_id()
+        return SecurityManager._hw_id
+
+    @staticmethod
+    def _read_system_id():
         serial = ""
         try:
             # Method 1: Windows WMIC (Primary)
@@ -43,6 +62,20 @@ class SecurityManager:
         if not user or not user.expires_at or not user.license_hash:
             return False, "License Not Found."
 
+        key = (user.id, user.expires_at, user.license_hash)
+        hit = SecurityManager._license_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            metrics.cache_hit("license")
+            return hit[1]
+        metrics.cache_miss("license")
+
+        result = SecurityManager._verify_license(user)
+        with SecurityManager._lock:
+            SecurityManager._license_cache[key] = (time.monotonic() + SecurityManager.LICENSE_CACHE_TTL, result)
+        return result
+
+    @staticmethod
+    def _verify_license(user):
         # 1. Date Check
         days_left = (user.expires_at - datetime.now()).days
         if days_left < 0:
@@ -56,4 +89,42 @@ class SecurityManager:
         if user.license_hash != calculated_seal:
             return False, "CRITICAL: Hardware Mismatch or Date Tampered!"
 
-        return True, "Valid"
\ No newline at end of file
+        return True, "Valid"
+
+    # --- SECRETS AT REST ---
+    @staticmethod
+    def can_seal():
+        """Sealing needs a real app secret: the built-in default is public, so anything sealed with it is not."""
+        return Config.SECRET_FROM_ENV
+
+    @staticmethod
+    def _aead():
+        from cryptography.hazmat.primitives import hashes  # Only needed once credentials are stored
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"rtm-seal").derive(
+            Config.SECRET_KEY.encode('utf-8'))
+        return AESGCM(key)
+
+    @staticmethod
+    def seal(text):
+        """
+        Encrypts a credential for the database (SSH password, collector secrets) with
+        AES-256-GCM under a key derived from RTM_SECRET. ValueError while RTM_SECRET is unset.
+        """
+        if not SecurityManager.can_seal():
+            raise ValueError("Set the RTM_SECRET environment variable before storing credentials.")
+        nonce = os.urandom(12)
+        ct = SecurityManager._aead().encrypt(nonce, text.encode('utf-8'), None)
+        return SecurityManager.SEALED_PREFIX + base64.urlsafe_b64encode(nonce + ct).decode('ascii')
+
+    @staticmethod
+    def unseal(value):
+        """Plaintext of a sealed value (legacy plaintext passes through). ValueError when sealed with another secret."""
+        if not value or not value.startswith(SecurityManager.SEALED_PREFIX): return value
+        from cryptography.exceptions import InvalidTag
+        try:
+            raw = base64.urlsafe_b64decode(value[len(SecurityManager.SEALED_PREFIX):])
+            return SecurityManager._aead().decrypt(raw[:12], raw[12:], None).decode('utf-8')
+        except (ValueError, TypeError, InvalidTag):
+            raise ValueError("Sealed with a different secret (RTM_SECRET changed?)")
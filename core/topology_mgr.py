@@ -0,0 +1,181 @@
+import threading
+from collections import deque
+from sqlalchemy import event, inspect
+from core.database import db, Device
+
+
+class TopologyManager:
+    """
+    Server-side cache of the topology graph.
+    The structure (nodes, edges, layout) is rebuilt only when a device or an
+    uplink changes. Status changes are kept apart as a small delta log so the
+    map can be refreshed without re-sending the whole graph.
+    """
+    STRUCT_FIELDS = ('ip', 'name', 'device_type', 'uplink_device_id')
+    DELTA_LOG_SIZE = 5000
+
+    # Layout Grid (pixels between levels / siblings)
+    LEVEL_GAP = 150
+    NODE_GAP = 110
+
+    _lock = threading.RLock()
+    _version = 1  # Bumped on every structural change
+    _seq = 0  # Bumped on every status change
+    _graph = None  # {'version', 'nodes', 'edges'}
+    _positions = None  # {dev_id: (x, y)} for _graph['version']
+    _status = {}  # dev_id -> state
+    _deltas = deque(maxlen=DELTA_LOG_SIZE)  # (seq, dev_id, state)
+
+    # --- INVALIDATION ---
+    @staticmethod
+    def invalidate():
+        with TopologyManager._lock:
+            TopologyManager._version += 1
+            TopologyManager._graph = None
+            TopologyManager._positions = None
+
+    @staticmethod
+    def push_status(dev_id, state):
+        with TopologyManager._lock:
+            if TopologyManager._status.get(dev_id) == state:
+                return
+            TopologyManager._status[dev_id] = state
+            TopologyManager._seq += 1
+            TopologyManager._deltas.append((TopologyManager._seq, dev_id, state))
+
+    # --- GRAPH ---
+    @staticmethod
+    def etag():
+        return f"topo-{TopologyManager._version}-{TopologyManager._seq}"
+
+    @staticmethod
+    def get_graph():
+        """Returns the cached graph, rebuilding it from the DB when stale."""
+        with TopologyManager._lock:
+            if TopologyManager._graph is None:
+                TopologyManager._graph = TopologyManager._build()
+            return TopologyManager._graph
+
+    @staticmethod
+    def _build():
+        rows = db.session.query(
+            Device.id, Device.name, Device.ip, Device.device_type, Device.uplink_device_id, Device.state
+        ).all()
+
+        nodes, edges, status = [], [], {}
+        for dev_id, name, ip, dtype, uplink_id, state in rows:
+            nodes.append({"id": dev_id, "label": f"{name}\n({ip})", "group": dtype or "SWITCH"})
+            if uplink_id: edges.append({"from": uplink_id, "to": dev_id})
+            status[dev_id] = state
+
+        # Status column is authoritative at rebuild time
+        TopologyManager._status = status
+        return {"version": TopologyManager._version, "nodes": nodes, "edges": edges}
+
+    @staticmethod
+    def snapshot(with_layout=False):
+        """Full payload: cached structure + current status overlay."""
+        with TopologyManager._lock:
+            graph = TopologyManager.get_graph()
+            status = TopologyManager._status
+            nodes = [dict(n, status=status.get(n["id"], "UNKNOWN")) for n in graph["nodes"]]
+            payload = {"version": graph["version"], "seq": TopologyManager._seq, "nodes": nodes, "edges": graph["edges"]}
+            if with_layout:
+                positions = TopologyManager.get_layout()
+                for n in nodes:
+                    n["x"], n["y"] = positions.get(n["id"], (0, 0))
+                payload["layout"] = "hierarchical"
+            return payload
+
+    @staticmethod
+    def deltas(version, since):
+        """
+        Status changes after `since`.
+        Returns None when the client must reload the full graph
+        (structure changed or the delta log no longer reaches back far enough).
+        """
+        with TopologyManager._lock:
+            graph = TopologyManager.get_graph()
+            if version != graph["version"]:
+                return None
+            log = TopologyManager._deltas
+            if since > TopologyManager._seq or (since < TopologyManager._seq and log[0][0] > since + 1):
+                return None
+
+            latest = {}
+            for seq, dev_id, state in reversed(log):
+                if seq <= since: break
+                latest.setdefault(dev_id, state)
+            changes = [{"id": dev_id, "status": state} for dev_id, state in latest.items()]
+            return {"version": graph["version"], "seq": TopologyManager._seq, "changes": changes}
+
+    # --- LAYOUT ---
+    @staticmethod
+    def get_layout():
+        """Hierarchical coordinates, computed once per topology version."""
+        with TopologyManager._lock:
+            graph = TopologyManager.get_graph()
+            if TopologyManager._positions is None:
+                TopologyManager._positions = TopologyManager._compute_layout(graph)
+            return TopologyManager._positions
+
+    @staticmethod
+    def _compute_layout(graph):
+        ids = [n["id"] for n in graph["nodes"]]
+        known = set(ids)
+        children = {i: [] for i in ids}
+        has_parent = set()
+        for e in graph["edges"]:
+            if e["from"] in known:
+                children[e["from"]].append(e["to"])
+                has_parent.add(e["to"])
+
+        roots = [i for i in ids if i not in has_parent]
+        positions = {}
+        next_x = [0]
+
+        # Iterative post-order walk: leaves get consecutive slots, parents are centred above children
+        def place(root):
+            stack = [(root, 0, False)]
+            while stack:
+                node, depth, done = stack.pop()
+                if done:
+                    kids = [positions[c] for c in children[node] if positions.get(c)]
+                    if kids:
+                        x = (kids[0][0] + kids[-1][0]) / 2
+                    else:
+                        x = next_x[0] * TopologyManager.NODE_GAP
+                        next_x[0] += 1
+                    positions[node] = (x, depth * TopologyManager.LEVEL_GAP)
+                    continue
+                if node in positions: continue
+                positions[node] = None  # Mark visited (guards uplink loops)
+                stack.append((node, depth, True))
+                for c in reversed(children[node]):
+                    if c not in positions:
+                        stack.append((c, depth + 1, False))
+
+        for r in roots:
+            place(r)
+        # Nodes only reachable through an uplink loop
+        for i in ids:
+            if i not in positions:
+                place(i)
+
+        return positions
+
+
+# --- ORM HOOKS ---
+@event.listens_for(Device, 'after_insert')
+@event.listens_for(Device, 'after_delete')
+def _on_device_added_or_removed(mapper, connection, target):
+    TopologyManager.invalidate()
+
+
+@event.listens_for(Device, 'after_update')
+def _on_device_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[f].history.has_changes() for f in TopologyManager.STRUCT_FIELDS):
+        TopologyManager.invalidate()
+    elif attrs.state.history.has_changes():
+        TopologyManager.push_status(target.id, target.state)
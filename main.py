@@ -1,17 +1,25 @@
+import time
+_T0 = time.perf_counter()  # Startup milestones are measured from here (see metrics.startup_mark)
+import argparse
 import sys
+import multiprocessing
 import threading
-import time
-import webview
 import subprocess
 import platform
-import psutil
 import os
 from flask import Flask, request, jsonify
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 from config import Config
 from core.database import db, User
-from network.pinger import PingWorker
+from core import metrics
+from core.job_mgr import JobManager
+from core.live_hub import LiveHub
+from core.maintenance import MaintenanceManager
+from network.pinger import PingWorker, ShardedPingWorker
+from network.push_receiver import PushReceiver
+from web_ui.assets import Assets
 from web_ui.routes import bp as main_bp
+from web_ui.collector_routes import bp as collector_bp
 
 
 def create_app():
@@ -19,6 +27,9 @@ def create_app():
     app.config.from_object(Config)
     app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB Limit
     db.init_app(app)
+    metrics.instrument_db(db)
+    metrics.install(app)
+    Assets(app.static_folder).init_app(app)
 
     from flask_login import LoginManager
     login_manager = LoginManager()
@@ -27,9 +38,10 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(uid):
-        return User.query.get(int(uid))
+        return User.load_identity(uid)
 
     app.register_blueprint(main_bp)
+    app.register_blueprint(collector_bp)
 
     # --- SOUND UPLOAD ---
     @app.route('/upload_sound', methods=['POST'])
@@ -50,55 +62,74 @@ def create_app():
 
 app = create_app()
 socketio = SocketIO(app, async_mode="threading")
+metrics.instrument_socketio(socketio)
+LiveHub.init_app(socketio)
+# Job progress (results included) only reaches the tabs watching 'job:<id>', through their outboxes
+JobManager.set_emitter(lambda event, job: LiveHub.publish(f"job:{job['id']}", event, job))
 
 # --- REAL PING ENGINE ---
-ping_process = None
-ping_stop_event = threading.Event()
+# One terminal session per client: sid -> (ping process, stop event)
+ping_sessions = {}
 
 
-def run_real_ping(target_ip):
-    global ping_process
+def run_real_ping(target_ip, sid, stop):
     param = '-t' if platform.system().lower() == 'windows' else '-c 1000'
     cmd = ['ping', target_ip, param] if platform.system().lower() == 'windows' else ['ping', target_ip]
 
+    proc = None
     try:
-        ping_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        for line in iter(ping_process.stdout.readline, ''):
-            if ping_stop_event.is_set(): break
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        if ping_sessions.get(sid, (None, None))[1] is stop: ping_sessions[sid] = (proc, stop)
+        for line in iter(proc.stdout.readline, ''):
+            if stop.is_set() or not LiveHub.is_connected(sid): break  # Closed tab: nobody to stream to
             if line:
-                socketio.emit('ping_output', {'line': line.strip()})
-                # Auto Log Update
+                LiveHub.send(sid, 'ping_output', {'line': line.strip()})
+                # Auto Log Update (this terminal's owner only)
                 status = "UP" if "Reply" in line or "bytes=" in line else "DOWN"
                 msg = "Response OK" if status == "UP" else "Timeout/Unreachable"
-                socketio.emit('log_update', {
+                LiveHub.send(sid, 'log_update', {
                     'time': time.strftime("%H:%M:%S"), 'device': target_ip, 'status': status, 'msg': msg
                 })
     except Exception as e:
-        socketio.emit('ping_output', {'line': f"Error: {str(e)}"})
+        LiveHub.send(sid, 'ping_output', {'line': f"Error: {str(e)}"})
     finally:
-        if ping_process: ping_process.terminate()
+        if proc: proc.terminate()
+        if ping_sessions.get(sid, (None, None))[1] is stop: ping_sessions.pop(sid, None)
+
+
+def _stop_session(sid):
+    proc, stop = ping_sessions.pop(sid, (None, None))
+    if stop: stop.set()
+    if proc: proc.terminate()
 
 
 @socketio.on('start_ping')
 def handle_start_ping(data):
-    global ping_stop_event
-    ping_stop_event.clear()
-    t = threading.Thread(target=run_real_ping, args=(data.get('ip'),))
+    _stop_session(request.sid)  # One ping per terminal
+    stop = threading.Event()
+    ping_sessions[request.sid] = (None, stop)
+    t = threading.Thread(target=run_real_ping, args=(data.get('ip'), request.sid, stop))
     t.daemon = True
     t.start()
 
 
 @socketio.on('stop_ping')
 def handle_stop_ping():
-    global ping_stop_event
-    ping_stop_event.set()
-    if ping_process: ping_process.terminate()
-    emit('ping_output', {'line': '>>> STOPPED BY USER'})
+    _stop_session(request.sid)
+    LiveHub.send(request.sid, 'ping_output', {'line': '>>> STOPPED BY USER'})  # Queued behind the last output lines
 
 
 # --- REAL SYSTEM MONITOR (CPU/RAM/NET) ---
 def monitor_resources():
+    try:
+        import psutil
+    except ImportError:
+        print("[monitor_resources] psutil not installed: no CPU/RAM/NET stats")
+        return
     while True:
+        if not LiveHub.watching('system'):  # No chart open: don't sample
+            time.sleep(1)
+            continue
         try:
             # CPU & RAM
             cpu = psutil.cpu_percent(interval=1)
@@ -112,27 +143,57 @@ def monitor_resources():
             tx = round((net2.bytes_sent - net1.bytes_sent) * 8 / 1024 / 1024, 2)  # Mbps
             rx = round((net2.bytes_recv - net1.bytes_recv) * 8 / 1024 / 1024, 2)  # Mbps
 
-            socketio.emit('system_stats', {'cpu': cpu, 'ram': ram, 'tx': tx, 'rx': rx})
-        except:
-            pass
+            LiveHub.publish('system', 'system_stats', {'cpu': cpu, 'ram': ram, 'tx': tx, 'rx': rx}, key='system_stats')
+        except Exception as e:
+            metrics.MONITOR_ERRORS.inc(1, "resources")
+            print(f"[monitor_resources] {e.__class__.__name__}: {e}")
+            time.sleep(1)  # Don't spin if psutil keeps failing
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Shard workers in the frozen .exe
+    parser = argparse.ArgumentParser(description="RTM Enterprise server")
+    parser.add_argument('--headless', action='store_true', default=os.environ.get("RTM_HEADLESS") == "1",
+                        help="Web server + engines only, no desktop window (services, containers)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5050)
+    args = parser.parse_args()
+
+    metrics.startup_began(_T0)
+    metrics.startup_mark("imports")
     with app.app_context(): db.create_all()
+    metrics.startup_mark("database")
 
     # Start Background Threads
-    PingWorker(app, socketio).start()
+    if Config.PING_PROCESSES > 1:
+        worker = ShardedPingWorker(app, socketio, Config.PING_PROCESSES, state_file=Config.ENGINE_STATE_FILE)
+    else:
+        worker = PingWorker(app, socketio, state_file=Config.ENGINE_STATE_FILE)
+    worker.start()
+    if Config.SYSLOG_PORT or Config.TRAP_PORT:
+        # Sharded: the parent's estimator mirrors the shards' (kept current from their results)
+        PushReceiver(app, Config.SYSLOG_PORT, Config.TRAP_PORT, rtt=worker.engine.rtt).start()
     threading.Thread(target=monitor_resources, daemon=True).start()
+    threading.Thread(target=MaintenanceManager.run_forever, args=(app,), daemon=True, name="rtm-maintenance").start()
 
 
     def run_server():
         print(">>> RTM SERVER STARTED")
-        socketio.run(app, host='0.0.0.0', port=5050, debug=False, use_reloader=False)
+        metrics.startup_mark("serving")
+        socketio.run(app, host=args.host, port=args.port, debug=False, use_reloader=False, allow_unsafe_werkzeug=True)
+
 
+    if args.headless:
+        try:
+            run_server()
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
 
     threading.Thread(target=run_server, daemon=True).start()
+    import webview  # GUI toolkit: only the desktop mode pays for it
     time.sleep(1)
 
-    webview.create_window("RTM Enterprise", "http://127.0.0.1:5050", width=1280, height=800, background_color='#0b0c0e')
+    webview.create_window("RTM Enterprise", f"http://127.0.0.1:{args.port}", width=1280, height=800, background_color='#0b0c0e')
     webview.start()
-    sys.exit()
\ No newline at end of file
+    sys.exit()
@@ -0,0 +1,119 @@
+"""
+Latency baselines and anomaly detection.
+Every device gets an EWMA mean/variance of its RTT, stored in NumPy arrays
+(one slot per device), and each cycle's successful probes are scored in one
+vectorised pass. A device whose RTT stays `z` deviations and `min_ms` above
+its baseline for `cycles` consecutive probes is flagged until it is back
+within half of both limits.
+"""
+import threading
+import numpy as np
+from core import metrics
+
+
+class LatencyBaseline:
+    """Per-process RTT baselines of the ping engine (same lifetime as EngineState, not checkpointed)."""
+    ALPHA = 0.05  # EWMA weight of a normal sample (~20 probe memory)
+    ADAPT = 0.005  # Weight while deviating: a lasting shift becomes the new normal, but slowly
+    WARMUP = 10  # Samples before a baseline is trusted
+    MIN_STD_MS = 1.0  # Deviation floor: a rock-steady 2 ms link must not alarm at 5 ms
+
+    _lock = threading.Lock()
+    _slot = {}  # dev_id -> array index
+    _size = 0
+    _ids = np.zeros(0, dtype=np.int64)
+    _mean = np.zeros(0)
+    _var = np.zeros(0)
+    _n = np.zeros(0, dtype=np.int32)
+    _streak = np.zeros(0, dtype=np.int32)
+    _flag = np.zeros(0, dtype=bool)
+    _since = np.zeros(0)
+    _last = np.zeros(0)
+    _z = np.zeros(0)
+    _ARRAYS = ('_ids', '_mean', '_var', '_n', '_streak', '_flag', '_since', '_last', '_z')
+
+    @classmethod
+    def _slots(cls, ids):
+        slot = cls._slot
+        new = [i for i in dict.fromkeys(ids) if i not in slot]
+        if new:
+            need = cls._size + len(new)
+            if need > len(cls._ids):
+                cap = max(need, 2 * len(cls._ids), 1024)
+                for name in cls._ARRAYS:
+                    old = getattr(cls, name)
+                    grown = np.zeros(cap, dtype=old.dtype)
+                    grown[:cls._size] = old[:cls._size]
+                    setattr(cls, name, grown)
+            for i in new:
+                slot[i] = cls._size
+                cls._ids[cls._size] = i
+                cls._mean[cls._size] = cls._var[cls._size] = 0.0
+                cls._n[cls._size] = cls._streak[cls._size] = 0
+                cls._flag[cls._size] = False
+                cls._size += 1
+        return np.fromiter(map(slot.__getitem__, ids), dtype=np.intp, count=len(ids))
+
+    @classmethod
+    def update(cls, ids, rtts, now, z_limit=4.0, min_ms=20.0, sustain=3):
+        """
+        Scores one cycle of successful probes (parallel lists of device ids and RTT ms)
+        and folds them into the baselines. -> [(dev_id, 'start'|'end', rtt, baseline, z)]
+        """
+        if not ids: return []
+        with cls._lock:
+            idx = cls._slots(ids)
+            x = np.asarray(rtts, dtype=np.float64)
+            mean, var, n = cls._mean[idx], cls._var[idx], cls._n[idx]
+            delta = x - mean
+            z = delta / np.sqrt(np.maximum(var, cls.MIN_STD_MS ** 2))
+            deviating = (n >= cls.WARMUP) & (z >= z_limit) & (delta >= min_ms)
+            streak = np.where(deviating, cls._streak[idx] + 1, 0)
+            flagged = cls._flag[idx]
+            start = deviating & ~flagged & (streak >= sustain)
+            end = flagged & (z < z_limit / 2) & (delta < min_ms / 2)  # Hysteresis: no flapping at the threshold
+
+            a = np.where(n == 0, 1.0, np.where(deviating, cls.ADAPT, cls.ALPHA))  # First sample seeds the mean
+            cls._mean[idx] = mean + a * delta
+            # Outliers must not widen the baseline they are scored against (z would collapse and end the
+            # anomaly while it lasts): frozen while deviating, slow while flagged
+            av = np.where(deviating, 0.0, np.where(flagged, cls.ADAPT, a))
+            cls._var[idx] = (1.0 - av) * (var + av * delta * delta)
+            cls._n[idx] = np.minimum(n + 1, cls.WARMUP)
+            cls._streak[idx] = streak
+            cls._flag[idx] = (flagged | start) & ~end
+            cls._since[idx[start]] = now
+            cls._last[idx] = x
+            cls._z[idx] = z
+
+            hits = np.flatnonzero(start | end)
+            return [(int(cls._ids[idx[i]]), 'start' if start[i] else 'end', float(x[i]), float(mean[i]), float(z[i]))
+                    for i in hits]
+
+    @classmethod
+    def prune(cls, keep_ids):
+        with cls._lock:
+            dead = cls._slot.keys() - set(keep_ids)
+            if not dead: return
+            live = np.array(sorted(s for i, s in cls._slot.items() if i not in dead), dtype=np.intp)
+            for name in cls._ARRAYS:
+                setattr(cls, name, getattr(cls, name)[live])
+            cls._size = len(live)
+            cls._slot = {int(i): s for s, i in enumerate(cls._ids)}
+
+    @classmethod
+    def active(cls):
+        """Currently flagged devices, worst first."""
+        with cls._lock:
+            hits = np.flatnonzero(cls._flag[:cls._size])
+            rows = [{'id': int(cls._ids[i]), 'rtt': round(float(cls._last[i]), 2),
+                     'baseline': round(float(cls._mean[i]), 2), 'z': round(float(cls._z[i]), 1),
+                     'since': float(cls._since[i])} for i in hits]
+        return sorted(rows, key=lambda r: -r['z'])
+
+    @classmethod
+    def count(cls):
+        return int(cls._flag[:cls._size].sum())
+
+
+metrics.REGISTRY.gauge("rtm_latency_anomalies", "Devices currently flagged for abnormal latency", fn=LatencyBaseline.count)
@@ -0,0 +1,103 @@
+import ipaddress
+import threading
+import time
+from collections import deque
+from core import metrics
+from network.collector_proto import MAX_SKEW_SEC
+
+
+class CollectorHub:
+    """
+    Meeting point between out-of-engine probers (collector API, on-demand
+    scan jobs) and the ping engine. They drop result batches here; the
+    engine thread drains them and runs them through the normal state machine.
+    """
+    MAX_PENDING = 200000  # Hard cap so a flood of uploads can't grow memory without bound
+
+    _lock = threading.Lock()
+    _inbox = deque(maxlen=MAX_PENDING)
+    _confirm = {}  # collector name -> device ids to re-probe right away (handed out with the next sync)
+    _nets = {}  # (collector name, subnets text) -> parsed networks; an edit changes the key
+    _seen = {}  # (collector name, batch_id) -> monotonic arrival, kept for the signature window
+    wake = threading.Event()  # Set by urgent submits; the engine applies them without waiting for its next cycle
+
+    @staticmethod
+    def submit(results, urgent=False):
+        with CollectorHub._lock:
+            CollectorHub._inbox.extend(results)
+        if urgent: CollectorHub.wake.set()
+
+    @staticmethod
+    def drain():
+        with CollectorHub._lock:
+            out = list(CollectorHub._inbox)
+            CollectorHub._inbox.clear()
+        # Buffered uploads may arrive out of order
+        out.sort(key=lambda r: r.get('ts', 0))
+        return out
+
+    @staticmethod
+    def request_confirm(name, dev_ids):
+        with CollectorHub._lock:
+            CollectorHub._confirm.setdefault(name, set()).update(dev_ids)
+
+    @staticmethod
+    def take_confirms(name):
+        with CollectorHub._lock:
+            return sorted(CollectorHub._confirm.pop(name, ()))
+
+    @staticmethod
+    def replayed(name, batch_id):
+        """True when this collector already sent `batch_id` within the signature window (a captured frame resent)."""
+        now = time.monotonic()
+        with CollectorHub._lock:
+            if len(CollectorHub._seen) > 10000:
+                CollectorHub._seen = {k: t for k, t in CollectorHub._seen.items() if now - t < MAX_SKEW_SEC * 2}
+            t = CollectorHub._seen.get((name, batch_id))
+            if t is not None and now - t < MAX_SKEW_SEC * 2:  # Frames are accepted up to MAX_SKEW_SEC either side
+                return True
+            CollectorHub._seen[(name, batch_id)] = now
+            return False
+
+    @staticmethod
+    def _networks(collectors):
+        """[(name, [networks])] with the subnets text parsed once per collector and edit."""
+        cache = CollectorHub._nets
+        keys = [(c.name, c.subnets or "") for c in collectors]
+        if any(k not in cache for k in keys) or len(cache) != len(keys):
+            CollectorHub._nets = cache = {k: cache.get(k) or c.networks() for k, c in zip(keys, collectors)}
+        return [(k[0], cache[k]) for k in keys]
+
+    @staticmethod
+    def _owner(ip, nets):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        for name, networks in nets:
+            for net in networks:
+                if addr.version == net.version and addr in net:
+                    return name
+        return None
+
+    @staticmethod
+    def owner_of(ip, collectors):
+        """Name of the first collector whose subnets contain `ip`, else None."""
+        return CollectorHub._owner(ip, CollectorHub._networks(collectors))
+
+    @staticmethod
+    def partition(devices, collectors):
+        """Splits devices into (local, {collector_name: [devices]})."""
+        local, remote = [], {}
+        if not collectors:
+            return list(devices), remote
+        nets = CollectorHub._networks(collectors)
+        for d in devices:
+            owner = CollectorHub._owner(d.ip, nets)
+            if owner: remote.setdefault(owner, []).append(d)
+            else: local.append(d)
+        return local, remote
+
+
+metrics.REGISTRY.gauge("rtm_collector_inbox_depth", "Collector results waiting for the engine",
+                       fn=lambda: len(CollectorHub._inbox))
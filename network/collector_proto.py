@@ -0,0 +1,41 @@
+"""
+Collector <-> server wire format.
+Body      : zlib(JSON payload), payload always carries 'ts' (unix seconds)
+Headers   : X-RTM-Collector = collector name
+            X-RTM-Signature = hex HMAC-SHA256(secret, body)
+Both directions use the same framing, so the collector can trust its assignment.
+"""
+import hashlib
+import hmac
+import json
+import time
+import zlib
+
+PROTO_VERSION = 1
+MAX_SKEW_SEC = 300
+HDR_NAME = 'X-RTM-Collector'
+HDR_SIG = 'X-RTM-Signature'
+
+
+def sign(secret, body):
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def pack(secret, payload):
+    """Returns (body_bytes, signature)."""
+    payload = dict(payload, v=PROTO_VERSION, ts=time.time())
+    body = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return body, sign(secret, body)
+
+
+def unpack(secret, body, signature):
+    """Verifies and decodes a frame. Raises ValueError on bad signature/age/format."""
+    if not signature or not hmac.compare_digest(sign(secret, body), signature):
+        raise ValueError("Bad signature")
+    try:
+        payload = json.loads(zlib.decompress(body).decode('utf-8'))
+    except (zlib.error, ValueError):
+        raise ValueError("Malformed body")
+    if abs(time.time() - float(payload.get('ts', 0))) > MAX_SKEW_SEC:
+        raise ValueError("Stale frame")
+    return payload
@@ -0,0 +1,137 @@
+import difflib
+import hashlib
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from core.database import db, Device, Setting, ConfigVersion
+from core.job_mgr import JobManager
+from core.maintenance import MaintenanceManager
+from core.security import SecurityManager
+
+
+class ConfigStore:
+    """
+    Content-addressed blob store: sha256(text) -> zlib blob at objects/ab/cdef...
+    Identical configs (same device over time, or templated devices) are stored once.
+    """
+    ROOT = os.path.join(Config.DATA_DIR, "configs", "objects")
+
+    @staticmethod
+    def _path(sha):
+        return os.path.join(ConfigStore.ROOT, sha[:2], sha[2:])
+
+    @staticmethod
+    def put(text):
+        data = text.encode('utf-8')
+        sha = hashlib.sha256(data).hexdigest()
+        path = ConfigStore._path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(zlib.compress(data, 9))
+            os.replace(tmp, path)
+        return sha
+
+    @staticmethod
+    def get(sha):
+        with open(ConfigStore._path(sha), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+
+def diff(old, new, name_a="a", name_b="b", context=3):
+    """
+    Unified line diff. The common head/tail is trimmed first, so the O(n*m) matcher only
+    sees the changed middle (typical config edits touch a few lines of thousands).
+    """
+    a, b = old.splitlines(), new.splitlines()
+    head = 0
+    while head < min(len(a), len(b)) and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(a), len(b)) - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    lo = max(0, head - context)
+    a_mid, b_mid = a[lo:len(a) - max(0, tail - context)], b[lo:len(b) - max(0, tail - context)]
+    out = []
+    for line in difflib.unified_diff(a_mid, b_mid, name_a, name_b, n=context, lineterm=""):
+        if line.startswith('@@'):  # Re-base hunk headers on the untrimmed files
+            line = _shift_hunk(line, lo)
+        out.append(line)
+    return "\n".join(out)
+
+
+def _shift_hunk(header, offset):
+    parts = header.split(' ')
+    for i in (1, 2):
+        sign, rng = parts[i][0], parts[i][1:]
+        start, _, length = rng.partition(',')
+        parts[i] = f"{sign}{int(start) + offset}" + (f",{length}" if length else "")
+    return ' '.join(parts)
+
+
+def make_config_backup_job(app, device_ids=None):
+    """
+    JobManager body: pulls running configs over SSH on a bounded pool (per-device timeout)
+    and records a ConfigVersion only when the content hash changed.
+    """
+
+    def _backup(job):
+        with app.app_context():
+            q = Device.query.filter_by(is_stopped=False)
+            if device_ids: q = q.filter(Device.id.in_(device_ids))
+            devices = [(d.id, d.name, d.ip) for d in q.all()]
+            last = dict(db.session.query(ConfigVersion.device_id, ConfigVersion.sha)
+                        .filter(ConfigVersion.id.in_(db.session.query(db.func.max(ConfigVersion.id))
+                                                     .group_by(ConfigVersion.device_id))).all())
+            user = Setting.get("ssh_username", "")
+            stored = Setting.get("ssh_password", "")
+            if stored and not stored.startswith(SecurityManager.SEALED_PREFIX) and SecurityManager.can_seal():
+                Setting.set("ssh_password", SecurityManager.seal(stored))  # Saved in plaintext by an older version
+            password = os.environ.get("RTM_SSH_PASSWORD") or SecurityManager.unseal(stored)
+            dtype = Setting.get("ssh_device_type", "cisco_ios")
+            try:
+                workers = max(1, min(128, int(Setting.get("config_backup_workers", "32"))))
+                timeout = max(5, int(Setting.get("config_backup_timeout_sec", "60")))
+            except ValueError:
+                workers, timeout = 32, 60
+
+        from network.ssh_mgr import SSHManager  # netmiko is only needed when backups actually run
+        drivers = SSHManager.load_drivers()
+
+        def _pull(dev):
+            dev_id, name, ip = dev
+            ok, text = SSHManager.fetch_config(ip, user, password, dtype, timeout=timeout, drivers=drivers)
+            if not ok:
+                return {'id': dev_id, 'name': name, 'status': 'failed', 'detail': text[:200]}
+            sha = ConfigStore.put(text)  # Blob write happens here, off the DB thread
+            status = 'unchanged' if last.get(dev_id) == sha else ('changed' if dev_id in last else 'new')
+            return {'id': dev_id, 'name': name, 'status': status, 'sha': sha,
+                    'size': len(text), 'lines': text.count("\n")}
+
+        job.progress(done=0, total=len(devices))
+        new_rows = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cfg") as pool:
+            for n, res in enumerate(pool.map(_pull, devices), 1):
+                if res['status'] in ('new', 'changed'):
+                    new_rows.append({'device_id': res['id'], 'sha': res['sha'], 'size': res['size'],
+                                     'lines': res['lines']})
+                job.progress(done=n, result=res)
+
+        with app.app_context():
+            if new_rows:
+                db.session.bulk_insert_mappings(ConfigVersion, new_rows)
+                db.session.commit()
+
+    return _backup
+
+
+def _nightly(app):
+    with app.app_context():
+        enabled = Setting.get("config_backup_nightly", "0") == "1"
+    if enabled:
+        JobManager.submit('config_backup', (None,), make_config_backup_job(app))
+
+
+MaintenanceManager.register_nightly(_nightly)
@@ -0,0 +1,168 @@
+import ipaddress
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from core.database import db, Device, Setting
+
+# LLDP-MIB (IEEE 802.1AB)
+LLDP_REM_SYSNAME = '1.0.8802.1.1.2.1.4.1.1.9'
+LLDP_REM_MANADDR = '1.0.8802.1.1.2.1.4.2.1.3'  # Index ends in addrSubtype.addrLen.addr...
+# CISCO-CDP-MIB
+CDP_CACHE_ADDRESS = '1.3.6.1.4.1.9.9.23.1.2.1.1.4'
+CDP_CACHE_DEVICE_ID = '1.3.6.1.4.1.9.9.23.1.2.1.1.6'
+
+MAX_WORKERS = 32
+ROOT_TYPES = ('ROUTER',)
+
+
+def _short(name):
+    """'core-sw1.example.local(FOC123)' -> 'core-sw1' for name matching."""
+    name = (name or "").strip().lower().split('(')[0]
+    return name.split('.')[0] if name and not name[0].isdigit() else name
+
+
+def _neighbour_key(oid, base, skip):
+    """Remote table row key (localPort.remIndex / cdpCacheIfIndex.deviceIndex) from a column OID."""
+    parts = oid[len(base) + 1:].split('.')
+    return '.'.join(parts[skip:skip + 2])
+
+
+def walk_neighbours(ip, community):
+    """
+    LLDP + CDP neighbours of one device: [{'name', 'ip', 'proto'}].
+    Never raises; unreachable / non-SNMP devices return [].
+    """
+    from network.snmp_mgr import SNMPManager  # pysnmp is only needed when discovery actually runs
+
+    found = []
+    try:
+        ok, names = SNMPManager.walk(ip, community, LLDP_REM_SYSNAME)
+        if ok:
+            by_key = {_neighbour_key(o, LLDP_REM_SYSNAME, 1): {'name': str(v), 'ip': None, 'proto': 'lldp'}
+                      for o, v in names}
+            ok, addrs = SNMPManager.walk(ip, community, LLDP_REM_MANADDR)
+            for o, _ in (addrs if ok else []):
+                parts = o[len(LLDP_REM_MANADDR) + 1:].split('.')
+                # timeMark.localPort.remIndex.subtype(1=ipv4).len(4).a.b.c.d
+                if len(parts) >= 9 and parts[3] == '1' and parts[4] == '4':
+                    row = by_key.get('.'.join(parts[1:3]))
+                    if row and not row['ip']: row['ip'] = '.'.join(parts[5:9])
+            found.extend(by_key.values())
+
+        ok, ids = SNMPManager.walk(ip, community, CDP_CACHE_DEVICE_ID)
+        if ok:
+            by_key = {_neighbour_key(o, CDP_CACHE_DEVICE_ID, 0): {'name': str(v), 'ip': None, 'proto': 'cdp'}
+                      for o, v in ids}
+            ok, addrs = SNMPManager.walk(ip, community, CDP_CACHE_ADDRESS)
+            for o, v in (addrs if ok else []):
+                raw = v.asOctets()
+                row = by_key.get(_neighbour_key(o, CDP_CACHE_ADDRESS, 0))
+                if row and len(raw) == 4: row['ip'] = str(ipaddress.IPv4Address(raw))
+            found.extend(by_key.values())
+    except Exception:
+        return []
+    return found
+
+
+class DeviceIndex:
+    """Resolves neighbour advertisements to Device ids by management IP first, then by host name."""
+
+    def __init__(self, devices):
+        self.by_ip = {d.ip: d.id for d in devices}
+        self.by_name = {}
+        for d in devices:
+            self.by_name.setdefault(_short(d.name), d.id)
+
+    def resolve(self, neighbour):
+        if neighbour.get('ip') and neighbour['ip'] in self.by_ip:
+            return self.by_ip[neighbour['ip']]
+        return self.by_name.get(_short(neighbour.get('name')))
+
+
+def build_plan(devices, adjacency, root_ids):
+    """
+    BFS over the (undirected) neighbour graph from the root devices.
+    Each reached device's proposed uplink is its BFS parent, i.e. the neighbour
+    one hop closer to the core. Unreached devices keep their current uplink.
+    Returns the diff: [{'id', 'name', 'current', 'current_name', 'proposed', 'proposed_name'}].
+    """
+    by_id = {d.id: d for d in devices}
+    parent = {r: None for r in root_ids}
+    queue = deque(root_ids)
+    while queue:
+        cur = queue.popleft()
+        for nb in sorted(adjacency.get(cur, ())):
+            if nb not in parent:
+                parent[nb] = cur
+                queue.append(nb)
+
+    diff = []
+    for dev_id, up in parent.items():
+        d = by_id[dev_id]
+        if d.uplink_device_id != up:
+            diff.append({'id': dev_id, 'name': d.name, 'current': d.uplink_device_id,
+                         'current_name': by_id[d.uplink_device_id].name if d.uplink_device_id in by_id else None,
+                         'proposed': up, 'proposed_name': by_id[up].name if up else None})
+    return diff
+
+
+def make_discovery_job(app, root_id=None):
+    """
+    JobManager body: walks every managed device concurrently and leaves the
+    proposed uplink diff in job.results (nothing is written; see apply_plan).
+    """
+
+    def _discover(job):
+        with app.app_context():
+            devices = Device.query.filter_by(is_stopped=False).all()
+            community = Setting.get("snmp_community", "public")
+            db.session.expunge_all()  # Plain objects from here on; worker threads don't touch the session
+
+        index = DeviceIndex(devices)
+        adjacency = {}
+        job.progress(done=0, total=len(devices))
+        done = 0
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="lldp") as pool:
+            futures = {pool.submit(walk_neighbours, d.ip, community): d for d in devices}
+            for fut, d in futures.items():
+                for nb in fut.result():
+                    other = index.resolve(nb)
+                    if other and other != d.id:
+                        adjacency.setdefault(d.id, set()).add(other)
+                        adjacency.setdefault(other, set()).add(d.id)
+                done += 1
+                job.progress(done=done)
+
+        if root_id:
+            roots = [root_id]
+        else:
+            # Core = routers, else today's root nodes that have neighbours
+            roots = [d.id for d in devices if d.device_type in ROOT_TYPES and d.id in adjacency] or \
+                    [d.id for d in devices if d.uplink_device_id is None and d.id in adjacency]
+        for row in build_plan(devices, adjacency, roots):
+            job.progress(result=row)
+
+    return _discover
+
+
+def apply_plan(changes):
+    """
+    Applies {device_id: uplink_id or None} in one transaction.
+    Changes that point at unknown devices or would close a loop are skipped.
+    Returns the number of devices updated.
+    """
+    original = dict(db.session.query(Device.id, Device.uplink_device_id).all())
+    wanted = {d: u for d, u in changes.items() if d in original and d != u and (u is None or u in original)}
+    parents = dict(original)
+    parents.update(wanted)
+    for dev_id in list(wanted):
+        cur, seen = parents.get(dev_id), {dev_id}
+        while cur is not None and cur not in seen:
+            seen.add(cur)
+            cur = parents.get(cur)
+        if cur is not None:  # Loop: keep the current uplink for this one
+            parents[dev_id] = original[dev_id]
+            del wanted[dev_id]
+    for d in Device.query.filter(Device.id.in_(list(wanted))).all():
+        d.uplink_device_id = wanted[d.id]
+    db.session.commit()
+    return len(wanted)
@@ -0,0 +1,138 @@
+"""
+Ping engine warm-restart state.
+Per-device runtime data (last RTT, loss/jitter, counters, flap history, RTT
+estimator) is checkpointed to a flat file of fixed-size binary records and
+memory-mapped back on start, so the UI and adaptive timeouts are warm before
+the first sweep finishes.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+STATES = ("UNKNOWN", "UP", "DOWN", "DEGRADED")
+_STATE_CODE = {s: i for i, s in enumerate(STATES)}
+
+# magic, version, record size, record count, saved_at (epoch)
+HEADER = struct.Struct("<4sHHId")
+# dev_id, state, last_probe, last_change, rtt_ms, loss, jitter, srtt_ms, rttvar_ms, ok, fail, flaps, consecutive_fail
+RECORD = struct.Struct("<IB3xddfffffIIHH")
+MAGIC = b"RTMS"
+VERSION = 1
+
+# In-memory layout mirrors RECORD (list per device, index constants below)
+STATE, LAST_PROBE, LAST_CHANGE, RTT, LOSS, JITTER, SRTT, RTTVAR, OK, FAIL, FLAPS, CONSEC = range(12)
+
+
+class EngineState:
+    """Shared per-device runtime state of the ping engine (one per process)."""
+    CHECKPOINT_SEC = 30
+
+    _lock = threading.Lock()
+    _rec = {}  # dev_id -> list (see index constants)
+    _loaded_at = None
+
+    @classmethod
+    def observe(cls, dev_id, result, state, changed, now=None):
+        now = now or time.time()
+        with cls._lock:
+            rec = cls._rec.get(dev_id)
+            if rec is None:
+                rec = cls._rec[dev_id] = ["UNKNOWN" if changed else state, 0.0, now, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0, 0, 0]
+            if changed:
+                if rec[STATE] != "UNKNOWN": rec[FLAPS] = min(rec[FLAPS] + 1, 0xFFFF)
+                rec[STATE] = state
+                rec[LAST_CHANGE] = now
+            rec[LAST_PROBE] = now
+            rec[RTT] = result.get('rtt') or 0.0
+            rec[LOSS] = result.get('loss', 0.0)
+            rec[JITTER] = result.get('jitter', 0.0)
+            if 'srtt' in result:  # Estimator owned by a shard / collector process
+                rec[SRTT], rec[RTTVAR] = result['srtt'], result['rttvar']
+            if result['ok']:
+                rec[OK] += 1
+                rec[CONSEC] = 0
+            else:
+                rec[FAIL] += 1
+                rec[CONSEC] = min(rec[CONSEC] + 1, 0xFFFF)
+
+    @classmethod
+    def last_probe(cls, dev_id):
+        rec = cls._rec.get(dev_id)
+        return rec[LAST_PROBE] if rec else 0.0
+
+    @classmethod
+    def consecutive_fail(cls, dev_id):
+        rec = cls._rec.get(dev_id)
+        return rec[CONSEC] if rec else 0
+
+    @classmethod
+    def get(cls, dev_id):
+        rec = cls._rec.get(dev_id)
+        if rec is None: return None
+        return {'state': rec[STATE], 'last_probe': rec[LAST_PROBE], 'last_change': rec[LAST_CHANGE],
+                'rtt': round(rec[RTT], 2), 'loss': round(rec[LOSS], 1), 'jitter': round(rec[JITTER], 2),
+                'ok': rec[OK], 'fail': rec[FAIL], 'flaps': rec[FLAPS], 'consecutive_fail': rec[CONSEC]}
+
+    @classmethod
+    def prune(cls, keep_ids):
+        keep = set(keep_ids)
+        with cls._lock:
+            for dev_id in [d for d in cls._rec if d not in keep]:
+                del cls._rec[dev_id]
+
+    @classmethod
+    def checkpoint(cls, path, rtt=None):
+        """
+        Writes all records to `path` atomically (temp file + rename).
+        `rtt` (RttEstimator) contributes SRTT/RTTVAR so adaptive timeouts survive restarts.
+        """
+        with cls._lock:
+            items = [(d, list(r)) for d, r in cls._rec.items()]
+        tmp = path + ".tmp"
+        size = HEADER.size + RECORD.size * len(items)
+        with open(tmp, "w+b") as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as m:
+                HEADER.pack_into(m, 0, MAGIC, VERSION, RECORD.size, len(items), time.time())
+                off = HEADER.size
+                for dev_id, r in items:
+                    est = rtt.export(dev_id) if rtt else None
+                    if est: r[SRTT], r[RTTVAR] = est
+                    RECORD.pack_into(m, off, dev_id, _STATE_CODE.get(r[STATE], 0), r[LAST_PROBE], r[LAST_CHANGE],
+                                     r[RTT], r[LOSS], r[JITTER], r[SRTT], r[RTTVAR], r[OK] & 0xFFFFFFFF,
+                                     r[FAIL] & 0xFFFFFFFF, r[FLAPS], r[CONSEC])
+                    off += RECORD.size
+                m.flush()
+        os.replace(tmp, path)
+        return len(items)
+
+    @classmethod
+    def load(cls, path, rtt=None):
+        """Maps a checkpoint back into memory. Returns the number of records (0 when missing/invalid)."""
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return 0
+        with f:
+            try:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                return 0
+            with m:
+                if len(m) < HEADER.size: return 0
+                magic, version, rec_size, count, _ = HEADER.unpack_from(m, 0)
+                if magic != MAGIC or version != VERSION or rec_size != RECORD.size:
+                    return 0
+                count = min(count, (len(m) - HEADER.size) // RECORD.size)
+                recs = {}
+                for v in RECORD.iter_unpack(m[HEADER.size:HEADER.size + count * RECORD.size]):
+                    dev_id, code = v[0], v[1]
+                    state = STATES[code] if code < len(STATES) else "UNKNOWN"
+                    recs[dev_id] = [state] + list(v[2:])
+                    if rtt and v[7] > 0: rtt.restore(dev_id, v[7], v[8])
+        with cls._lock:
+            cls._rec = recs
+            cls._loaded_at = time.time()
+        return len(recs)
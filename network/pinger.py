@@ -1,59 +1,298 @@
 import threading
 import time
 from datetime import datetime
-from pythonping import ping as py_ping
-from core.database import db, Device, Setting
-from core.audio_mgr import AudioManager
+from core.database import db, Device, Setting, Collector, ServiceCheck
+from core import metrics
+from core.event_bus import EventBus, BLOCK, COALESCE, DROP_OLDEST
+from core.history import HistoryRecorder
+from core.live_hub import LiveHub
 from flask_socketio import SocketIO
+from network.collector_hub import CollectorHub
+from network.engine_state import EngineState
+from network.probe_engine import ProbeEngine
+from network.shard_pool import ShardPool
+
+
+def sweep_options():
+    """
+    ProbeEngine.sweep keyword options from settings; shared with shards and collectors.
+    min_timeout: lower clamp for adaptive per-device timeouts (None = fixed global timeout)
+    train/spacing: echoes per device per poll and the gap between them
+    """
+    opts = {'min_timeout': None, 'train': 1, 'spacing': 0.02}
+    try:
+        if Setting.get("adaptive_timeout", "1") == "1":
+            opts['min_timeout'] = int(Setting.get("ping_timeout_min_ms", "200")) / 1000.0
+        opts['train'] = max(1, min(20, int(Setting.get("probe_train_count", "1"))))
+        opts['spacing'] = max(0, int(Setting.get("probe_train_spacing_ms", "20"))) / 1000.0
+    except:
+        pass
+    return opts
+
+
+def classify(result, loss_pct, jitter_ms):
+    """UP / DEGRADED / DOWN from one probe result and the degradation thresholds."""
+    if not result['ok']:
+        return "DOWN"
+    if loss_pct and result.get('loss', 0) >= loss_pct:
+        return "DEGRADED"
+    if jitter_ms and result.get('jitter', 0) >= jitter_ms:
+        return "DEGRADED"
+    return "UP"
 
 
 class PingWorker(threading.Thread):
-    def __init__(self, app, socketio: SocketIO):
+    def __init__(self, app, socketio: SocketIO, engine=None, state_file=None):
         super().__init__()
         self.app = app
         self.socketio = socketio
+        self.engine = engine or ProbeEngine()
+        self.state_file = state_file
         self.daemon = True
         self.stop_event = threading.Event()
+        self._states = {}  # dev_id -> last published state (the DB copy is written asynchronously)
 
     def run(self):
         print(">>> J.A.R.V.I.S Ping Engine Started")
+        self._loop(pause=2)
+
+    def _warm_start(self):
+        if not self.state_file: return
+        t0 = time.perf_counter()
+        n = EngineState.load(self.state_file, rtt=self.engine.rtt)
+        if n: print(f">>> Engine state restored: {n} devices in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    def _checkpoint(self):
+        if not self.state_file: return
+        try:
+            EngineState.checkpoint(self.state_file, rtt=self.engine.rtt)
+        except OSError as e:
+            print(f"Engine checkpoint failed: {e}")
+
+    def _start_consumers(self):
+        """Everything that used to run inline per state change, each behind its own bounded queue."""
+        EventBus.subscribe("device.state", "db_writer", self._write_states, maxsize=20000, policy=BLOCK, app=self.app)
+        EventBus.subscribe("device.state", "ui", self._broadcast, maxsize=20000, policy=COALESCE,
+                           key=lambda e: e['id'], app=self.app)
+        EventBus.subscribe("device.state", "alarms", self._alarm, maxsize=200, policy=DROP_OLDEST, app=self.app)
+        EventBus.subscribe("device.anomaly", "anomalies", self._announce, maxsize=2000, policy=DROP_OLDEST)
+        EventBus.subscribe("probe.result", "history", self._record, maxsize=100000, policy=BLOCK, batch=5000,
+                           app=self.app)
+
+    def _loop(self, pause):
+        self._warm_start()
+        self._start_consumers()
+        next_due = time.monotonic()
+        next_checkpoint = next_due + EngineState.CHECKPOINT_SEC
+        try:
+            while not self.stop_event.is_set():
+                metrics.SCHEDULER_LAG.observe(max(0.0, time.monotonic() - next_due))
+                with metrics.CYCLE_DURATION.time():
+                    with self.app.app_context():
+                        self._cycle()
+                metrics.startup_mark("first_poll")  # Once the first sweep's results are applied (first call wins)
+                if time.monotonic() >= next_checkpoint:
+                    self._checkpoint()
+                    next_checkpoint = time.monotonic() + EngineState.CHECKPOINT_SEC
+                next_due = time.monotonic() + pause
+                self._idle(next_due)
+        finally:
+            self._checkpoint()
+            EventBus.drain()
+            with self.app.app_context():
+                HistoryRecorder.flush()
+
+    def _idle(self, until):
+        """Sleeps until the next cycle, applying urgent results (push-triggered probes) as they arrive."""
         while not self.stop_event.is_set():
+            remaining = until - time.monotonic()
+            if remaining <= 0 or not CollectorHub.wake.wait(remaining): return
+            CollectorHub.wake.clear()
             with self.app.app_context():
-                self._cycle()
-            time.sleep(2)
+                results = CollectorHub.drain()
+                ids = {r['id'] for r in results}
+                devices = Device.query.filter_by(is_paused=False, is_stopped=False) \
+                    .filter(Device.id.in_(ids)).all() if ids else []
+                self._apply(devices, results)
 
-    def _cycle(self):
+    def _timeout(self):
         try:
-            interval = int(Setting.get("ping_timeout_sec", "30"))
+            return int(Setting.get("ping_timeout_sec", "30"))
         except:
-            interval = 30
+            return 30
+
+    def _sweep_opts(self):
+        return sweep_options()
 
-        devices = Device.query.filter_by(is_paused=False, is_stopped=False).all()
+    def _active_devices(self):
+        return Device.query.filter_by(is_paused=False, is_stopped=False).all()
 
-        for d in devices:
-            ok, rtt = self._ping_device(d.ip, interval)
-            new_state = "UP" if ok else "DOWN"
+    def _local_targets(self, devices):
+        """Devices not owned by a remote collector (those are probed on-site)."""
+        local, _ = CollectorHub.partition(devices, Collector.query.all())
+        checks = ServiceCheck.by_device()
+        # Stalest first: after a warm start the devices we know least about are probed before the rest
+        local.sort(key=lambda d: EngineState.last_probe(d.id))
+        return [(d.id, d.ip, checks[d.id]) if d.id in checks else (d.id, d.ip) for d in local]
 
-            if d.state != new_state:
-                # State Changed
-                d.state = new_state
-                d.updated_at = datetime.utcnow()
-                db.session.commit()
+    def _prune(self, devices):
+        from network.anomaly import LatencyBaseline  # numpy: loaded by the engine thread, not at import
+        active = {d.id for d in devices}
+        EngineState.prune(active)
+        LatencyBaseline.prune(active)
+        for dev_id in [k for k in self._states if k not in active]:
+            del self._states[dev_id]
+
+    def _cycle(self):
+        devices = self._active_devices()
+        self._prune(devices)
+        results = self.engine.sweep(self._local_targets(devices), self._timeout(), **self._sweep_opts())
+        self._apply(devices, results + CollectorHub.drain())
 
-                # Trigger Actions
-                if new_state == "DOWN":
-                    duration = int(Setting.get("alarm_duration_sec", "5"))
-                    AudioManager.play_alarm(duration)
-                    self.socketio.emit('alert', {'msg': f'{d.name} is DOWN!', 'type': 'error'})
+    def _apply(self, devices, results):
+        """
+        Feeds probe results ({'id', 'ok', 'rtt'}) into the device state machine.
+        Only classification happens here; DB writes, UI, alarms and history are
+        published to the event bus so a slow consumer can't stall probing.
+        """
+        by_id = {d.id: d for d in devices}
+        try:
+            loss_pct = float(Setting.get("degraded_loss_pct", "20"))
+            jitter_ms = float(Setting.get("degraded_jitter_ms", "0"))
+            retries = max(1, int(Setting.get("ping_retry_threshold", "1")))
+        except:
+            loss_pct, jitter_ms, retries = 20.0, 0.0, 1
+        now = datetime.utcnow()
+        samples, changes = [], []
+        ok_ids, ok_rtts = [], []
+        for r in results:
+            d = by_id.get(r['id'])
+            if d is None: continue  # Removed/paused since the probe was sent
+            if r.get('confirm') and not r['ok']: continue  # Push-triggered re-probe: only a regular poll declares DOWN
+            new_state = classify(r, loss_pct, jitter_ms)
+            rtt = r['rtt']
+            if 'timeout' in r: metrics.PROBE_TIMEOUT.observe(r['timeout'])
+            if 'srtt' in r: self.engine.rtt.restore(d.id, r['srtt'], r['rttvar'])  # Mirror of a shard/collector estimator
+            if r['ok']:
+                metrics.PROBE_RESULTS.inc(1, "ok")
+                metrics.PROBE_LATENCY.observe(rtt / 1000.0)
+                ok_ids.append(d.id)
+                ok_rtts.append(rtt)
+            else:
+                metrics.PROBE_RESULTS.inc(1, "fail")
 
-                # Update UI
-                self.socketio.emit('device_update', {
-                    'ip': d.ip, 'state': new_state, 'rtt': rtt
-                })
+            # Collector results carry the time they were probed (epoch); buffered uploads may be hours old
+            ts = datetime.utcfromtimestamp(r['ts']) if r.get('ts') else now
+            prev = self._states.get(d.id, d.state)
+            if new_state == "DOWN" and prev != "DOWN" and EngineState.consecutive_fail(d.id) + 1 < retries:
+                new_state = prev  # Retry threshold: DOWN only after that many failed polls in a row
+            changed = prev != new_state
+            self._states[d.id] = new_state
+            EngineState.observe(d.id, r, new_state, changed)
+            samples.append((d.id, r['ok'], rtt, ts))
+            if changed:
+                metrics.STATE_CHANGES.inc(1, new_state)
+                change = {'id': d.id, 'ip': d.ip, 'name': d.name, 'from': prev, 'state': new_state, 'rtt': rtt,
+                          'ts': ts}
+                if 'checks' in r: change['checks'] = r['checks']
+                if 'loss' in r: change.update(loss=r['loss'], jitter=r['jitter'])
+                changes.append(change)
+        EventBus.publish_many("probe.result", samples)
+        EventBus.publish_many("device.state", changes)
+        EventBus.publish_many("device.anomaly", self._detect(by_id, ok_ids, ok_rtts))
 
-    def _ping_device(self, ip, timeout):
+    def _detect(self, by_id, ids, rtts):
+        """Latency anomalies: one vectorised pass over this batch's successful probes."""
+        from network.anomaly import LatencyBaseline
         try:
-            resp = py_ping(ip, count=1, timeout=timeout)
-            return resp.success(), round(resp.rtt_avg_ms, 1) if resp.success() else 0
+            z = float(Setting.get("anomaly_z", "4"))
+            min_ms = float(Setting.get("anomaly_min_ms", "20"))
+            sustain = int(Setting.get("anomaly_cycles", "3"))
         except:
-            return False, 0
\ No newline at end of file
+            z, min_ms, sustain = 4.0, 20.0, 3
+        with metrics.ANOMALY_PASS.time():
+            found = LatencyBaseline.update(ids, rtts, time.time(), z, min_ms, sustain)
+        events = []
+        for dev_id, kind, rtt, baseline, score in found:
+            metrics.ANOMALIES.inc(1, kind)
+            d = by_id[dev_id]
+            events.append({'id': dev_id, 'ip': d.ip, 'name': d.name, 'kind': kind, 'rtt': round(rtt, 2),
+                           'baseline': round(baseline, 2), 'z': round(score, 1), 'ts': time.time()})
+        return events
+
+    # --- EVENT BUS CONSUMERS ---
+    def _write_states(self, events):
+        """One commit per batch; transitions keep the time the engine saw them, not the write time."""
+        last = {e['id']: e for e in events}
+        found = {d.id: d for d in Device.query.filter(Device.id.in_(list(last))).all()}
+        HistoryRecorder.transitions((e['id'], e['from'], e['state'], e['ts']) for e in events if e['id'] in found)
+        for dev_id, d in found.items():
+            d.state = last[dev_id]['state']
+            d.updated_at = last[dev_id]['ts']
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Forget what was not written: the next cycle compares against the DB copy again and republishes
+            for e in events:
+                if self._states.get(e['id']) == e['state']: self._states.pop(e['id'], None)
+            raise
+
+    def _broadcast(self, events):
+        updates = []
+        for e in events:
+            update = {'id': e['id'], 'ip': e['ip'], 'state': e['state'], 'rtt': e['rtt']}
+            if 'checks' in e: update['checks'] = e['checks']
+            if 'loss' in e: update.update(loss=e['loss'], jitter=e['jitter'])
+            updates.append(update)
+        LiveHub.publish_devices(updates)
+
+    def _alarm(self, events):
+        if any(e['state'] == "DOWN" for e in events):
+            from core.audio_mgr import AudioManager  # winsound: only loaded once something actually goes down
+            AudioManager.play_alarm(int(Setting.get("alarm_duration_sec", "5")))
+        for e in events:
+            if e['state'] == "DOWN":
+                LiveHub.publish('alerts', 'alert', {'msg': f'{e["name"]} is DOWN!', 'type': 'error'})
+            elif e['state'] == "DEGRADED":
+                LiveHub.publish('alerts', 'alert', {'msg': f'{e["name"]} is DEGRADED ({e.get("loss", 0)}% loss)',
+                                                    'type': 'warning'})
+
+    def _announce(self, events):
+        for e in events:
+            LiveHub.publish('anomalies', 'anomaly', e)
+
+    def _record(self, samples):
+        for dev_id, ok, rtt, ts in samples:
+            HistoryRecorder.sample(dev_id, ok, rtt, now=ts)
+        HistoryRecorder.write_late()
+
+
+class ShardedPingWorker(PingWorker):
+    """
+    Same state machine as PingWorker, but probing runs in N worker processes
+    (consistent hashing on device id). This thread only rebalances shards,
+    collects their results and owns DB writes / socket emits; self.engine.rtt
+    mirrors the shards' RTT estimates for checkpoints and re-seeding.
+    """
+
+    def __init__(self, app, socketio: SocketIO, processes, state_file=None):
+        super().__init__(app, socketio, state_file=state_file)
+        self.pool = ShardPool(processes)
+        metrics.REGISTRY.gauge("rtm_shard_results_depth", "Shard result batches waiting for the parent",
+                               fn=self.pool.results.qsize)
+
+    def run(self):
+        print(f">>> J.A.R.V.I.S Ping Engine Started ({self.pool.processes} shards)")
+        self.pool.start()
+        try:
+            self._loop(pause=0)  # drain() already waits for shard results
+        finally:
+            self.pool.stop()
+
+    def _cycle(self):
+        devices = self._active_devices()
+        self._prune(devices)
+        # Re-sent only to shards whose device set changed
+        self.pool.assign(self._local_targets(devices), self._timeout(), self._sweep_opts(), rtt=self.engine.rtt)
+        self._apply(devices, self.pool.drain(wait=2) + CollectorHub.drain())
@@ -0,0 +1,168 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pythonping import ping as py_ping
+from network.service_checks import run_check
+
+
+def icmp_probe(ip, timeout):
+    """Single ICMP echo. Returns (ok, rtt_ms)."""
+    try:
+        resp = py_ping(ip, count=1, timeout=timeout)
+        return resp.success(), round(resp.rtt_avg_ms, 1) if resp.success() else 0
+    except:
+        return False, 0
+
+
+def train_stats(echoes):
+    """Loss %, jitter (mean |delta| of consecutive replies) and min/avg/max from [(ok, rtt_ms), ...]."""
+    rtts = [rtt for ok, rtt in echoes if ok]
+    sent = len(echoes)
+    if not rtts:
+        return {'ok': False, 'rtt': 0, 'loss': 100.0, 'jitter': 0, 'rtt_min': 0, 'rtt_max': 0}
+    jitter = sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1) if len(rtts) > 1 else 0
+    return {'ok': True, 'rtt': round(sum(rtts) / len(rtts), 1), 'loss': round((sent - len(rtts)) * 100.0 / sent, 1),
+            'jitter': round(jitter, 2), 'rtt_min': round(min(rtts), 1), 'rtt_max': round(max(rtts), 1)}
+
+
+class RttEstimator:
+    """
+    Per-device adaptive timeout (RFC 6298 style):
+    RTO = SRTT + 4 * RTTVAR, doubled after each timeout (bounded), clamped to [min, max].
+    Devices with no successful sample yet get the max timeout.
+    """
+    ALPHA = 0.125
+    BETA = 0.25
+    K = 4
+    MAX_BACKOFF = 4  # Keeps dead devices from dragging the cycle back to the global max
+
+    def __init__(self):
+        self._state = {}  # dev_id -> [srtt_s, rttvar_s, backoff]
+
+    def timeout_for(self, dev_id, min_timeout, max_timeout):
+        st = self._state.get(dev_id)
+        if st is None: return max_timeout
+        rto = (st[0] + self.K * st[1]) * st[2]
+        return min(max_timeout, max(min_timeout, rto))
+
+    def observe(self, dev_id, ok, rtt_ms):
+        st = self._state.get(dev_id)
+        if ok:
+            r = max(rtt_ms, 0.1) / 1000.0
+            if st is None:
+                self._state[dev_id] = [r, r / 2, 1]
+            else:
+                st[1] = (1 - self.BETA) * st[1] + self.BETA * abs(st[0] - r)
+                st[0] = (1 - self.ALPHA) * st[0] + self.ALPHA * r
+                st[2] = 1
+        elif st is not None:
+            st[2] = min(st[2] * 2, self.MAX_BACKOFF)
+
+    def srtt_ms(self, dev_id):
+        st = self._state.get(dev_id)
+        return round(st[0] * 1000, 2) if st else None
+
+    def export(self, dev_id):
+        """(srtt_ms, rttvar_ms) for checkpointing, or None."""
+        st = self._state.get(dev_id)
+        return (st[0] * 1000, st[1] * 1000) if st else None
+
+    def restore(self, dev_id, srtt_ms, rttvar_ms):
+        self._state[dev_id] = [srtt_ms / 1000.0, rttvar_ms / 1000.0, 1]
+
+    def annotate(self, results):
+        """Adds 'srtt'/'rttvar' (ms) to results, so the process that checkpoints can mirror estimators it doesn't own."""
+        for r in results:
+            st = self._state.get(r['id'])
+            if st: r['srtt'], r['rttvar'] = round(st[0] * 1000, 3), round(st[1] * 1000, 3)
+        return results
+
+    def prune(self, keep_ids):
+        for dev_id in set(self._state) - set(keep_ids):
+            del self._state[dev_id]
+
+
+class ProbeEngine:
+    """
+    Runs blocking probes concurrently on an asyncio loop.
+    Kept free of Flask/DB imports so it can run inside shard worker processes.
+    """
+    DEFAULT_CONCURRENCY = 64
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, probe=None):
+        self.concurrency = concurrency
+        self.probe = probe or icmp_probe
+        self.rtt = RttEstimator()
+        self._executor = None
+
+    def sweep(self, targets, timeout, on_result=None, min_timeout=None, train=1, spacing=0.02):
+        """
+        targets: iterable of (device_id, ip) or (device_id, ip, checks)
+        on_result: optional callback(result) fired as each probe completes
+        min_timeout: enables adaptive per-device timeouts in [min_timeout, timeout]
+        train/spacing: echoes per device and gap between them (seconds)
+        Returns a list of {'id', 'ip', 'ok', 'rtt', 'timeout'} in target order;
+        with train > 1 also 'loss' (%), 'jitter', 'rtt_min', 'rtt_max' (ms).
+
+        Devices with service checks are UP only when every check passes
+        (ICMP is still sent and reported as 'icmp_ok', but is not decisive,
+        so hosts that filter ping can be monitored by their services).
+        """
+        targets = list(targets)
+        if not targets: return []
+        if min_timeout is not None:
+            self.rtt.prune(t[0] for t in targets)
+        return asyncio.run(self.sweep_async(targets, timeout, on_result, min_timeout, max(1, int(train)), spacing))
+
+    async def sweep_async(self, targets, timeout, on_result=None, min_timeout=None, train=1, spacing=0.02):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="probe")
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _check(ip, check):
+            async with sem:
+                return await run_check(ip, check)
+
+        async def _echo(ip, t, delay):
+            # The gap before each echo is spent outside the semaphore, so trains
+            # of all devices interleave instead of queueing behind each other
+            if delay: await asyncio.sleep(delay)
+            async with sem:
+                return await loop.run_in_executor(self._executor, self.probe, ip, t)
+
+        async def _icmp(dev_id, ip):
+            t = timeout if min_timeout is None else self.rtt.timeout_for(dev_id, min_timeout, timeout)
+            if train == 1:
+                ok, rtt = await _echo(ip, t, 0)
+                result = {'id': dev_id, 'ip': ip, 'ok': ok, 'rtt': rtt, 'timeout': round(t, 3)}
+            else:
+                echoes = await asyncio.gather(*(_echo(ip, t, i * spacing) for i in range(train)))
+                result = dict(train_stats(echoes), id=dev_id, ip=ip, timeout=round(t, 3))
+            if min_timeout is not None:
+                self.rtt.observe(dev_id, result['ok'], result['rtt'])
+            return result
+
+        async def _one(target):
+            dev_id, ip = target[0], target[1]
+            checks = target[2] if len(target) > 2 else None
+            if not checks:
+                result = await _icmp(dev_id, ip)
+            else:
+                # Echo and checks run side by side: a slow echo must not delay the checks (and vice versa)
+                result, outcomes = await asyncio.gather(_icmp(dev_id, ip),
+                                                        asyncio.gather(*(_check(ip, c) for c in checks)))
+                ok = result['ok']
+                result['icmp_ok'] = ok
+                result['checks'] = list(outcomes)
+                result['ok'] = all(c['ok'] for c in outcomes)
+                if not ok and result['ok']:
+                    result['rtt'] = min(c['ms'] for c in outcomes)  # ICMP filtered: service latency instead
+            if on_result: on_result(result)
+            return result
+
+        return await asyncio.gather(*(_one(t) for t in targets))
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
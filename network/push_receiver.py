@@ -0,0 +1,224 @@
+"""
+Syslog (UDP 514) and SNMP v1/v2c trap (UDP 162) receiver.
+Datagrams are only queued by the protocol callbacks; a batch task parses them,
+maps the sender to a device, coalesces link events per device and fires one
+confirmation probe (device + its direct children) whose result goes through
+the ping engine's normal state machine via CollectorHub. Devices owned by a
+remote collector are confirmed by that collector instead.
+"""
+import asyncio
+import re
+import socket
+import threading
+import time
+from collections import deque
+from core import metrics
+from core.database import Device, Collector, ServiceCheck, Setting
+from core.live_hub import LiveHub
+from network.collector_hub import CollectorHub
+from network.pinger import sweep_options
+from network.probe_engine import ProbeEngine
+
+# --- SYSLOG ---
+_LINK = re.compile(rb'(?i)(%LINK|%LINEPROTO|IFNET|IFPDT|PORT_?(?:UP|DOWN)|LINK_?(?:UP|DOWN)|link (?:is |state )?(?:up|down))')
+_DOWN = re.compile(rb'(?i)\bdown\b')
+_IFACE = re.compile(rb'(?i)interface\s+([^\s,;]+)')
+
+# --- SNMP TRAPS ---
+TRAP_OID = '1.3.6.1.6.3.1.1.4.1.0'  # snmpTrapOID.0 varbind in v2c traps
+TRAP_KINDS = {'1.3.6.1.6.3.1.1.5.1': 'cold_start', '1.3.6.1.6.3.1.1.5.2': 'warm_start',
+              '1.3.6.1.6.3.1.1.5.3': 'link_down', '1.3.6.1.6.3.1.1.5.4': 'link_up'}
+V1_GENERIC = {0: 'cold_start', 1: 'warm_start', 2: 'link_down', 3: 'link_up'}
+
+
+def parse_syslog(data):
+    """-> (kind, detail) where kind is link_down / link_up / None (not a link event)."""
+    if not _LINK.search(data):
+        return None, None
+    m = _IFACE.search(data)
+    detail = m.group(1).decode('utf-8', 'replace') if m else ""
+    return ('link_down' if _DOWN.search(data) else 'link_up'), detail
+
+
+def _tlv(buf, i):
+    """BER tag/length at buf[i] -> (tag, value_start, value_end)."""
+    tag = buf[i]
+    n = buf[i + 1]
+    i += 2
+    if n & 0x80:
+        count = n & 0x7F
+        n = int.from_bytes(buf[i:i + count], 'big')
+        i += count
+    return tag, i, i + n
+
+
+def _oid(raw):
+    first = raw[0]
+    parts = [str(first // 40), str(first % 40)]
+    v = 0
+    for b in raw[1:]:
+        v = (v << 7) | (b & 0x7F)
+        if not b & 0x80:
+            parts.append(str(v))
+            v = 0
+    return '.'.join(parts)
+
+
+def parse_trap(data):
+    """Minimal BER walk of a v1 / v2c trap. -> (kind, trap_oid) or (None, None) when not a trap."""
+    try:
+        tag, i, end = _tlv(data, 0)  # Message SEQUENCE
+        if tag != 0x30: return None, None
+        _, s, e = _tlv(data, i)  # version
+        _, s, i = _tlv(data, e)  # community
+        tag, i, end = _tlv(data, i)  # PDU
+        if tag == 0xA4:  # v1 Trap-PDU: enterprise, agent-addr, generic, specific, time, varbinds
+            _, s, e = _tlv(data, i)
+            enterprise = _oid(data[s:e])
+            _, s, e = _tlv(data, e)
+            _, s, e = _tlv(data, e)
+            generic = int.from_bytes(data[s:e], 'big')
+            return V1_GENERIC.get(generic, 'other'), enterprise
+        if tag != 0xA7:  # v2c SNMPv2-Trap-PDU
+            return None, None
+        for _ in range(3):  # request-id, error-status, error-index
+            _, s, i = _tlv(data, i)
+        _, i, vb_end = _tlv(data, i)  # varbind list
+        while i < vb_end:
+            _, s, i = _tlv(data, i)  # varbind SEQUENCE
+            _, os_, oe = _tlv(data, s)
+            if _oid(data[os_:oe]) == TRAP_OID:
+                tag, vs, ve = _tlv(data, oe)
+                trap_oid = _oid(data[vs:ve])
+                return TRAP_KINDS.get(trap_oid, 'other'), trap_oid
+        return 'other', None
+    except (IndexError, ValueError):
+        return None, None
+
+
+class _Inbox(asyncio.DatagramProtocol):
+    def __init__(self, source, queue):
+        self.source = source
+        self.queue = queue
+
+    def datagram_received(self, data, addr):
+        self.queue.append((self.source, data, addr[0]))
+
+
+class PushReceiver(threading.Thread):
+    """Runs both UDP listeners and the batch parser on one asyncio loop."""
+    BATCH_INTERVAL = 0.05
+    MAX_QUEUE = 200000  # Drop-oldest beyond this (burst protection)
+    INDEX_REFRESH_SEC = 30
+    CONFIRM_COOLDOWN_SEC = 5  # Per device: a flapping port must not turn into a probe storm
+    RCVBUF = 4 * 1024 * 1024
+
+    def __init__(self, app, syslog_port=514, trap_port=162, rtt=None):
+        super().__init__(daemon=True, name="rtm-push")
+        self.app = app
+        self.ports = {'syslog': syslog_port, 'trap': trap_port}
+        self.queue = deque(maxlen=self.MAX_QUEUE)
+        self.engine = ProbeEngine(concurrency=32)
+        if rtt is not None: self.engine.rtt = rtt  # The ping engine's estimator: confirm probes get the same adaptive RTO
+        self._by_ip = {}  # ip -> device id
+        self._ip_of = {}
+        self._children = {}
+        self._last_confirm = {}
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        loop = asyncio.get_running_loop()
+        for source, port in self.ports.items():
+            if not port: continue
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF)
+                sock.bind(('0.0.0.0', port))
+                await loop.create_datagram_endpoint(lambda s=source: _Inbox(s, self.queue), sock=sock)
+                print(f">>> {source} receiver listening on udp/{port}")
+            except OSError as e:
+                print(f"[push] cannot bind {source} udp/{port}: {e}")
+        next_refresh = 0.0
+        while True:
+            if time.monotonic() >= next_refresh:
+                await loop.run_in_executor(None, self._refresh_index)
+                next_refresh = time.monotonic() + self.INDEX_REFRESH_SEC
+            await asyncio.sleep(self.BATCH_INTERVAL)
+            if self.queue:
+                self._process(loop)
+
+    def _refresh_index(self):
+        with self.app.app_context():
+            rows = Device.query.with_entities(Device.id, Device.ip, Device.uplink_device_id) \
+                .filter_by(is_paused=False, is_stopped=False).all()
+        children = {}
+        for dev_id, _, up in rows:
+            if up: children.setdefault(up, []).append(dev_id)
+        self._by_ip = {ip: dev_id for dev_id, ip, _ in rows}
+        self._ip_of = {dev_id: ip for dev_id, ip, _ in rows}
+        self._children = children
+
+    def _process(self, loop):
+        batch = [self.queue.popleft() for _ in range(len(self.queue))]
+        counts = {}
+        events = {}  # dev_id -> (source, kind, detail); last one per batch wins
+        for source, data, ip in batch:
+            dev_id = self._by_ip.get(ip)
+            if dev_id is None:
+                counts[(source, 'unknown_source')] = counts.get((source, 'unknown_source'), 0) + 1
+                continue
+            kind, detail = parse_syslog(data) if source == 'syslog' else parse_trap(data)
+            if kind in ('link_down', 'link_up', 'cold_start', 'warm_start'):
+                events[dev_id] = (source, kind, detail)
+                counts[(source, kind)] = counts.get((source, kind), 0) + 1
+            else:
+                counts[(source, 'ignored')] = counts.get((source, 'ignored'), 0) + 1
+        for (source, result), n in counts.items():
+            metrics.PUSH_MESSAGES.inc(n, source, result)
+        if events:
+            loop.create_task(self._confirm(events))
+
+    def _confirm_targets(self, ids):
+        """
+        Confirm targets built like a regular poll (service checks, sweep options,
+        global timeout). -> (local targets, {collector name: [ids]}, timeout, opts)
+        """
+        with self.app.app_context():
+            devices = Device.query.filter(Device.id.in_(ids)).filter_by(is_paused=False, is_stopped=False).all()
+            local, remote = CollectorHub.partition(devices, Collector.query.all())
+            checks = ServiceCheck.by_device()
+            opts = sweep_options()
+            try:
+                timeout = int(Setting.get("ping_timeout_sec", "30"))
+            except:
+                timeout = 30
+        targets = [(d.id, d.ip, checks[d.id]) if d.id in checks else (d.id, d.ip) for d in local]
+        return targets, {name: [d.id for d in devs] for name, devs in remote.items()}, timeout, opts
+
+    async def _confirm(self, events):
+        now = time.monotonic()
+        ip_of = self._ip_of
+        ids = set()
+        for dev_id, (source, kind, detail) in events.items():
+            if now - self._last_confirm.get(dev_id, 0) < self.CONFIRM_COOLDOWN_SEC: continue
+            self._last_confirm[dev_id] = now
+            # The sender is evidently alive; what a link event can hide is what hangs below it
+            ids.update(d for d in [dev_id] + self._children.get(dev_id, []) if d in ip_of)
+            # Status is the source, not UP/DOWN: a port event is not an outage (and must not sound the alarm)
+            LiveHub.publish('log', 'log_update', {'time': time.strftime("%H:%M:%S"), 'device': ip_of.get(dev_id, ''),
+                                                  'status': source.upper(),
+                                                  'msg': f"{kind.replace('_', ' ')} {detail or ''}".strip()})
+        if not ids: return
+        if len(self._last_confirm) > 100000:
+            self._last_confirm = {k: v for k, v in self._last_confirm.items() if now - v < self.CONFIRM_COOLDOWN_SEC}
+        targets, remote, timeout, opts = await asyncio.get_running_loop().run_in_executor(
+            None, self._confirm_targets, list(ids))
+        for name, dev_ids in remote.items():
+            CollectorHub.request_confirm(name, dev_ids)
+        if not targets: return
+        results = await self.engine.sweep_async(targets, timeout, None, opts['min_timeout'], opts['train'],
+                                                opts['spacing'])
+        for r in results: r['confirm'] = True  # A failed confirm alone never takes a device DOWN (see PingWorker._apply)
+        CollectorHub.submit(results, urgent=True)
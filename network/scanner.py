@@ -0,0 +1,83 @@
+import ipaddress
+from core.database import Device, Setting, Collector, ServiceCheck
+from network.collector_hub import CollectorHub
+from network.probe_engine import ProbeEngine
+
+SCOPES = ('all', 'subnet', 'uplink', 'down')
+
+
+def parse_scope(scope, value):
+    """Validates a scan scope. Returns a hashable (scope, value) key or raises ValueError."""
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown scope '{scope}'")
+    if scope == 'subnet':
+        return scope, str(ipaddress.ip_network(str(value).strip(), strict=False))
+    if scope == 'uplink':
+        return scope, int(value)
+    return scope, None
+
+
+def select_devices(scope, value):
+    devices = Device.query.filter_by(is_paused=False, is_stopped=False).all()
+    if scope == 'down':
+        return [d for d in devices if d.state == 'DOWN']
+    if scope == 'subnet':
+        net = ipaddress.ip_network(value)
+        out = []
+        for d in devices:
+            try:
+                addr = ipaddress.ip_address(d.ip)
+            except ValueError:
+                continue
+            if addr.version == net.version and addr in net: out.append(d)
+        return out
+    if scope == 'uplink':
+        # Root device + everything hanging below it
+        children = {}
+        for d in devices:
+            children.setdefault(d.uplink_device_id, []).append(d)
+        by_id = {d.id: d for d in devices}
+        out, stack, seen = [], [value], set()
+        while stack:
+            dev_id = stack.pop()
+            if dev_id in seen: continue
+            seen.add(dev_id)
+            if dev_id in by_id: out.append(by_id[dev_id])
+            stack.extend(c.id for c in children.get(dev_id, []))
+        return out
+    return devices
+
+
+def make_scan_job(app, scope, value):
+    """
+    Builds the job body for JobManager.
+    Results are streamed through the job and handed to the ping engine
+    (via CollectorHub) so state changes go through the usual state machine.
+    """
+
+    def _scan(job):
+        with app.app_context():
+            devices = select_devices(scope, value)
+            local, _ = CollectorHub.partition(devices, Collector.query.all())
+            checks = ServiceCheck.by_device()
+            targets = [(d.id, d.ip, checks[d.id]) if d.id in checks else (d.id, d.ip) for d in local]
+            try:
+                timeout = int(Setting.get("scan_timeout_sec", "2"))
+            except:
+                timeout = 2
+
+        job.progress(done=0, total=len(targets))
+        counter = [0]
+
+        def _on_result(r):
+            counter[0] += 1
+            job.progress(done=counter[0], result=r)
+
+        engine = ProbeEngine()
+        try:
+            results = engine.sweep(targets, timeout, on_result=_on_result)
+        finally:
+            engine.close()
+        CollectorHub.submit(results, urgent=True)  # Someone is watching this scan: apply now, not at the next cycle
+
+    return _scan
@@ -0,0 +1,110 @@
+"""
+Native asyncio service checks. They run on the ProbeEngine loop next to the
+ICMP probes and share its concurrency budget.
+Every check returns {'id', 'kind', 'ok', 'ms', 'detail'}.
+"""
+import asyncio
+import random
+import ssl
+import struct
+import time
+
+DEFAULT_TIMEOUT_MS = 3000
+
+
+async def tcp_check(ip, port, timeout):
+    """TCP connect() to ip:port."""
+    t0 = time.perf_counter()
+    _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    ms = (time.perf_counter() - t0) * 1000
+    writer.close()
+    return True, ms, f"port {port} open"
+
+
+async def http_check(ip, port, path, expect, timeout, use_tls=False):
+    """Minimal HTTP/1.0 GET; passes when the status code matches `expect` (default: < 400)."""
+    t0 = time.perf_counter()
+    ctx = None
+    if use_tls:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE  # Management UIs mostly use self-signed certs
+
+    async def _get():
+        reader, writer = await asyncio.open_connection(ip, port, ssl=ctx)
+        try:
+            writer.write(f"GET {path or '/'} HTTP/1.0\r\nHost: {ip}\r\nUser-Agent: RTM-Monitor\r\n"
+                         f"Connection: close\r\n\r\n".encode())
+            await writer.drain()
+            return await reader.readline()
+        finally:
+            writer.close()
+
+    status_line = await asyncio.wait_for(_get(), timeout)
+    ms = (time.perf_counter() - t0) * 1000
+    try:
+        code = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        return False, ms, "bad HTTP response"
+    ok = code == int(expect) if expect else code < 400
+    return ok, ms, f"HTTP {code}"
+
+
+def _dns_query(name, qid):
+    header = struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0)  # RD=1, one question
+    qname = b"".join(bytes([len(p)]) + p.encode() for p in name.strip('.').split('.')) + b"\x00"
+    return header + qname + struct.pack(">HH", 1, 1)  # A / IN
+
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+    def __init__(self, qid):
+        self.qid = qid
+        self.answer = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 12 and struct.unpack(">H", data[:2])[0] == self.qid and not self.answer.done():
+            self.answer.set_result(data)
+
+    def error_received(self, exc):
+        if not self.answer.done(): self.answer.set_exception(exc)
+
+
+async def dns_check(ip, name, timeout, port=53):
+    """Asks the DNS server at `ip` to resolve `name`; passes on NOERROR with at least one answer."""
+    loop = asyncio.get_running_loop()
+    qid = random.randint(0, 0xFFFF)
+    t0 = time.perf_counter()
+    transport, proto = await loop.create_datagram_endpoint(lambda: _DNSProtocol(qid), remote_addr=(ip, port))
+    try:
+        transport.sendto(_dns_query(name, qid))
+        data = await asyncio.wait_for(proto.answer, timeout)
+    finally:
+        transport.close()
+    ms = (time.perf_counter() - t0) * 1000
+    flags, _, ancount = struct.unpack(">HHH", data[2:8])
+    rcode = flags & 0x000F
+    if rcode != 0:
+        return False, ms, f"rcode {rcode}"
+    return ancount > 0, ms, f"{ancount} answer(s)"
+
+
+async def run_check(ip, check):
+    """Dispatches one check definition (dict) and never raises."""
+    kind = check.get('kind')
+    timeout = (check.get('timeout_ms') or DEFAULT_TIMEOUT_MS) / 1000.0
+    try:
+        if kind == 'tcp':
+            ok, ms, detail = await tcp_check(ip, int(check['port']), timeout)
+        elif kind in ('http', 'https'):
+            port = int(check.get('port') or (443 if kind == 'https' else 80))
+            ok, ms, detail = await http_check(ip, port, check.get('target'), check.get('expect'), timeout,
+                                              use_tls=kind == 'https')
+        elif kind == 'dns':
+            ok, ms, detail = await dns_check(ip, check.get('target') or 'localhost', timeout)
+        else:
+            ok, ms, detail = False, 0, f"unknown check '{kind}'"
+    except asyncio.TimeoutError:
+        ok, ms, detail = False, 0, "timeout"
+    except (OSError, ValueError, KeyError) as e:
+        ok, ms, detail = False, 0, e.__class__.__name__
+    return {'id': check.get('id'), 'kind': kind, 'ok': ok, 'ms': round(ms, 1), 'detail': detail}
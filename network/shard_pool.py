@@ -0,0 +1,132 @@
+import bisect
+import hashlib
+import multiprocessing as mp
+import queue
+import time
+from network.probe_engine import ProbeEngine
+
+
+class HashRing:
+    """Consistent hash ring: adding/removing devices only moves those devices."""
+    VNODES = 64
+
+    def __init__(self, shards):
+        self._ring = sorted(
+            (self._hash(f"shard-{s}:{v}"), s) for s in range(shards) for v in range(self.VNODES)
+        )
+        self._keys = [k for k, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+    def shard_for(self, dev_id):
+        i = bisect.bisect(self._keys, self._hash(dev_id)) % len(self._keys)
+        return self._ring[i][1]
+
+
+def shard_main(shard_id, conn, results, pause_sec=2):
+    """
+    Worker process entry point.
+    Receives (targets, timeout, sweep_opts, rtt_seeds) assignments over `conn`, sweeps them
+    forever and pushes (shard_id, results) batches onto the shared `results` queue; results
+    carry the shard's RTT estimates so the parent can checkpoint them.
+    `None` on the pipe stops the worker.
+    """
+    engine = ProbeEngine()
+    targets, timeout, opts = [], 30, {}
+    try:
+        while True:
+            # Pick up the latest assignment (rebalance) without blocking the sweep
+            wait = 0 if targets else 1
+            while conn.poll(wait):
+                msg = conn.recv()
+                if msg is None: return
+                targets, timeout, opts, seeds = msg
+                for dev_id, (srtt, rttvar) in seeds.items():
+                    engine.rtt.restore(dev_id, srtt, rttvar)
+                wait = 0
+
+            if targets:
+                results.put((shard_id, engine.rtt.annotate(engine.sweep(targets, timeout, **opts))))
+                time.sleep(pause_sec)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        engine.close()
+
+
+class ShardPool:
+    """
+    Spreads the device set over N probe processes.
+    The parent keeps ownership of DB writes and socket emits; workers only probe.
+    """
+
+    def __init__(self, processes):
+        self.processes = max(1, int(processes))
+        self.ring = HashRing(self.processes)
+        self._ctx = mp.get_context('spawn')
+        self.results = self._ctx.Queue()
+        self._workers = [None] * self.processes  # (Process, parent_conn)
+        self._assigned = [None] * self.processes  # Last assignment sent per shard
+
+    def start(self):
+        for s in range(self.processes):
+            self._spawn(s)
+
+    def _spawn(self, s):
+        parent_conn, child_conn = self._ctx.Pipe()
+        p = self._ctx.Process(target=shard_main, args=(s, child_conn, self.results), daemon=True,
+                              name=f"rtm-shard-{s}")
+        p.start()
+        self._workers[s] = (p, parent_conn)
+        self._assigned[s] = None
+
+    def assign(self, targets, timeout, opts=None, rtt=None):
+        """
+        Split (device_id, ip[, checks]) targets over the ring and push changed
+        assignments only. Dead workers are restarted here. Devices new to a shard
+        are seeded from `rtt` (the parent's RttEstimator mirror: warm restarts, rebalancing).
+        """
+        buckets = [[] for _ in range(self.processes)]
+        for t in targets:
+            buckets[self.ring.shard_for(t[0])].append(t)
+
+        for s, bucket in enumerate(buckets):
+            p, conn = self._workers[s]
+            if not p.is_alive():
+                self._spawn(s)
+                p, conn = self._workers[s]
+            msg = (sorted(bucket, key=lambda t: t[0]), timeout, opts or {})
+            if msg != self._assigned[s]:
+                known = {t[0] for t in self._assigned[s][0]} if self._assigned[s] else set()
+                seeds = {}
+                for t in bucket:
+                    est = rtt.export(t[0]) if rtt and t[0] not in known else None
+                    if est: seeds[t[0]] = est
+                conn.send(msg + (seeds,))
+                self._assigned[s] = msg
+
+    def drain(self, wait=1.0):
+        """Collect every result batch available, waiting up to `wait` for the first."""
+        out = []
+        try:
+            _, batch = self.results.get(timeout=wait)
+            out.extend(batch)
+            while True:
+                _, batch = self.results.get_nowait()
+                out.extend(batch)
+        except queue.Empty:
+            pass
+        return out
+
+    def stop(self):
+        for w in self._workers:
+            if not w: continue
+            p, conn = w
+            try:
+                conn.send(None)
+            except (OSError, EOFError):
+                pass
+            p.join(timeout=2)
+            if p.is_alive(): p.terminate()
@@ -33,4 +33,29 @@ class SNMPManager:
     @staticmethod
     def quick_scan(ip, community="public"):
         # System Description OID
-        return SNMPManager.get(ip, community, '1.3.6.1.2.1.1.1.0')
\ No newline at end of file
+        return SNMPManager.get(ip, community, '1.3.6.1.2.1.1.1.0')
+
+    @staticmethod
+    def walk(ip, community, oid, port=161, max_rows=5000):
+        """
+        GETBULK walk of one subtree. Returns (ok, [(oid_str, value), ...]) where value is
+        the raw pysnmp object (callers decide between str() and asOctets()).
+        """
+        rows = []
+        engine = SnmpEngine()
+        for errorIndication, errorStatus, errorIndex, varBinds in bulkCmd(
+                engine,
+                CommunityData(community, mpModel=1),  # v2c
+                UdpTransportTarget((ip, port), timeout=2, retries=1),
+                ContextData(),
+                0, 25,
+                ObjectType(ObjectIdentity(oid)),
+                lexicographicMode=False):
+            if errorIndication:
+                return False, str(errorIndication)
+            if errorStatus:
+                return False, errorStatus.prettyPrint()
+            for name, value in varBinds:
+                rows.append((str(name), value))
+            if len(rows) >= max_rows: break
+        return True, rows
@@ -1,6 +1,7 @@
 from netmiko import ConnectHandler
 import json
 import os
+import re
 from config import Config
 
 
@@ -51,4 +52,31 @@ class SSHManager:
 
                 return True, f"Success: {output}"
         except Exception as e:
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
+
+    @staticmethod
+    def fetch_config(ip, username, password, device_type, timeout=60, drivers=None):
+        """
+        Pulls the running configuration. Volatile lines (timestamps etc., per driver
+        'config_ignore') are dropped so unchanged configs hash identically.
+        """
+        drivers = drivers or SSHManager.load_drivers()
+        driver = drivers.get(device_type, drivers['cisco_ios'])
+
+        device_params = {
+            'device_type': device_type if device_type in drivers else 'cisco_ios',
+            'host': ip,
+            'username': username,
+            'password': password,
+            'conn_timeout': min(timeout, 15),
+            'auth_timeout': min(timeout, 15),
+        }
+
+        try:
+            with ConnectHandler(**device_params) as ssh:
+                output = ssh.send_command(driver['cmd_show_config'], read_timeout=timeout)
+        except Exception as e:
+            return False, str(e)
+        ignore = [re.compile(p) for p in driver.get('config_ignore', [])]
+        lines = [l.rstrip() for l in output.splitlines() if not any(p.match(l) for p in ignore)]
+        return True, "\n".join(lines).strip() + "\n"
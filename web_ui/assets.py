@@ -0,0 +1,150 @@
+"""
+Self-hosted front-end assets.
+Third-party libraries are vendored under static/vendor (fetched once with
+`python -m web_ui.assets fetch`), every static URL carries a content
+fingerprint so it can be cached for a year, and .gz/.br siblings are served
+to clients that accept them.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli  # Optional: gzip only without it
+except ImportError:
+    brotli = None
+
+# name -> (CDN url, path under static/); the CDN is only a fallback until `fetch` has run
+VENDOR = {
+    'socket.io.js': ('https://cdn.socket.io/4.7.5/socket.io.min.js', 'vendor/socket.io/socket.io.min.js'),
+    'chart.js': ('https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js', 'vendor/chart.js/chart.umd.js'),
+    'vis-network.js': ('https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js',
+                       'vendor/vis-network/vis-network.min.js'),
+    'gridstack.js': ('https://cdn.jsdelivr.net/npm/gridstack@7.2.3/dist/gridstack-all.js', 'vendor/gridstack/gridstack-all.js'),
+    'gridstack.css': ('https://cdn.jsdelivr.net/npm/gridstack@7.2.3/dist/gridstack.min.css',
+                      'vendor/gridstack/gridstack.min.css'),
+    'particles.js': ('https://cdn.jsdelivr.net/npm/particles.js@2.0.0/particles.min.js', 'vendor/particles/particles.min.js'),
+    'three.js': ('https://cdnjs.cloudflare.com/ajax/libs/three.js/r134/three.min.js', 'vendor/three/three.min.js'),
+    'vanta.globe.js': ('https://cdn.jsdelivr.net/npm/vanta@0.5.24/dist/vanta.globe.min.js', 'vendor/vanta/vanta.globe.min.js'),
+    'fontawesome.css': ('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+                        'vendor/fontawesome/css/all.min.css'),
+}
+# Files referenced from inside vendored CSS (relative urls), fetched alongside
+VENDOR_EXTRA = [
+    (f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/webfonts/{f}', f'vendor/fontawesome/webfonts/{f}')
+    for f in ('fa-solid-900.woff2', 'fa-solid-900.ttf', 'fa-regular-400.woff2', 'fa-regular-400.ttf',
+              'fa-brands-400.woff2', 'fa-brands-400.ttf', 'fa-v4compatibility.woff2', 'fa-v4compatibility.ttf')
+]
+
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.ttf', '.map', '.html', '.txt')
+MIN_COMPRESS_BYTES = 1024
+CACHE_FOREVER = 'public, max-age=31536000, immutable'
+
+
+class Assets:
+    """Wires fingerprinted URLs, precompressed variants and cache headers into a Flask app."""
+    _lock = threading.Lock()
+    _fingerprints = {}  # path -> (mtime, digest)
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+
+    def init_app(self, app):
+        app.add_template_global(self.url, 'asset')
+        app.view_functions['static'] = self.serve
+        threading.Thread(target=self.precompress, daemon=True, name="rtm-assets").start()
+
+    # --- URLS ---
+    def _fingerprint(self, path):
+        full = os.path.join(self.static_folder, path)
+        try:
+            mtime = os.path.getmtime(full)
+        except OSError:
+            return None
+        hit = self._fingerprints.get(path)
+        if hit and hit[0] == mtime: return hit[1]
+        with open(full, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:10]
+        with self._lock:
+            self._fingerprints[path] = (mtime, digest)
+        return digest
+
+    def url(self, name):
+        """Template helper: asset('chart.js') / asset('style.css') -> fingerprinted local URL (CDN until vendored)."""
+        cdn, path = VENDOR.get(name, (None, name))
+        digest = self._fingerprint(path)
+        if digest is None:
+            return cdn or url_for('static', filename=path)
+        return url_for('static', filename=path, v=digest)
+
+    # --- SERVING ---
+    def serve(self, filename):
+        """Replacement for Flask's static view: precompressed variant if accepted, long cache if fingerprinted."""
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        resp = None
+        if filename.endswith(COMPRESSIBLE):
+            for ext, coding in (('.br', 'br'), ('.gz', 'gzip')):
+                if coding in request.accept_encodings and \
+                        os.path.isfile(os.path.join(self.static_folder, filename + ext)):
+                    resp = send_from_directory(self.static_folder, filename + ext, mimetype=mimetype)
+                    resp.headers['Content-Encoding'] = coding
+                    break
+            resp = resp or send_from_directory(self.static_folder, filename, mimetype=mimetype)
+            resp.headers['Vary'] = 'Accept-Encoding'
+        else:
+            resp = send_from_directory(self.static_folder, filename, mimetype=mimetype)
+        if request.args.get('v'):
+            resp.headers['Cache-Control'] = CACHE_FOREVER
+        return resp
+
+    # --- BUILD ---
+    def precompress(self):
+        """Writes missing/stale .gz (and .br with the brotli module) next to text assets. Read-only installs are skipped."""
+        for root, _, files in os.walk(self.static_folder):
+            for f in files:
+                if not f.endswith(COMPRESSIBLE): continue
+                src = os.path.join(root, f)
+                try:
+                    if os.path.getsize(src) < MIN_COMPRESS_BYTES: continue
+                    mtime = os.path.getmtime(src)
+                    variants = [('.gz', lambda b: gzip.compress(b, 9, mtime=0))]
+                    if brotli: variants.append(('.br', lambda b: brotli.compress(b, quality=11)))
+                    data = None
+                    for ext, fn in variants:
+                        if os.path.exists(src + ext) and os.path.getmtime(src + ext) >= mtime: continue
+                        if data is None:
+                            with open(src, 'rb') as fin:
+                                data = fin.read()
+                        with open(src + ext + '.tmp', 'wb') as out:
+                            out.write(fn(data))
+                        os.replace(src + ext + '.tmp', src + ext)
+                except OSError:
+                    continue
+
+
+def fetch(static_folder, force=False):
+    """Downloads every vendored file (build step; needs internet once)."""
+    import requests
+
+    for url, path in list(VENDOR.values()) + VENDOR_EXTRA:
+        dest = os.path.join(static_folder, path)
+        if os.path.exists(dest) and not force: continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
+        with open(dest, 'wb') as f:
+            f.write(r.content)
+        print(f"  {path:<50} {len(r.content) // 1024:>6} KB")
+    Assets(static_folder).precompress()
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['fetch']:
+        sys.exit("usage: python -m web_ui.assets fetch [--force]")
+    fetch(STATIC_DIR, force='--force' in sys.argv)
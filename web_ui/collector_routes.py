@@ -0,0 +1,74 @@
+from datetime import datetime
+from flask import Blueprint, request, Response, jsonify
+from core.database import db, Collector, Device, Setting, ServiceCheck
+from core.security import SecurityManager
+from network import collector_proto as proto
+from network.collector_hub import CollectorHub
+from network.pinger import sweep_options
+
+# Machine-to-machine API: authenticated by HMAC, not by the login session
+bp = Blueprint('collector', __name__, url_prefix='/api/collector')
+
+MAX_BODY = 8 * 1024 * 1024
+
+
+def _signed(secret, payload, status=200):
+    body, sig = proto.pack(secret, payload)
+    return Response(body, status=status, mimetype='application/octet-stream', headers={proto.HDR_SIG: sig})
+
+
+def _targets(devices):
+    checks = ServiceCheck.by_device()
+    return [[d.id, d.ip, checks[d.id]] if d.id in checks else [d.id, d.ip]
+            for d in sorted(devices, key=lambda d: d.id)]
+
+
+@bp.route('/sync', methods=['POST'])
+def sync():
+    """
+    One round trip per collector cycle:
+    uploads a batch of buffered results, downloads the current assignment.
+    """
+    name = request.headers.get(proto.HDR_NAME, '')
+    col = Collector.query.filter_by(name=name).first()
+    if not col:
+        return jsonify({'error': 'unknown collector'}), 403
+    if (request.content_length or 0) > MAX_BODY:
+        return jsonify({'error': 'batch too large'}), 413
+
+    try:
+        secret = SecurityManager.unseal(col.secret)  # Collectors registered by older versions hold plaintext
+        payload = proto.unpack(secret, request.get_data(), request.headers.get(proto.HDR_SIG))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    if CollectorHub.replayed(col.name, payload.get('batch_id')):
+        return jsonify({'error': 'replayed batch'}), 409
+
+    # Accept only results for devices this collector currently owns
+    collectors = Collector.query.all()
+    devices = Device.query.filter_by(is_paused=False, is_stopped=False).all()
+    _, remote = CollectorHub.partition(devices, collectors)
+    owned = remote.get(col.name, [])
+    owned_ids = {d.id for d in owned}
+
+    accepted = [r for r in payload.get('results', []) if r.get('id') in owned_ids]
+    if accepted:
+        # Confirm probes answer a syslog/trap event: applied now, not at the next engine cycle
+        CollectorHub.submit(accepted, urgent=any(r.get('confirm') for r in accepted))
+
+    col.last_seen = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        timeout = int(Setting.get("ping_timeout_sec", "30"))
+    except:
+        timeout = 30
+
+    return _signed(secret, {
+        'acked': payload.get('batch_id'),
+        'accepted': len(accepted),
+        'targets': _targets(owned),
+        'timeout': timeout,
+        'opts': sweep_options(),
+        'confirm': CollectorHub.take_confirms(col.name),
+    })
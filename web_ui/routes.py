@@ -1,9 +1,22 @@
+import ipaddress
 import json
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory
 from flask_login import login_user, login_required, logout_user, current_user
-from core.database import db, User, Device
+import secrets
+from core.database import db, User, Device, Collector, ServiceCheck, Setting, ConfigVersion
 from core.security import SecurityManager
+from core.topology_mgr import TopologyManager
+from core.device_index import DeviceLookup
+from core.job_mgr import JobManager
+from core.login_guard import LoginGuard
+from core.maintenance import MaintenanceManager
+from network import scanner
+from network.engine_state import EngineState
+from network import discovery
+from network import config_backup
 from config import Config
 
 bp = Blueprint('main', __name__, template_folder='templates')
@@ -50,29 +63,38 @@ def login():
     if request.method == 'POST':
         u = request.form.get('username')
         p = request.form.get('password')
-        user = User.query.filter_by(username=u).first()
+        ip = request.remote_addr or '?'
+
+        allowed, retry_after = LoginGuard.allow(ip, u)
+        if not allowed:
+            flash(f"Too many login attempts. Try again in {retry_after}s.", "danger")
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
 
-        if user:
+        user = User.query.filter_by(username=u).first()
+        # Unknown and blocked accounts pay the same hash and failure penalty as a wrong password
+        ok = LoginGuard.check_password(user, p)
+        if ok is None:
+            flash("Server busy, please retry.", "danger")
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        blocked = user is not None and not user.active and user.username != 'superadmin'
+        LoginGuard.record(ip, u, ok and not blocked)
+
+        if ok and blocked:
             # CHECK BLOCK STATUS
-            if not user.active and user.username != 'superadmin':
-                flash("🚫 ACCOUNT BLOCKED. Contact Administrator.", "danger")
-                return render_template('login.html')
-
-            if user.check_password(p):
-                if user.username == 'superadmin':
-                    login_user(user)
-                    return redirect(url_for('main.setup'))
-
-                valid, msg = SecurityManager.verify_license(user)
-                if valid:
-                    login_user(user)
-                    return redirect(url_for('main.dashboard'))
-                else:
-                    flash(msg, "danger")
+            flash("🚫 ACCOUNT BLOCKED. Contact Administrator.", "danger")
+        elif ok:
+            if user.username == 'superadmin':
+                login_user(user)
+                return redirect(url_for('main.setup'))
+
+            valid, msg = SecurityManager.verify_license(user)
+            if valid:
+                login_user(user)
+                return redirect(url_for('main.dashboard'))
             else:
-                flash("Invalid Credentials", "danger")
+                flash(msg, "danger")
         else:
-            flash("User not found", "danger")
+            flash("Invalid Credentials", "danger")
 
     return render_template('login.html')
 
@@ -115,6 +137,7 @@ def setup():
                 new_user.set_password(u_pass)
                 db.session.add(new_user)
                 db.session.commit()
+                User.invalidate(new_user.id)
                 flash(f"✅ User '{u_name}' Created!", "success")
 
         # --- 2. RENEW LICENSE (Extend 1 Year) ---
@@ -131,6 +154,7 @@ def setup():
                 user.license_hash = new_seal
                 user.active = True  # Unblock if blocked
                 db.session.commit()
+                User.invalidate(user.id)
                 flash(f"🔄 License Renewed for {user.username} (+1 Year)", "success")
 
         # --- 3. BLOCK / UNBLOCK ---
@@ -140,6 +164,7 @@ def setup():
             if user:
                 user.active = not user.active
                 db.session.commit()
+                User.invalidate(user.id)
                 status = "Unblocked" if user.active else "Blocked"
                 flash(f"User {user.username} is now {status}", "info")
 
@@ -150,6 +175,7 @@ def setup():
             if user:
                 db.session.delete(user)
                 db.session.commit()
+                User.invalidate(user.id)
                 flash(f"🗑️ User {user.username} Deleted.", "warning")
 
     # List all users except superadmin
@@ -162,31 +188,185 @@ def setup():
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    up = Device.query.filter_by(state="UP").count()
-    down = Device.query.filter_by(state="DOWN").count()
-    total = Device.query.count()
-    devices = Device.query.all()
-    return render_template('dashboard.html', up=up, down=down, total=total, devices=devices)
+    counts = DeviceLookup.counts()
+    return render_template('dashboard.html', up=counts.get("UP", 0), down=counts.get("DOWN", 0), total=counts['total'])
 
 
 @bp.route('/api/topology')
 @login_required
 def api_topology():
-    devices = Device.query.all()
-    nodes = []
-    edges = []
-    for d in devices:
-        group = d.device_type if d.device_type else "SWITCH"
-        nodes.append({"id": d.id, "label": f"{d.name}\n({d.ip})", "group": group, "status": d.state})
-        if d.uplink_device_id: edges.append({"from": d.uplink_device_id, "to": d.id})
-    return jsonify({"nodes": nodes, "edges": edges})
+    """
+    Cached topology graph.
+    ?layout=1            -> include precomputed hierarchical x/y (client can skip physics)
+    ?version=V&since=S   -> only status changes after seq S (or {"reset": true})
+    """
+    etag = TopologyManager.etag()
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    if request.args.get('since') is not None:
+        payload = TopologyManager.deltas(request.args.get('version', type=int), request.args.get('since', type=int) or 0)
+        if payload is None: payload = {"reset": True}
+    else:
+        payload = TopologyManager.snapshot(with_layout=request.args.get('layout') == '1')
+
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+@bp.route('/api/scan', methods=['POST'])
+@login_required
+def api_scan():
+    """
+    On-demand scan as a background job. Returns at once with the job;
+    progress is streamed over Socket.IO ('job_progress').
+    scope: all | subnet (value=CIDR) | uplink (value=device id) | down
+    """
+    data = request.get_json(silent=True) or request.form
+    try:
+        scope, value = scanner.parse_scope(data.get('scope', 'all'), data.get('value'))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    job, created = JobManager.submit('scan', (scope, value),
+                                     scanner.make_scan_job(current_app._get_current_object(), scope, value))
+    return jsonify({"job": job.to_dict(), "created": created}), 202
+
+
+@bp.route('/api/jobs/<job_id>')
+@login_required
+def api_job(job_id):
+    job = JobManager.get(job_id)
+    if not job: return jsonify({"error": "not found"}), 404
+    return jsonify(job.to_dict(with_results=request.args.get('results') == '1'))
+
+
+@bp.route('/api/reports', methods=['POST'])
+@login_required
+def api_reports():
+    """
+    Availability/SLA report as a background job.
+    month=YYYY-MM, months=1..24, group=device|site, format=csv|html.
+    The finished job carries 'artifact'; fetch it from /reports/<job_id>/download.
+    """
+    from core import reports  # numpy: loaded on the first report, not at startup
+    data = request.get_json(silent=True) or request.form
+    month = data.get('month') or datetime.utcnow().strftime('%Y-%m')
+    group, fmt = data.get('group', 'device'), data.get('format', 'csv')
+    try:
+        months = int(data.get('months', 1))
+        reports.parse_period(month, months)
+    except (ValueError, TypeError):
+        return jsonify({"error": "month must be YYYY-MM and months a number"}), 400
+    if group not in reports.GROUPS or fmt not in reports.FORMATS:
+        return jsonify({"error": "group must be device|site, format csv|html"}), 400
+
+    job, created = JobManager.submit('report', (month, months, group, fmt),
+                                     reports.make_report_job(current_app._get_current_object(), month, months, group, fmt))
+    return jsonify({"job": job.to_dict(), "created": created}), 202
+
+
+@bp.route('/reports/<job_id>/download')
+@login_required
+def report_download(job_id):
+    job = JobManager.get(job_id)
+    if not job or not job.artifact: return jsonify({"error": "not ready"}), 404
+    from core import reports
+    return send_from_directory(reports.REPORT_DIR, job.artifact, as_attachment=True)
 
 
 @bp.route('/devices')
 @login_required
 def devices():
     devices = Device.query.all()
-    return render_template('devices.html', devices=devices)
+    return render_template('devices.html', devices=devices, live=EngineState.get)
+
+
+@bp.route('/api/devices/state')
+@login_required
+def api_devices_state():
+    """Engine runtime state per device (last RTT, loss, counters); warm right after a restart."""
+    out = {}
+    for d in Device.query.with_entities(Device.id).all():
+        st = EngineState.get(d.id)
+        if st: out[d.id] = st
+    return jsonify(out)
+
+
+def _is_ip(text):
+    try:
+        ipaddress.ip_address(text)
+        return True
+    except ValueError:
+        return False
+
+
+@bp.route('/api/devices/search')
+@login_required
+def api_devices_search():
+    """
+    Type-ahead / lookup over the in-memory device index.
+    q: name or IP prefix | full IP (exact, else longest-prefix neighbours) | CIDR (members)
+    state: optional filter (UP/DOWN/...), limit: max results (default 20, CIDR 1000)
+    A state filter without q also returns total: the full count behind a capped list.
+    """
+    t0 = time.perf_counter()
+    q = (request.args.get('q') or "").strip()
+    state = request.args.get('state') or None
+    try:
+        limit = max(1, min(5000, int(request.args.get('limit', 1000 if '/' in q else 20))))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    out = {"query": q}
+    try:
+        if '/' in q:
+            out.update(kind="subnet", results=DeviceLookup.within(q, limit, state))
+        elif DeviceLookup.by_ip(q) is not None:
+            out.update(kind="ip", results=[DeviceLookup.by_ip(q)])
+        elif _is_ip(q):
+            ids, bits = DeviceLookup.nearest(q)
+            out.update(kind="nearest", prefixlen=bits, results=ids[:limit])
+        else:
+            out.update(kind="prefix", results=DeviceLookup.prefix(q, limit, state) if q or state else [])
+            if state and not q: out["total"] = DeviceLookup.counts().get(state, 0)  # Lists capped by limit say "N of total"
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    out["results"] = DeviceLookup.describe(out["results"])
+    out["took_us"] = round((time.perf_counter() - t0) * 1e6, 1)
+    return jsonify(out)
+
+
+@bp.route('/api/anomalies')
+@login_required
+def api_anomalies():
+    """Devices whose latency currently sits far above their own baseline (worst first)."""
+    from network.anomaly import LatencyBaseline
+    rows = LatencyBaseline.active()
+    info = {d['id']: d for d in DeviceLookup.describe([r['id'] for r in rows])}
+    for r in rows:
+        r.update(name=info.get(r['id'], {}).get('name'), ip=info.get(r['id'], {}).get('ip'))
+    return jsonify(rows)
+
+
+@bp.route('/api/forecast', methods=['GET', 'POST'])
+@login_required
+def api_forecast():
+    """
+    GET: devices whose latency / loss trend crosses its threshold within the horizon (soonest first).
+    POST: run the incremental forecast job now (it also runs hourly).
+    """
+    from core import forecast  # numpy
+    if request.method == 'POST':
+        job, created = forecast.submit(current_app._get_current_object())
+        return jsonify({"job": job.to_dict(), "created": created}), 202
+    limits, horizon = forecast.thresholds()
+    rows = forecast.Forecaster.at_risk(limits, horizon)
+    info = {d['id']: d for d in DeviceLookup.describe([r['id'] for r in rows])}
+    for r in rows:
+        r.update(name=info.get(r['id'], {}).get('name'), ip=info.get(r['id'], {}).get('ip'))
+    return jsonify({"results": rows, "thresholds": limits, "horizon_hours": horizon, **forecast.Forecaster.status()})
 
 
 @bp.route('/devices/add', methods=['POST'])
@@ -200,7 +380,7 @@ def devices_add():
         uplink_id = request.form.get('uplink_id')
         if uplink_id == "0": uplink_id = None
         if ip and name:
-            if not Device.query.filter_by(ip=ip).first():
+            if DeviceLookup.by_ip(ip) is None:
                 db.session.add(Device(ip=ip, name=name, device_type=dtype, uplink_device_id=uplink_id))
                 db.session.commit()
                 flash(f"Device {name} Added.", "success")
@@ -217,6 +397,105 @@ def device_delete(dev_id):
     return redirect(url_for('main.devices'))
 
 
+# --- UPLINK DISCOVERY ---
+@bp.route('/api/discovery', methods=['POST'])
+@login_required
+def api_discovery():
+    """LLDP/CDP walk of all devices as a job; job results are the proposed uplink diff."""
+    root = request.values.get('root', type=int) or (request.get_json(silent=True) or {}).get('root')
+    job, created = JobManager.submit('discovery', (root,),
+                                     discovery.make_discovery_job(current_app._get_current_object(), root))
+    return jsonify({"job": job.to_dict(), "created": created}), 202
+
+
+@bp.route('/api/discovery/apply', methods=['POST'])
+@login_required
+def api_discovery_apply():
+    """{"changes": [{"id": device_id, "uplink": uplink_id or null}, ...]} applied in one transaction."""
+    data = request.get_json(silent=True) or {}
+    try:
+        changes = {int(c['id']): (int(c['uplink']) if c.get('uplink') else None) for c in data.get('changes', [])}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "changes must be [{id, uplink}]"}), 400
+    return jsonify({"updated": discovery.apply_plan(changes)})
+
+
+# --- CONFIG BACKUPS ---
+@bp.route('/api/configs/backup', methods=['POST'])
+@login_required
+def api_config_backup():
+    """Pull running configs (all devices, or {"devices": [ids]}) as a background job."""
+    ids = (request.get_json(silent=True) or {}).get('devices') or None
+    try:
+        if ids is not None and not isinstance(ids, list): raise TypeError
+        ids = [int(i) for i in ids] if ids else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "devices must be a list of device ids"}), 400
+    key = tuple(sorted(ids)) if ids else (None,)
+    job, created = JobManager.submit('config_backup', key,
+                                     config_backup.make_config_backup_job(current_app._get_current_object(), ids))
+    return jsonify({"job": job.to_dict(), "created": created}), 202
+
+
+@bp.route('/api/devices/<int:dev_id>/configs')
+@login_required
+def api_device_configs(dev_id):
+    versions = ConfigVersion.query.filter_by(device_id=dev_id).order_by(ConfigVersion.id.desc()).limit(200).all()
+    return jsonify([v.to_dict() for v in versions])
+
+
+@bp.route('/api/configs/<int:ver_id>')
+@login_required
+def api_config_text(ver_id):
+    v = ConfigVersion.query.get_or_404(ver_id)
+    return config_backup.ConfigStore.get(v.sha), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@bp.route('/api/devices/<int:dev_id>/configs/diff')
+@login_required
+def api_config_diff(dev_id):
+    """?a=&b= version ids (default: the two most recent versions)."""
+    q = ConfigVersion.query.filter_by(device_id=dev_id)
+    if request.args.get('a') and request.args.get('b'):
+        a = q.filter_by(id=request.args.get('a', type=int)).first_or_404()
+        b = q.filter_by(id=request.args.get('b', type=int)).first_or_404()
+    else:
+        latest = q.order_by(ConfigVersion.id.desc()).limit(2).all()
+        if not latest: return "No config versions stored yet.\n", 404, {'Content-Type': 'text/plain'}
+        b, a = latest[0], latest[-1]
+    text = config_backup.diff(config_backup.ConfigStore.get(a.sha), config_backup.ConfigStore.get(b.sha),
+                              f"{a.ts:%Y-%m-%d %H:%M} ({a.sha[:10]})", f"{b.ts:%Y-%m-%d %H:%M} ({b.sha[:10]})")
+    return (text or "No differences.") + "\n", 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+# --- SERVICE CHECKS ---
+@bp.route('/api/devices/<int:dev_id>/checks', methods=['GET', 'POST'])
+@login_required
+def device_checks(dev_id):
+    d = Device.query.get(dev_id)
+    if not d: return jsonify({"error": "not found"}), 404
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        try:
+            check = ServiceCheck.parse_spec(data.get('spec'))
+            if data.get('timeout_ms'): check.timeout_ms = int(data.get('timeout_ms'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        check.device_id = d.id
+        db.session.add(check)
+        db.session.commit()
+        return jsonify(check.to_dict()), 201
+    return jsonify([c.to_dict() for c in d.checks])
+
+
+@bp.route('/api/checks/<int:check_id>', methods=['DELETE'])
+@login_required
+def check_delete(check_id):
+    c = ServiceCheck.query.get(check_id)
+    if c: db.session.delete(c); db.session.commit()
+    return jsonify({"success": True})
+
+
 @bp.route('/terminal')
 @login_required
 def terminal():
@@ -235,8 +514,103 @@ def terminal_exec():
 @login_required
 def settings():
     if current_user.role != 'ADMIN': return redirect(url_for('main.dashboard'))
-    if request.method == 'POST': flash("Config Saved.", "success")
-    return render_template('settings.html')
+    if request.method == 'POST':
+        section = request.form.get('section')
+        if section == 'collector':
+            name = (request.form.get('name') or '').strip()
+            if not name or Collector.query.filter_by(name=name).first():
+                flash("Collector name missing or already in use.", "warning")
+            elif not SecurityManager.can_seal():
+                flash("Collector not registered: set RTM_SECRET so its secret can be stored encrypted.", "danger")
+            else:
+                secret = secrets.token_urlsafe(32)
+                db.session.add(Collector(name=name, secret=SecurityManager.seal(secret),
+                                         subnets=request.form.get('subnets', '')))
+                db.session.commit()
+                flash(f"Collector '{name}' registered. Secret (shown once): {secret}", "success")
+        elif section == 'ping':
+            try:
+                Setting.set("ping_timeout_sec", max(1, int(request.form.get('ping_timeout', 30))))
+                Setting.set("ping_timeout_min_ms", max(10, int(request.form.get('ping_timeout_min_ms', 200))))
+                Setting.set("ping_retry_threshold", max(1, min(20, int(request.form.get('threshold', 1)))))
+                Setting.set("probe_train_count", max(1, min(20, int(request.form.get('probe_train_count', 1)))))
+                Setting.set("probe_train_spacing_ms", max(0, int(request.form.get('probe_train_spacing_ms', 20))))
+                Setting.set("degraded_loss_pct", max(0, float(request.form.get('degraded_loss_pct', 20))))
+                Setting.set("degraded_jitter_ms", max(0, float(request.form.get('degraded_jitter_ms', 0))))
+                Setting.set("anomaly_z", max(1, float(request.form.get('anomaly_z', 4))))
+                Setting.set("anomaly_min_ms", max(0, float(request.form.get('anomaly_min_ms', 20))))
+                Setting.set("anomaly_cycles", max(1, int(request.form.get('anomaly_cycles', 3))))
+                Setting.set("forecast_latency_ms", max(0, float(request.form.get('forecast_latency_ms', 150))))
+                Setting.set("forecast_loss_pct", max(0, float(request.form.get('forecast_loss_pct', 5))))
+                Setting.set("forecast_horizon_days", max(1, int(request.form.get('forecast_horizon_days', 14))))
+            except ValueError:
+                flash("Engine values must be numbers.", "warning")
+            Setting.set("adaptive_timeout", "1" if request.form.get('adaptive_timeout') else "0")
+            if request.form.get('snmp_community'): Setting.set("snmp_community", request.form.get('snmp_community').strip())
+            flash("Polling engine updated.", "success")
+        elif section == 'maintenance':
+            try:
+                Setting.set("retention_backups_days", max(0, int(request.form.get('retention_backups_days', 30))))
+                Setting.set("retention_backups_keep", max(1, int(request.form.get('retention_backups_keep', 5))))
+                Setting.set("maintenance_hour", max(0, min(23, int(request.form.get('maintenance_hour', 3)))))
+                history_days = max(0, int(request.form.get('retention_history_days', 400)))
+                Setting.set("retention_transitions_days", history_days)
+                Setting.set("retention_rollups_days", history_days)
+            except ValueError:
+                flash("Maintenance values must be numbers.", "warning")
+            if request.form.get('run_now'):
+                app = current_app._get_current_object()
+                threading.Thread(target=MaintenanceManager.run_once, args=(app, True), daemon=True).start()
+                flash("Maintenance started in the background.", "info")
+            else:
+                flash("Maintenance policy updated.", "success")
+        elif section == 'config_backup':
+            for key in ('ssh_username', 'ssh_device_type'):
+                Setting.set(key, (request.form.get(key) or '').strip())
+            if request.form.get('ssh_password'):  # Sealed with the app secret; RTM_SSH_PASSWORD overrides it
+                try:
+                    Setting.set("ssh_password", SecurityManager.seal(request.form.get('ssh_password')))
+                except ValueError as e:
+                    flash(f"SSH password not saved: {e}", "danger")
+            try:
+                Setting.set("config_backup_workers", max(1, min(128, int(request.form.get('config_backup_workers', 32)))))
+                Setting.set("config_backup_timeout_sec", max(5, int(request.form.get('config_backup_timeout_sec', 60))))
+            except ValueError:
+                flash("Backup values must be numbers.", "warning")
+            Setting.set("config_backup_nightly", "1" if request.form.get('config_backup_nightly') else "0")
+            flash("Config backup settings saved.", "success")
+        elif section == 'metrics_token':
+            if request.form.get('revoke'):
+                Setting.set("metrics_token", "")
+                flash("Metrics token revoked: /metrics now needs a login.", "info")
+            else:
+                token = secrets.token_urlsafe(32)
+                Setting.set("metrics_token", token)
+                flash(f"Metrics token (shown once): {token}", "success")
+        elif section == 'collector_delete':
+            c = Collector.query.get(request.form.get('collector_id'))
+            if c: db.session.delete(c); db.session.commit()
+            flash("Collector removed.", "info")
+        else:
+            flash("Config Saved.", "success")
+    engine = {k: Setting.get(k, d) for k, d in (("ping_timeout_sec", "30"), ("ping_timeout_min_ms", "200"),
+                                                 ("adaptive_timeout", "1"), ("ping_retry_threshold", "1"),
+                                                 ("probe_train_count", "1"),
+                                                 ("probe_train_spacing_ms", "20"), ("degraded_loss_pct", "20"),
+                                                 ("degraded_jitter_ms", "0"), ("anomaly_z", "4"),
+                                                 ("anomaly_min_ms", "20"), ("anomaly_cycles", "3"),
+                                                 ("forecast_latency_ms", "150"), ("forecast_loss_pct", "5"),
+                                                 ("forecast_horizon_days", "14"),
+                                                 ("snmp_community", "public"))}
+    maint = {k: Setting.get(k, d) for k, d in (("retention_backups_days", "30"), ("retention_backups_keep", "5"),
+                                                ("maintenance_hour", "3"), ("retention_rollups_days", "400"),
+                                                ("ssh_username", ""), ("ssh_device_type", "cisco_ios"),
+                                                ("config_backup_workers", "32"), ("config_backup_timeout_sec", "60"),
+                                                ("config_backup_nightly", "0"))}
+    return render_template('settings.html', collectors=Collector.query.all(), engine=engine,
+                           maint=maint, db_stats=MaintenanceManager.stats(),
+                           metrics_token=bool(Setting.get("metrics_token", "")),
+                           sealing=SecurityManager.can_seal(), report_month=datetime.utcnow().strftime('%Y-%m'))
 
 
 @bp.route('/backup/download')
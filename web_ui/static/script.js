@@ -1,15 +1,46 @@
 const socket = io();
 
-// Connection Status
+// Live views: the server only pushes what this page watches
+// ('all', 'system', 'log', 'alerts', 'anomalies', 'forecast', 'device:ID', 'subtree:ID', 'site:ID', 'group:TYPE', 'job:ID')
+const liveViews = new Set(['alerts']);
+function watch(...views) {
+    views.forEach(v => liveViews.add(v));
+    if (socket.connected) socket.emit('subscribe', { views: views });
+}
+function unwatch(...views) {
+    views.forEach(v => liveViews.delete(v));
+    if (socket.connected) socket.emit('unsubscribe', { views: views });
+}
+
+// Text from the API (device names, IPs) inserted into innerHTML templates
+function esc(value) {
+    return String(value ?? '').replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[c]);
+}
+
+// Connection Status (a reconnect is a new session: subscribe again)
 socket.on('connect', () => {
     console.log("Connected to J.A.R.V.I.S Server");
+    socket.emit('subscribe', { views: [...liveViews] });
+});
+
+// Batched pushes: dispatched to the normal per-event handlers, then acknowledged
+// (the server sends the next frame only after the ack, coalescing in between)
+socket.on('live', (batch, ack) => {
+    batch.forEach(([event, data]) => socket.listeners(event).forEach(fn => fn(data)));
+    if (ack) ack();
+});
+
+// Device tables watch only the rows they show
+document.addEventListener('DOMContentLoaded', () => {
+    const ids = [...document.querySelectorAll('[data-device-id]')].map(el => `device:${el.dataset.deviceId}`);
+    if (ids.length) watch(...ids);
 });
 
 // Live Device Updates
 socket.on('device_update', (data) => {
     // Look for the row
     const rowId = `row_${data.ip.replace(/\./g, '_')}`;
-    const row = document.getElementById(rowId);
+    const row = document.getElementById(rowId) || document.querySelector(`[data-device-id="${data.id}"]`);
 
     if (row) {
         // Update State Badge